@@ -0,0 +1 @@
+from .analytics_export import AnalyticsWriter, get_analytics_columns, get_player_summary, write_player_summary, get_summary_path, ANALYTICS_COLUMNS, PLAYER_SUMMARY_COLUMNS
\ No newline at end of file
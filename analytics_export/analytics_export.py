@@ -0,0 +1,195 @@
+import csv
+import os
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    # only needed for Parquet and Arrow files, CSV works without
+    pa = None
+    pq = None
+
+# one row per object per frame. the columns and their types are the same for every video, also
+# when a column has no values (NaN, or 0 for team), so files of different runs can be read together
+ANALYTICS_COLUMNS = (
+    ('frame', np.int32),
+    ('time', np.float64),
+    ('object', str),
+    ('track_id', np.int32),
+    ('team', np.int8),
+    ('has_ball', np.bool_),
+    ('bbox_x1', np.float32),
+    ('bbox_y1', np.float32),
+    ('bbox_x2', np.float32),
+    ('bbox_y2', np.float32),
+    ('position_x', np.float32),
+    ('position_y', np.float32),
+    ('position_adjusted_x', np.float32),
+    ('position_adjusted_y', np.float32),
+    ('position_transformed_x', np.float32),
+    ('position_transformed_y', np.float32),
+    ('speed', np.float32),
+    ('distance', np.float32),
+)
+
+# one row per player track. team is the one it had in most frames, speeds are km/h and
+# distances meters on the pitch
+PLAYER_SUMMARY_COLUMNS = (
+    ('track_id', np.int32),
+    ('team', np.int8),
+    ('frames', np.int32),
+    ('first_frame', np.int32),
+    ('last_frame', np.int32),
+    ('seconds', np.float64),
+    ('distance', np.float32),
+    ('max_speed', np.float32),
+    ('mean_speed', np.float32),
+    ('ball_frames', np.int32),
+)
+
+FORMATS = {'.csv': 'csv', '.parquet': 'parquet', '.arrow': 'arrow'}
+
+
+def get_format(path, format=None):
+    format = format or FORMATS.get(os.path.splitext(path)[1].lower())
+    if format not in FORMATS.values():
+        raise ValueError(f"Unknown analytics format for {path}, use one of {', '.join(FORMATS)}")
+    if format != 'csv' and pa is None:
+        raise ImportError(f"Writing {format} files needs pyarrow (pip install pyarrow), or write a .csv file")
+    return format
+
+
+def get_summary_path(path):
+    # the per-player table next to the per-frame one: analytics.parquet -> analytics_players.parquet
+    stem, extension = os.path.splitext(path)
+    return f"{stem}_players{extension}"
+
+
+def get_analytics_columns(track_store, start_frame, end_frame, frame_rate):
+    # the ANALYTICS_COLUMNS of frames [start_frame, end_frame) of every object class, frame by frame
+    parts = []
+    for object_name, rows in track_store.items():
+        offsets = track_store.frame_offsets(object_name)
+        rows = rows[offsets[start_frame]:offsets[min(end_frame, len(track_store))]]
+        parts.append((object_name, rows))
+
+    rows = np.concatenate([rows for _, rows in parts])
+    order = np.argsort(rows['frame'], kind='stable')
+    rows = rows[order]
+    objects = np.concatenate([np.full(len(object_rows), object_name, dtype=object) for object_name, object_rows in parts])[order]
+    columns = {
+        'frame': rows['frame'],
+        'time': rows['frame'] / frame_rate,
+        'object': objects,
+        'track_id': rows['track_id'],
+        'team': rows['team'],
+        'has_ball': rows['has_ball'],
+    }
+    for i, axis in enumerate(('x1', 'y1', 'x2', 'y2')):
+        columns[f'bbox_{axis}'] = rows['bbox'][:, i]
+    for column in ('position', 'position_adjusted', 'position_transformed'):
+        columns[f'{column}_x'] = rows[column][:, 0]
+        columns[f'{column}_y'] = rows[column][:, 1]
+    columns['speed'] = rows['speed']
+    columns['distance'] = rows['distance']
+    return {name: np.asarray(columns[name]).astype(dtype) for name, dtype in ANALYTICS_COLUMNS}
+
+
+def get_player_summary(track_store, frame_rate):
+    # the PLAYER_SUMMARY_COLUMNS of every player track
+    rows = track_store["players"]
+    track_ids, order, starts = track_store.track_index("players")
+    summary = {name: [] for name, _ in PLAYER_SUMMARY_COLUMNS}
+    for i, track_id in enumerate(track_ids):
+        track_rows = rows[order[starts[i]:starts[i + 1]]]
+        teams = track_rows['team'][track_rows['team'] != 0]
+        speeds = track_rows['speed'][~np.isnan(track_rows['speed'])]
+        distances = track_rows['distance'][~np.isnan(track_rows['distance'])]
+        summary['track_id'].append(track_id)
+        summary['team'].append(np.bincount(teams).argmax() if len(teams) else 0)
+        summary['frames'].append(len(track_rows))
+        summary['first_frame'].append(track_rows['frame'][0])
+        summary['last_frame'].append(track_rows['frame'][-1])
+        summary['seconds'].append(len(track_rows) / frame_rate)
+        # the distance is a running total
+        summary['distance'].append(distances.max() if len(distances) else np.nan)
+        summary['max_speed'].append(speeds.max() if len(speeds) else np.nan)
+        summary['mean_speed'].append(speeds.mean() if len(speeds) else np.nan)
+        summary['ball_frames'].append(np.count_nonzero(track_rows['has_ball']))
+    return {name: np.asarray(summary[name]).astype(dtype) for name, dtype in PLAYER_SUMMARY_COLUMNS}
+
+
+def get_arrow_schema(columns):
+    return pa.schema([(name, pa.string() if dtype is str else pa.from_numpy_dtype(np.dtype(dtype)))
+                      for name, dtype in columns])
+
+
+class AnalyticsWriter:
+    """Writes column batches to a CSV, Parquet or Arrow IPC file as they come, so the whole table
+    is never held in memory. Every write() becomes a row group (Parquet) or record batch (Arrow);
+    the format follows the file extension unless given. NaN is an empty CSV field and a null in
+    Parquet and Arrow.
+    """
+
+    def __init__(self, path, columns=ANALYTICS_COLUMNS, format=None):
+        self.path = path
+        self.columns = columns
+        self.format = get_format(path, format)
+        self.rows_written = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if self.format == 'csv':
+            self.file = open(path, 'w', newline='')
+            self.csv_writer = csv.writer(self.file)
+            self.csv_writer.writerow([name for name, _ in columns])
+        else:
+            self.schema = get_arrow_schema(columns)
+            if self.format == 'parquet':
+                self.writer = pq.ParquetWriter(path, self.schema)
+            else:
+                self.writer = pa.ipc.new_file(path, self.schema)
+
+    def write(self, columns):
+        number_of_rows = len(columns[self.columns[0][0]])
+        if number_of_rows == 0:
+            return
+        if self.format == 'csv':
+            values = []
+            for name, dtype in self.columns:
+                column = columns[name]
+                if np.issubdtype(np.dtype(dtype), np.floating):
+                    values.append(np.where(np.isnan(column), '', column.astype(str)))
+                elif dtype is np.bool_:
+                    values.append(column.astype(np.int8))
+                else:
+                    values.append(column)
+            self.csv_writer.writerows(zip(*(value.tolist() for value in values)))
+        else:
+            arrays = []
+            for name, dtype in self.columns:
+                column = columns[name]
+                mask = np.isnan(column) if np.issubdtype(np.dtype(dtype), np.floating) else None
+                arrays.append(pa.array(column, type=self.schema.field(name).type, mask=mask))
+            batch = pa.record_batch(arrays, schema=self.schema)
+            if self.format == 'parquet':
+                self.writer.write_batch(batch)
+            else:
+                self.writer.write(batch)
+        self.rows_written += number_of_rows
+
+    def close(self):
+        if self.format == 'csv':
+            self.file.close()
+        else:
+            self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_player_summary(path, track_store, frame_rate, format=None):
+    with AnalyticsWriter(path, PLAYER_SUMMARY_COLUMNS, format) as writer:
+        writer.write(get_player_summary(track_store, frame_rate))
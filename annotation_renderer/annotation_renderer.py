@@ -0,0 +1,148 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+
+
+class AnnotationRenderer:
+    """Draws everything Tracker.draw_annotations and SpeedAndDistance_Estimator.draw_speed_and_distance
+    draw, in one pass per frame, straight from a TrackStore.
+
+    Frames are drawn in place. OpenCV releases the GIL while drawing, so the frames of a chunk
+    are spread over a thread pool instead of being copied to worker processes. The pool is as
+    large as OpenCV's own thread count unless num_workers is given.
+    """
+
+    def __init__(self, team_colors=None, num_workers=None, possession_percentages=None, minimap=None):
+        # possession_percentages: (N, 2) team 1 and team 2 ball control per frame, drawn when given.
+        # minimap: a MinimapRenderer from pitch_analytics, drawn in the top left corner when given
+        self.team_colors = {team: tuple(float(c) for c in color) for team, color in (team_colors or {}).items()}
+        self.num_workers = num_workers or cv2.getNumThreads() or 1
+        self.possession_percentages = possession_percentages
+        self.minimap = minimap
+
+        self.player_color = (0,0,255)
+        self.referee_color = (0,255,255)
+        self.ball_color = (0,255,0)
+        self.ball_owner_color = (0,0,255)
+
+    def render_frames(self, frames, store, first_frame_num=0):
+        # build the frame indexes up front so the worker threads only read from the store
+        for object_name in store.keys():
+            store.frame_offsets(object_name)
+
+        frame_nums = range(first_frame_num, first_frame_num + len(frames))
+        if self.num_workers > 1 and len(frames) > 1:
+            with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+                list(executor.map(lambda args: self.draw_frame(*args, store), zip(frames, frame_nums)))
+        else:
+            for frame, frame_num in zip(frames, frame_nums):
+                self.draw_frame(frame, frame_num, store)
+        return frames
+
+    def draw_frame(self, frame, frame_num, store):
+        players = store.frame_rows('players', frame_num) if 'players' in store else None
+        referees = store.frame_rows('referees', frame_num) if 'referees' in store else None
+        ball = store.frame_rows('ball', frame_num) if 'ball' in store else None
+
+        if players is not None and len(players):
+            for row, (x_center, y2, width, y1) in zip(players, self.get_bbox_geometry(players['bbox'])):
+                color = self.team_colors.get(int(row['team']), self.player_color)
+                self.draw_ellipse(frame, x_center, y2, width, color, int(row['track_id']))
+                if row['has_ball']:
+                    self.draw_triangle(frame, x_center, y1, self.ball_owner_color)
+
+        if referees is not None and len(referees):
+            for x_center, y2, width, _ in self.get_bbox_geometry(referees['bbox']):
+                self.draw_ellipse(frame, x_center, y2, width, self.referee_color)
+
+        if ball is not None and len(ball):
+            for x_center, _, _, y1 in self.get_bbox_geometry(ball['bbox']):
+                self.draw_triangle(frame, x_center, y1, self.ball_color)
+
+        if players is not None and len(players):
+            self.draw_speed_and_distance(frame, players)
+
+        if self.possession_percentages is not None and frame_num < len(self.possession_percentages):
+            self.draw_team_ball_control(frame, self.possession_percentages[frame_num])
+
+        if self.minimap is not None:
+            self.minimap.draw(frame, players, referees, ball)
+
+        return frame
+
+    def get_bbox_geometry(self, bboxes):
+        # (x_center, y2, width, y1) per bbox, truncated like the int() calls in Tracker except
+        # for the width, which the ellipse axes truncate themselves
+        bboxes = bboxes.astype(np.float64)
+        x_center = np.trunc((bboxes[:,0] + bboxes[:,2]) / 2).astype(np.int64).tolist()
+        y2 = np.trunc(bboxes[:,3]).astype(np.int64).tolist()
+        width = (bboxes[:,2] - bboxes[:,0]).tolist()
+        y1 = np.trunc(bboxes[:,1]).astype(np.int64).tolist()
+        return zip(x_center, y2, width, y1)
+
+    def draw_ellipse(self, frame, x_center, y2, width, color, track_id=None):
+        cv2.ellipse(
+            frame,
+            center=(x_center,y2),
+            axes=(int(width), int(0.35*width)),
+            angle=0.0,
+            startAngle=-45,
+            endAngle=235,
+            color = color,
+            thickness=2,
+            lineType=cv2.LINE_4
+        )
+
+        if track_id is None:
+            return
+
+        rectangle_width = 40
+        rectangle_height=20
+        x1_rect = x_center - rectangle_width//2
+        x2_rect = x_center + rectangle_width//2
+        y1_rect = (y2- rectangle_height//2) +15
+        y2_rect = (y2+ rectangle_height//2) +15
+
+        cv2.rectangle(frame, (x1_rect, y1_rect), (x2_rect, y2_rect), color, cv2.FILLED)
+
+        x1_text = x1_rect+12
+        if track_id > 99:
+            x1_text -=10
+
+        cv2.putText(frame, f"{track_id}", (x1_text, y1_rect+15), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0,0,0), 2)
+
+    def draw_triangle(self, frame, x, y, color):
+        triangle_points = np.array([
+            [x, y],
+            [x-10, y-20],
+            [x+10, y-20],
+        ])
+
+        cv2.drawContours(frame, [triangle_points], 0, color, cv2.FILLED)
+        cv2.drawContours(frame, [triangle_points], 0, (0,0,0), 2)
+
+    def draw_speed_and_distance(self, frame, players):
+        has_speed = ~np.isnan(players['speed']) & ~np.isnan(players['distance'])
+        if not np.any(has_speed):
+            return
+        players = players[has_speed]
+        bboxes = players['bbox'].astype(np.float64)
+        positions = np.trunc(np.stack([(bboxes[:,0] + bboxes[:,2]) / 2, bboxes[:,3] + 40], axis=1)).astype(np.int64).tolist()
+        for (x, y), speed, distance in zip(positions, players['speed'].tolist(), players['distance'].tolist()):
+            cv2.putText(frame, f"{speed: .2f} km/h", (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0,0,0), 2)
+            cv2.putText(frame, f"{distance: .2f} hr", (x, y+20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0,0,0), 2)
+
+    def draw_team_ball_control(self, frame, percentages):
+        # translucent box in the bottom right corner, laid out for 1920x1080 and scaled
+        frame_height, frame_width = frame.shape[:2]
+        x1, x2 = round(frame_width * 1350 / 1920), round(frame_width * 1900 / 1920)
+        y1, y2 = round(frame_height * 850 / 1080), round(frame_height * 970 / 1080)
+        box = frame[y1:y2, x1:x2]
+        frame[y1:y2, x1:x2] = cv2.addWeighted(box, 0.6, np.full_like(box, 255), 0.4, 0)
+
+        scale = frame_height / 1080
+        text_x = x1 + round(50 * scale)
+        cv2.putText(frame, f"Team 1 Ball Control: {percentages[0]:.2f}%", (text_x, y1 + round(50 * scale)),
+                    cv2.FONT_HERSHEY_SIMPLEX, scale, (0,0,0), max(1, round(3 * scale)))
+        cv2.putText(frame, f"Team 2 Ball Control: {percentages[1]:.2f}%", (text_x, y1 + round(100 * scale)),
+                    cv2.FONT_HERSHEY_SIMPLEX, scale, (0,0,0), max(1, round(3 * scale)))
@@ -0,0 +1,281 @@
+"""Process a directory or glob of match videos with a pool of worker processes.
+
+    python batch.py Input_Videos --output-dir Output_Videos --workers 4
+    python batch.py "footage/**/*.mp4" --workers 2 --threads 8 --backend openvino --keyframe-interval 4
+    python batch.py Input_Videos --analytics parquet --no-video
+
+Each worker process loads the model once and then processes videos one after another with its
+share of the CPU threads (--threads, by default the cores divided by the workers). Every finished
+or failed video is appended to a job ledger, batch_ledger.jsonl in the output directory, so
+running the same command again after an interruption skips the videos whose output is done and
+retries the others, continuing their tracking from its last checkpoint in the cache directory.
+A video that changed since its run is processed again.
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+
+# read by the numerical libraries when they are imported, so set before the worker imports main
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+# detector options of this worker process, set by init_worker
+worker_detector_options = None
+
+
+def find_videos(inputs):
+    # video files in the given directories and matching the given glob patterns, each once
+    videos = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            paths = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+        else:
+            paths = glob.glob(pattern, recursive=True)
+        videos += [path for path in paths if os.path.isfile(path) and path.lower().endswith(VIDEO_EXTENSIONS)]
+    return sorted(set(os.path.abspath(path) for path in videos))
+
+
+def get_output_paths(videos, output_dir):
+    # {name}_output.avi like the GUI writes; videos of the same name from different directories
+    # get their directory name in front
+    names = [os.path.splitext(os.path.basename(video))[0] for video in videos]
+    duplicates = {name for name in names if names.count(name) > 1}
+    output_paths = {}
+    for video, name in zip(videos, names):
+        if name in duplicates:
+            name = f"{os.path.basename(os.path.dirname(video))}_{name}"
+        output_paths[video] = os.path.join(output_dir, f"{name}_output.avi")
+    return output_paths
+
+
+def get_video_signature(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class JobLedger:
+    """Append-only JSON lines file with a record per finished or failed job. The last record of
+    a video counts. Records are flushed to disk as they are written, so a batch that is killed
+    loses at most the jobs that were running.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.jobs = {}
+        ends_with_newline = True
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    ends_with_newline = line.endswith('\n')
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # the line a crash cut short
+                        continue
+                    self.jobs[record['input']] = record
+        self.file = open(path, 'a')
+        if not ends_with_newline:
+            self.file.write('\n')
+
+    def record(self, input_path, status, **fields):
+        record = dict(input=input_path, status=status, time=time.time(), **fields)
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.jobs[input_path] = record
+        return record
+
+    def is_done(self, input_path, output_path):
+        record = self.jobs.get(input_path)
+        return (record is not None and record['status'] == 'done' and record.get('output') == output_path
+                and os.path.exists(output_path) and record.get('video') == get_video_signature(input_path))
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def init_worker(threads, workers, detector_options):
+    global worker_detector_options
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    import main
+    from trackers import get_auto_batch_size, set_thread_budget
+    from trackers.detection_backend import get_available_memory
+    set_thread_budget(threads)
+    detector_options = dict(detector_options)
+    if detector_options.get('batch_size') is None:
+        # a batch for this worker's threads and its share of the memory
+        available_memory = get_available_memory()
+        detector_options['batch_size'] = get_auto_batch_size(
+            detector_options.get('imgsz', 640), threads, available_memory // workers if available_memory else None)
+    worker_detector_options = detector_options
+    # load the model now; the trackers of the videos reuse it
+    main.Tracker(main.resource_path("models/best.pt"), **detector_options)
+
+
+def get_output_stem(output_path):
+    # the {name} of {name}_output.avi or {name}_analytics.{format}
+    stem = os.path.splitext(output_path)[0]
+    for suffix in ('_output', '_analytics'):
+        if stem.endswith(suffix):
+            return stem[:-len(suffix)]
+    return stem
+
+
+def get_analytics_path(output_path, analytics_format):
+    # {name}_analytics.{format} next to {name}_output.avi
+    return f"{get_output_stem(output_path)}_analytics.{analytics_format}"
+
+
+def run_job(input_path, output_path, process_options, trace_path=None, analytics_path=None, heatmap_path=None):
+    import main
+    from progress_events import JsonlTraceWriter
+
+    hooks = [JsonlTraceWriter(trace_path)] if trace_path is not None else []
+    start = time.perf_counter()
+    last_event = None
+    try:
+        for event in main.process_video(input_path, output_path, detector_options=worker_detector_options,
+                                        use_legacy_stubs=False, hooks=hooks, analytics_path=analytics_path,
+                                        heatmap_path=heatmap_path, **process_options):
+            last_event = event
+    finally:
+        for hook in hooks:
+            hook.close()
+    # process_video stops early without raising when tracking fails
+    last_stage = "rendering" if output_path is not None else "analytics_export"
+    if last_event is None or last_event.kind != "stage_end" or last_event.stage != last_stage:
+        raise RuntimeError(f"Processing stopped after: {last_event}")
+    return {'frames': last_event.frames_done, 'seconds': time.perf_counter() - start, 'worker': os.getpid()}
+
+
+def prepare_detector(detector_options):
+    # export the model for the onnx and openvino backends once, before the workers would race to
+    import main
+    from trackers import DetectionBackend
+    DetectionBackend(main.resource_path("models/best.pt"), backend=detector_options['backend'],
+                     imgsz=detector_options['imgsz'], int8=detector_options['int8'], batch_size=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='+', help='video files, directories or glob patterns (quoted, ** recurses)')
+    parser.add_argument('--output-dir', default='Output_Videos')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes, by default one per 4 cores')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='CPU threads per worker, by default the cores divided by the workers')
+    parser.add_argument('--ledger', default=None, help='job ledger, by default batch_ledger.jsonl in the output directory')
+    parser.add_argument('--force', action='store_true', help='process the videos the ledger has as done, too')
+    parser.add_argument('--traces', action='store_true',
+                        help='write the progress events of every video next to its output')
+    parser.add_argument('--in-memory', action='store_true',
+                        help='decode each video into memory instead of streaming it in windows')
+    parser.add_argument('--analytics', default=None, choices=['csv', 'parquet', 'arrow'],
+                        help='also write the per-frame analytics and a per-player summary in this format')
+    parser.add_argument('--heatmaps', action='store_true',
+                        help='also write the pitch heatmaps of the players and teams, {name}_heatmaps.npz and .png')
+    parser.add_argument('--minimap', action='store_true', help='draw a top-down minimap into the videos')
+    parser.add_argument('--no-video', action='store_true', help='write the analytics only, no annotated video')
+    parser.add_argument('--shared-frames', action='store_true',
+                        help='decode each video once into shared memory for tracking and a camera movement process')
+    parser.add_argument('--fast-camera-movement', action='store_true',
+                        help='estimate the camera movement on downscaled feature columns, see CameraMovementEstimator')
+    parser.add_argument('--window-size', type=int, default=64)
+    parser.add_argument('--codec', default='XVID')
+    parser.add_argument('--writer-backend', default='opencv', choices=['opencv', 'ffmpeg'])
+    parser.add_argument('--cache-dir', default='cache')
+    parser.add_argument('--checkpoint-interval', type=int, default=1024,
+                        help='frames between checkpoints of the tracking of a video, 0 turns them off')
+    parser.add_argument('--backend', default='pytorch', choices=['pytorch', 'onnx', 'openvino'])
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--int8', action='store_true')
+    parser.add_argument('--batch-size', type=int, default=None)
+    parser.add_argument('--keyframe-interval', type=int, default=1)
+    parser.add_argument('--ball-search-window', type=int, default=None)
+    args = parser.parse_args()
+    if args.no_video and args.analytics is None:
+        parser.error("--no-video needs --analytics")
+
+    videos = find_videos(args.inputs)
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_paths = get_output_paths(videos, os.path.abspath(args.output_dir))
+    analytics_paths = {video: get_analytics_path(output_path, args.analytics) if args.analytics else None
+                       for video, output_path in output_paths.items()}
+    if args.no_video:
+        # the ledger checks the analytics file instead of the video
+        output_paths = analytics_paths
+    cpu_count = os.cpu_count() or 1
+    workers = args.workers or max(1, cpu_count // 4)
+    threads = args.threads or max(1, cpu_count // workers)
+    detector_options = dict(backend=args.backend, imgsz=args.imgsz, int8=args.int8, batch_size=args.batch_size,
+                            keyframe_interval=args.keyframe_interval, ball_search_window=args.ball_search_window)
+    process_options = dict(streaming=not args.in_memory, window_size=args.window_size, codec=args.codec,
+                           writer_backend=args.writer_backend, cache_dir=os.path.abspath(args.cache_dir),
+                           checkpoint_interval=args.checkpoint_interval, minimap=args.minimap,
+                           shared_frames=args.shared_frames, camera_movement_fast_mode=args.fast_camera_movement)
+
+    with JobLedger(args.ledger or os.path.join(args.output_dir, 'batch_ledger.jsonl')) as ledger:
+        jobs = [video for video in videos if args.force or not ledger.is_done(video, output_paths[video])]
+        print(f"{len(videos)} videos, {len(videos) - len(jobs)} done already, {len(jobs)} to process "
+              f"with {workers} workers of {threads} threads")
+        if not jobs:
+            return
+        if args.backend != 'pytorch':
+            prepare_detector(detector_options)
+
+        start = time.perf_counter()
+        failed = 0
+        frames = 0
+        # spawned workers start without the parent's imports, so the thread settings apply to
+        # the libraries they load
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=init_worker, initargs=(threads, workers, detector_options)) as executor:
+            futures = {}
+            for video in jobs:
+                trace_path = os.path.splitext(output_paths[video])[0] + '_trace.jsonl' if args.traces else None
+                video_path = None if args.no_video else output_paths[video]
+                heatmap_path = get_output_stem(output_paths[video]) + '_heatmaps.npz' if args.heatmaps else None
+                futures[executor.submit(run_job, video, video_path, process_options, trace_path,
+                                        analytics_paths[video], heatmap_path)] = video
+            try:
+                for job_num, future in enumerate(as_completed(futures), 1):
+                    video = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # a crashed worker fails every job that was still queued too; they are
+                        # retried on the next run
+                        failed += 1
+                        ledger.record(video, 'failed', output=output_paths[video], error=f"{type(e).__name__}: {e}")
+                        print(f"[{job_num}/{len(jobs)}] failed {video}: {e}")
+                        continue
+                    frames += result['frames'] or 0
+                    ledger.record(video, 'done', output=output_paths[video], video=get_video_signature(video), **result)
+                    print(f"[{job_num}/{len(jobs)}] done {video} -> {output_paths[video]} "
+                          f"({result['frames']} frames in {result['seconds']:.0f} s)")
+            except KeyboardInterrupt:
+                print("Interrupted, waiting for the running videos to stop...")
+                for future in futures:
+                    future.cancel()
+                raise
+
+        seconds = time.perf_counter() - start
+        print(f"{len(jobs) - failed} videos done, {failed} failed, {frames} frames in {seconds:.0f} s "
+              f"({frames / seconds:.1f} fps)")
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
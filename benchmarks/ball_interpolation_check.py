@@ -0,0 +1,72 @@
+"""Checks that BallInterpolator, fed in windows, gives the same rows as interpolate_ball_bboxes
+on all frames at once.
+
+    python benchmarks/ball_interpolation_check.py --stub stubs/track_stubs_2.pkl --trials 300
+
+Random ball paths with missing frames and teleporting false detections are cut into windows of
+random sizes, and so is the ball of a track stub when given. Exits with status 1 on a mismatch.
+"""
+import argparse
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils import read_stub
+from trackers.ball_interpolation import get_ball_bbox_array, interpolate_ball_bboxes, BallInterpolator
+
+
+def make_random_ball_bboxes(rng, max_frames=200):
+    number_of_frames = rng.integers(1, max_frames)
+    centers = np.cumsum(rng.normal(0, 20, (number_of_frames, 2)), axis=0) + 500
+    bboxes = np.concatenate([centers - 5, centers + 5], axis=1)
+    bboxes[rng.random(number_of_frames) < rng.random()] = np.nan
+    # false detections far away from the ball
+    bboxes[rng.random(number_of_frames) < 0.05] += 1000
+    return bboxes
+
+
+def interpolate_in_windows(bboxes, rng, max_gap, max_speed, max_window=30):
+    ball_interpolator = BallInterpolator(max_gap, max_speed)
+    rows = []
+    start = 0
+    while start < len(bboxes):
+        end = start + rng.integers(1, max_window)
+        rows.append(ball_interpolator.update(bboxes[start:end]))
+        start = end
+    rows.append(ball_interpolator.finish())
+    return np.concatenate(rows)
+
+
+def check(bboxes, rng, max_gap, max_speed):
+    expected = interpolate_ball_bboxes(bboxes, max_gap, max_speed)
+    rows = interpolate_in_windows(bboxes, rng, max_gap, max_speed)
+    return rows.shape == expected.shape and np.allclose(rows, expected, equal_nan=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stub', default=None, help='track stub whose ball is checked too')
+    parser.add_argument('--trials', type=int, default=300)
+    parser.add_argument('--max-gap', type=int, default=48)
+    parser.add_argument('--max-speed', type=float, default=150)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    cases = [(f"random {trial}", make_random_ball_bboxes(rng)) for trial in range(args.trials)]
+    if args.stub is not None:
+        tracks = read_stub(args.stub)
+        if tracks is None:
+            parser.error(f"stub not found: {args.stub}")
+        cases += [(f"{args.stub} {trial}", get_ball_bbox_array(tracks["ball"])) for trial in range(10)]
+
+    failures = [name for name, bboxes in cases if not check(bboxes, rng, args.max_gap, args.max_speed)]
+    for name in failures[:10]:
+        print(f"mismatch: {name}")
+    print(f"{len(cases) - len(failures)} of {len(cases)} cases equal")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Accuracy versus throughput of the detection backends, measured against a track stub.
+
+    python benchmarks/detection_report.py Input_Videos/2.mp4 stubs/track_stubs_2.pkl \
+        --backends pytorch onnx openvino --imgsz 640 480 --int8 --frames 120 --json report.json
+
+The stub holds the tracks of the default pytorch model, so it is the reference: a detection
+matches a stub box of the same object class at IoU >= --iou. Stub players and referees are
+ByteTrack output and miss detections that never became a track, so even the pytorch backend
+scores a precision slightly below 1.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils import read_video, read_stub, get_iou_matrix
+from trackers import DetectionBackend
+
+OBJECT_CLASSES = {"player": "players", "goalkeeper": "players", "referee": "referees", "ball": "ball"}
+
+
+def get_detected_bboxes(detection):
+    # detections of one frame grouped like the tracks, as (N, 4) arrays
+    bboxes = detection.boxes.xyxy.cpu().numpy()
+    class_ids = detection.boxes.cls.cpu().numpy().astype(int)
+    detected_bboxes = {}
+    for object_name in set(OBJECT_CLASSES.values()):
+        class_names = [name for name, object_class in OBJECT_CLASSES.items() if object_class == object_name]
+        mask = np.isin([detection.names[class_id] for class_id in class_ids], class_names)
+        detected_bboxes[object_name] = bboxes[mask].reshape(-1, 4)
+    return detected_bboxes
+
+
+def match_bboxes(detected_bboxes, reference_bboxes, iou_threshold):
+    # greedy one-to-one matching by decreasing IoU; returns the IoU of every match
+    iou = get_iou_matrix(detected_bboxes, reference_bboxes)
+    matches = []
+    while iou.size and iou.max() >= iou_threshold:
+        i, j = np.unravel_index(np.argmax(iou), iou.shape)
+        matches.append(iou[i, j])
+        iou[i, :] = 0
+        iou[:, j] = 0
+    return matches
+
+
+def evaluate(detections, tracks, iou_threshold):
+    counts = {object_name: dict(detected=0, reference=0, matched=0, iou=0.0) for object_name in tracks}
+    for frame_num, detection in enumerate(detections):
+        detected_bboxes = get_detected_bboxes(detection)
+        for object_name, object_counts in counts.items():
+            reference_bboxes = np.array([track['bbox'] for track in tracks[object_name][frame_num].values()]).reshape(-1, 4)
+            matches = match_bboxes(detected_bboxes[object_name], reference_bboxes, iou_threshold)
+            object_counts['detected'] += len(detected_bboxes[object_name])
+            object_counts['reference'] += len(reference_bboxes)
+            object_counts['matched'] += len(matches)
+            object_counts['iou'] += sum(matches)
+
+    scores = {}
+    for object_name, object_counts in counts.items():
+        precision = object_counts['matched'] / object_counts['detected'] if object_counts['detected'] else 0.0
+        recall = object_counts['matched'] / object_counts['reference'] if object_counts['reference'] else 0.0
+        scores[object_name] = {
+            'precision': precision,
+            'recall': recall,
+            'f1': 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+            'mean_iou': object_counts['iou'] / object_counts['matched'] if object_counts['matched'] else 0.0,
+        }
+    return scores
+
+
+def run_backend(model_path, frames, backend, imgsz, int8, batch_size):
+    start = time.perf_counter()
+    detector = DetectionBackend(model_path, backend=backend, imgsz=imgsz, int8=int8, batch_size=batch_size)
+    load_seconds = time.perf_counter() - start
+
+    # one warm-up batch so lazy initialisation of the runtime isn't counted as throughput
+    detector.predict(frames[:detector.batch_size])
+    start = time.perf_counter()
+    detections = detector.predict(frames)
+    seconds = time.perf_counter() - start
+    return detector, detections, load_seconds, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video_path')
+    parser.add_argument('stub_path')
+    parser.add_argument('--model', default='models/best.pt')
+    parser.add_argument('--backends', nargs='+', default=['pytorch', 'onnx', 'openvino'])
+    parser.add_argument('--imgsz', nargs='+', type=int, default=[640])
+    parser.add_argument('--int8', action='store_true', help='also run INT8 variants of the onnx and openvino backends')
+    parser.add_argument('--batch-size', type=int, default=None, help='default: tuned to the cores and free memory')
+    parser.add_argument('--frames', type=int, default=120)
+    parser.add_argument('--iou', type=float, default=0.5)
+    parser.add_argument('--json', dest='json_path', default=None)
+    args = parser.parse_args()
+
+    tracks = read_stub(args.stub_path)
+    if tracks is None:
+        parser.error(f"stub not found: {args.stub_path}")
+    frames = read_video(args.video_path)[:args.frames]
+    if len(frames) > len(tracks['players']):
+        parser.error("the stub has fewer frames than the video, is it the stub of this video?")
+
+    configurations = [(backend, imgsz, False) for backend in args.backends for imgsz in args.imgsz]
+    if args.int8:
+        configurations += [(backend, imgsz, True) for backend in args.backends if backend != 'pytorch' for imgsz in args.imgsz]
+
+    report = []
+    for backend, imgsz, int8 in configurations:
+        detector, detections, load_seconds, seconds = run_backend(args.model, frames, backend, imgsz, int8, args.batch_size)
+        report.append({
+            'backend': backend,
+            'imgsz': imgsz,
+            'int8': int8,
+            'batch_size': detector.batch_size,
+            'load_seconds': load_seconds,
+            'fps': len(frames) / seconds,
+            'scores': evaluate(detections, tracks, args.iou),
+        })
+
+    print(f"{'backend':<10}{'imgsz':>6}{'int8':>6}{'batch':>6}{'fps':>8}  " +
+          "  ".join(f"{object_name + ' P/R':>16}" for object_name in tracks))
+    for row in report:
+        scores = "  ".join(f"{row['scores'][object_name]['precision']:>8.3f}/{row['scores'][object_name]['recall']:<7.3f}"
+                           for object_name in tracks)
+        print(f"{row['backend']:<10}{row['imgsz']:>6}{str(row['int8']):>6}{row['batch_size']:>6}{row['fps']:>8.2f}  {scores}")
+
+    if args.json_path is not None:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Detection cost and drift of keyframe tracking, measured against a full-detection track stub.
+
+    python benchmarks/keyframe_report.py Input_Videos/2.mp4 stubs/track_stubs_2.pkl \
+        --intervals 2 4 8 --scene-change 6 --frames 240
+
+For every setting the video is tracked with Tracker(keyframe_interval=..., scene_change_threshold=...)
+and each frame is matched against the stub by IoU, separately for the keyframes and for the
+interpolated frames in between. Track ids are not compared since they are assigned independently.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils import read_video, read_stub, get_iou_matrix
+from trackers import Tracker
+
+
+def match_frame(tracks, reference_tracks, iou_threshold):
+    bboxes = np.array([track['bbox'] for track in tracks.values()]).reshape(-1, 4)
+    reference_bboxes = np.array([track['bbox'] for track in reference_tracks.values()]).reshape(-1, 4)
+    iou = get_iou_matrix(bboxes, reference_bboxes)
+    matched_iou = []
+    center_errors = []
+    while iou.size and iou.max() >= iou_threshold:
+        i, j = np.unravel_index(np.argmax(iou), iou.shape)
+        matched_iou.append(iou[i, j])
+        center = (bboxes[i, :2] + bboxes[i, 2:]) / 2
+        reference_center = (reference_bboxes[j, :2] + reference_bboxes[j, 2:]) / 2
+        center_errors.append(np.linalg.norm(center - reference_center))
+        iou[i, :] = 0
+        iou[:, j] = 0
+    return len(bboxes), len(reference_bboxes), matched_iou, center_errors
+
+
+def measure_drift(tracks, reference_tracks, keyframes, iou_threshold=0.5):
+    # precision, recall, mean IoU and mean center error (pixels) per object class, for the
+    # keyframes and for the interpolated frames
+    drift = {}
+    for object_name in tracks:
+        for frame_type in ('keyframes', 'interpolated'):
+            counts = dict(found=0, reference=0, iou=[], center_error=[])
+            for frame_num in range(len(tracks[object_name])):
+                if (frame_num in keyframes) != (frame_type == 'keyframes'):
+                    continue
+                found, reference, matched_iou, center_errors = match_frame(
+                    tracks[object_name][frame_num], reference_tracks[object_name][frame_num], iou_threshold)
+                counts['found'] += found
+                counts['reference'] += reference
+                counts['iou'] += matched_iou
+                counts['center_error'] += center_errors
+            matched = len(counts['iou'])
+            drift.setdefault(object_name, {})[frame_type] = {
+                'precision': matched / counts['found'] if counts['found'] else 0.0,
+                'recall': matched / counts['reference'] if counts['reference'] else 0.0,
+                'mean_iou': float(np.mean(counts['iou'])) if matched else 0.0,
+                'mean_center_error': float(np.mean(counts['center_error'])) if matched else 0.0,
+            }
+    return drift
+
+
+def run_tracker(model_path, frames, keyframe_interval, scene_change_threshold, detector_options):
+    tracker = Tracker(model_path, keyframe_interval=keyframe_interval,
+                      scene_change_threshold=scene_change_threshold, **detector_options)
+    start = time.perf_counter()
+    tracks = tracker.get_object_tracks(frames)
+    seconds = time.perf_counter() - start
+    # with keyframe_interval 1 every frame is detected
+    keyframes = set(tracker.keyframe_nums) if tracker.keyframe_nums else set(range(len(frames)))
+    return tracker, tracks, keyframes, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video_path')
+    parser.add_argument('stub_path')
+    parser.add_argument('--model', default='models/best.pt')
+    parser.add_argument('--backend', default='pytorch')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--intervals', nargs='+', type=int, default=[1, 2, 4, 8])
+    parser.add_argument('--scene-change', type=float, default=None,
+                        help='also detect when the mean thumbnail difference to the last keyframe exceeds this')
+    parser.add_argument('--frames', type=int, default=240)
+    parser.add_argument('--iou', type=float, default=0.5)
+    parser.add_argument('--json', dest='json_path', default=None)
+    args = parser.parse_args()
+
+    reference_tracks = read_stub(args.stub_path)
+    if reference_tracks is None:
+        parser.error(f"stub not found: {args.stub_path}")
+    frames = read_video(args.video_path)[:args.frames]
+    detector_options = dict(backend=args.backend, imgsz=args.imgsz)
+
+    report = []
+    for keyframe_interval in args.intervals:
+        tracker, tracks, keyframes, seconds = run_tracker(args.model, frames, keyframe_interval,
+                                                          args.scene_change, detector_options)
+        report.append({
+            'keyframe_interval': keyframe_interval,
+            'scene_change_threshold': args.scene_change,
+            'detected_frames': tracker.detected_frame_count,
+            'frames': tracker.frame_count,
+            'fps': len(frames) / seconds,
+            'drift': measure_drift(tracks, reference_tracks, keyframes, args.iou),
+        })
+
+    print(f"{'interval':>8}{'detected':>10}{'fps':>8}  {'interpolated players R / IoU / px':>34}  {'ball R / px':>12}")
+    for row in report:
+        players = row['drift']['players']['interpolated']
+        ball = row['drift']['ball']['interpolated']
+        print(f"{row['keyframe_interval']:>8}{row['detected_frames']:>5}/{row['frames']:<4}{row['fps']:>8.2f}  "
+              f"{players['recall']:>14.3f} / {players['mean_iou']:.3f} / {players['mean_center_error']:>5.1f}  "
+              f"{ball['recall']:>5.3f} / {ball['mean_center_error']:>4.1f}")
+
+    if args.json_path is not None:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Serve a video as an MJPEG stream over HTTP at its frame rate, a stand-in for an IP camera.
+
+    python benchmarks/live_stream_server.py Input_Videos/2.mp4 --port 8080 --loop
+    python live.py http://localhost:8080/ --output live_output.avi
+
+Every client gets the stream from the first frame. Run it as its own process: OpenCV blocks
+while it opens the stream, so a server thread in the same process would not get to answer.
+"""
+import argparse
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cv2
+
+BOUNDARY = 'frame'
+
+
+def make_handler(video_path, loop=False, quality=90):
+    class StreamHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', f'multipart/x-mixed-replace; boundary={BOUNDARY}')
+            self.end_headers()
+            cap = cv2.VideoCapture(video_path)
+            fps = cap.get(cv2.CAP_PROP_FPS) or 24
+            start_time = time.perf_counter()
+            frame_num = 0
+            try:
+                while True:
+                    ret, frame = cap.read()
+                    if not ret:
+                        if not loop or frame_num == 0:
+                            break
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        continue
+                    delay = start_time + frame_num / fps - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+                    self.wfile.write(f'--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n'
+                                     f'Content-Length: {len(jpeg)}\r\n\r\n'.encode() + jpeg + b'\r\n')
+                    frame_num += 1
+            except (BrokenPipeError, ConnectionResetError):
+                # the client stopped reading
+                pass
+            finally:
+                cap.release()
+
+        def log_message(self, format, *args):
+            pass
+
+    return StreamHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--loop', action='store_true', help='start over at the end of the video')
+    parser.add_argument('--quality', type=int, default=90, help='JPEG quality')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.video, args.loop, args.quality))
+    print(f"Streaming {args.video} on http://{args.host}:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
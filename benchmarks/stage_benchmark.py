@@ -0,0 +1,253 @@
+"""Time and memory of every process_video stage, on the checked-in stubs and on synthetic video.
+
+    python benchmarks/stage_benchmark.py --stubs 2 4 --synthetic 600x1280x720 3000x1920x1080 \
+        --output results.json --compare previous_results.json
+
+The detector is not run: each dataset starts from its tracks (a stub or generated ones), and a
+synthetic video drawn from the same tracks is decoded for the stages that need frames. Every
+stage is timed in one pass, and its tracemalloc peak and RSS growth are measured in a second
+pass, so the tracing overhead doesn't end up in the timings. Results go to a JSON file;
+--compare prints the time ratio against an earlier results file.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils import read_frame, iter_video_windows, get_video_properties, VideoWriter
+from trackers import Tracker
+from team_assigner import TeamAssigner
+from camera_movement_estimator import CameraMovementEstimator
+from view_transformer import ViewTransformer
+from speed_and_distance_estimator import SpeedAndDistance_Estimator
+from player_ball_assigner import PlayerBallAssigner
+from track_store import TrackStore
+from annotation_renderer import AnnotationRenderer
+from progress_events import get_rss
+from synthetic_video import make_synthetic_tracks, write_synthetic_video, load_stub_dataset
+
+
+class StageRecorder:
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        rss_before = get_rss() or 0
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - start
+        record = self.stages.setdefault(name, {'seconds': 0.0})
+        record['seconds'] += seconds
+        if self.trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            record['peak_traced_bytes'] = max(record.get('peak_traced_bytes', 0), peak)
+            record['rss_growth_bytes'] = record.get('rss_growth_bytes', 0) + (get_rss() or 0) - rss_before
+
+
+def run_stages(video_path, tracks, camera_movement, recorder, window_size=64, estimate_camera_movement=True):
+    # the process_video stages after detection, on the track store
+    video_properties = get_video_properties(video_path)
+    tracker = Tracker(None)
+
+    with recorder.stage('track_store'):
+        track_store = TrackStore.from_tracks(tracks)
+
+    with recorder.stage('ball_interpolation'):
+        tracker.interpolate_ball_positions_in_store(track_store)
+
+    with recorder.stage('position_extraction'):
+        tracker.add_position_to_store(track_store)
+
+    first_frame = read_frame(video_path)
+    camera_movement_estimator = CameraMovementEstimator(first_frame)
+    if estimate_camera_movement:
+        # camera movement estimation decodes the video itself, so decoding is part of this stage
+        with recorder.stage('camera_movement_estimation'):
+            camera_movement_per_frame = []
+            for frame_window in iter_video_windows(video_path, window_size):
+                camera_movement_estimator.update_camera_movement(frame_window, camera_movement_per_frame)
+        camera_movement = camera_movement_per_frame[:len(track_store)]
+
+    with recorder.stage('camera_adjustment'):
+        camera_movement_estimator.add_adjust_positions_to_store(track_store, camera_movement)
+
+    with recorder.stage('view_transform'):
+        ViewTransformer().add_transformed_position_to_store(track_store)
+
+    with recorder.stage('speed_and_distance'):
+        SpeedAndDistance_Estimator(video_properties['fps'] or 24).add_speed_and_distance_to_store(track_store)
+
+    with recorder.stage('team_assignment'):
+        team_assigner = TeamAssigner()
+        team_assigner.add_team_to_store(track_store, video_path=video_path)
+
+    with recorder.stage('ball_possession'):
+        player_ball_assigner = PlayerBallAssigner()
+        assigned_players = player_ball_assigner.assign_ball_to_players_in_store(track_store)
+        possession_percentages = player_ball_assigner.get_possession_percentages(
+            player_ball_assigner.get_team_ball_control(track_store, assigned_players))
+
+    annotation_renderer = AnnotationRenderer(team_assigner.team_colors, possession_percentages=possession_percentages)
+    output_path = os.path.join(tempfile.mkdtemp(prefix='stage_benchmark_'), 'output.avi')
+    video_writer = VideoWriter.from_video(output_path, video_path)
+    frame_windows = iter_video_windows(video_path, window_size)
+    frame_num = 0
+    while True:
+        with recorder.stage('decoding'):
+            frame_window = next(frame_windows, None)
+        if not frame_window:
+            break
+        frame_window = frame_window[:len(track_store) - frame_num]
+        with recorder.stage('rendering'):
+            annotation_renderer.render_frames(frame_window, track_store, frame_num)
+        # writes block once the writer's queue is full, so this includes the encoding the
+        # background thread couldn't hide
+        with recorder.stage('encoding'):
+            for frame in frame_window:
+                video_writer.write(frame)
+        frame_num += len(frame_window)
+    with recorder.stage('encoding'):
+        video_writer.close()
+    os.remove(output_path)
+    os.rmdir(os.path.dirname(output_path))
+
+    return {
+        'encoder_fps': video_writer.get_stats()['encode_fps'],
+        'track_store_bytes': track_store.nbytes(),
+    }
+
+
+def benchmark_dataset(name, video_path, tracks, camera_movement, measure_memory=True, estimate_camera_movement=True):
+    video_properties = get_video_properties(video_path)
+    number_of_frames = len(tracks['players'])
+
+    timing = StageRecorder()
+    extra = run_stages(video_path, tracks, camera_movement, timing, estimate_camera_movement=estimate_camera_movement)
+    stages = timing.stages
+    for record in stages.values():
+        record['fps'] = number_of_frames / record['seconds'] if record['seconds'] else None
+
+    if measure_memory:
+        memory = StageRecorder(trace_memory=True)
+        run_stages(video_path, tracks, camera_movement, memory, estimate_camera_movement=estimate_camera_movement)
+        for stage_name, record in memory.stages.items():
+            stages[stage_name]['peak_traced_bytes'] = record['peak_traced_bytes']
+            stages[stage_name]['rss_growth_bytes'] = record['rss_growth_bytes']
+
+    return {
+        'name': name,
+        'frames': number_of_frames,
+        'width': video_properties['width'],
+        'height': video_properties['height'],
+        'detections': sum(len(frame) for object_tracks in tracks.values() for frame in object_tracks),
+        'total_seconds': sum(record['seconds'] for record in stages.values()),
+        'stages': stages,
+        **extra,
+    }
+
+
+def get_environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def parse_synthetic(value):
+    # FRAMES[xWIDTHxHEIGHT], e.g. 600 or 600x1280x720
+    parts = [int(part) for part in value.lower().split('x')]
+    if len(parts) == 1:
+        return parts[0], 1920, 1080
+    if len(parts) != 3:
+        raise argparse.ArgumentTypeError(f"expected FRAMES or FRAMESxWIDTHxHEIGHT, got {value}")
+    return tuple(parts)
+
+
+def print_results(results, baseline=None):
+    baseline_stages = {}
+    for dataset in (baseline or {}).get('datasets', []):
+        baseline_stages[dataset['name']] = dataset['stages']
+
+    for dataset in results['datasets']:
+        print(f"\n{dataset['name']}: {dataset['frames']} frames at {dataset['width']}x{dataset['height']}, "
+              f"{dataset['total_seconds']:.2f} s")
+        print(f"{'stage':<28}{'seconds':>9}{'fps':>10}{'peak MB':>9}{'RSS MB':>8}" + (f"{'vs base':>9}" if baseline else ""))
+        for stage_name, record in dataset['stages'].items():
+            line = f"{stage_name:<28}{record['seconds']:>9.3f}{record['fps'] or 0:>10.1f}"
+            line += f"{record.get('peak_traced_bytes', 0) / 2**20:>9.1f}{record.get('rss_growth_bytes', 0) / 2**20:>8.1f}"
+            base_record = baseline_stages.get(dataset['name'], {}).get(stage_name)
+            if base_record and base_record['seconds']:
+                line += f"{record['seconds'] / base_record['seconds']:>8.2f}x"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stubs', nargs='*', default=['2'], help='names of stubs/track_stubs_<NAME>.pkl to run on')
+    parser.add_argument('--synthetic', nargs='*', type=parse_synthetic, default=[(600, 1280, 720)],
+                        metavar='FRAMES[xWIDTHxHEIGHT]')
+    parser.add_argument('--video-dir', default=None, help='where the synthetic videos are kept between runs')
+    parser.add_argument('--no-memory', action='store_true', help='skip the memory pass')
+    parser.add_argument('--no-camera-estimation', action='store_true',
+                        help="use the dataset's camera movement instead of estimating it")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', default=None, help='earlier results file to compare the timings with')
+    args = parser.parse_args()
+
+    video_dir = args.video_dir or os.path.join(tempfile.gettempdir(), 'football_analysis_benchmarks')
+    os.makedirs(video_dir, exist_ok=True)
+
+    datasets = []
+    for stub_name in args.stubs:
+        tracks, camera_movement = load_stub_dataset(stub_name, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'stubs'))
+        datasets.append((f"stub_{stub_name}", tracks, camera_movement, (1920, 1080)))
+    for number_of_frames, width, height in args.synthetic:
+        tracks, camera_movement = make_synthetic_tracks(number_of_frames, (width, height))
+        datasets.append((f"synthetic_{number_of_frames}x{width}x{height}", tracks, camera_movement, (width, height)))
+
+    results = {'environment': get_environment(), 'datasets': []}
+    for name, tracks, camera_movement, frame_size in datasets:
+        video_path = os.path.join(video_dir, f"{name}.mp4")
+        if not os.path.exists(video_path):
+            print(f"Generating {video_path}...")
+            write_synthetic_video(video_path, tracks, camera_movement, frame_size)
+        print(f"Benchmarking {name}...")
+        results['datasets'].append(benchmark_dataset(name, video_path, tracks, camera_movement,
+                                                     measure_memory=not args.no_memory,
+                                                     estimate_camera_movement=not args.no_camera_estimation))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+
+if __name__ == '__main__':
+    main()
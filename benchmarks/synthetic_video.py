@@ -0,0 +1,162 @@
+"""Synthetic match footage for the benchmarks, since match video can't be shipped with the repo.
+
+The video is a textured pitch with advertising boards that pans with the camera movement, with the players drawn as
+two-coloured boxes (team shirt over dark shorts), referees in yellow and a white ball, at the
+bboxes of a tracks dict. The tracks come from a stub or from make_synthetic_tracks.
+
+    python benchmarks/synthetic_video.py out.mp4 --frames 600 --width 1280 --height 720
+    python benchmarks/synthetic_video.py out.mp4 --stub 2
+"""
+import argparse
+import os
+import sys
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils import read_stub
+
+TEAM_SHIRT_COLORS = [(40, 40, 200), (230, 230, 230)]
+SHORTS_COLOR = (30, 30, 30)
+REFEREE_COLOR = (0, 220, 240)
+BALL_COLOR = (255, 255, 255)
+
+
+def make_synthetic_tracks(number_of_frames, frame_size=(1920, 1080), number_of_players=22,
+                          number_of_referees=2, seed=0):
+    # players and referees walk smoothly around the pitch and the ball moves from player to
+    # player, while the camera pans back and forth. returns tracks in the stub layout (bboxes in
+    # frame coordinates, so they move with the camera too) and the camera movement per frame
+    rng = np.random.default_rng(seed)
+    frame_width, frame_height = frame_size
+    scale = frame_height / 1080
+    bbox_size = np.array([32, 80]) * scale
+
+    frame_nums = np.arange(number_of_frames)
+    camera_movement = np.stack([10 * np.sin(frame_nums / 12), 3 * np.cos(frame_nums / 17)], axis=1) * scale
+    camera_positions = np.cumsum(camera_movement, axis=0)
+
+    number_of_people = number_of_players + number_of_referees
+    positions = rng.uniform([0.05, 0.25], [0.95, 0.95], (number_of_people, 2)) * frame_size
+    velocities = np.zeros((number_of_people, 2))
+    lower_bound = np.array([bbox_size[0], frame_height * 0.2])
+    upper_bound = np.array([frame_width - bbox_size[0], frame_height - 5])
+
+    ball_owner = 0
+    ball_position = positions[ball_owner].copy()
+    tracks = {"players": [], "referees": [], "ball": []}
+    for frame_num in range(number_of_frames):
+        velocities = 0.9 * velocities + rng.normal(0, 0.6 * scale, (number_of_people, 2))
+        # positions on the pitch, kept where the camera sees them
+        camera_position = camera_positions[frame_num]
+        positions = np.clip(positions + velocities, lower_bound + camera_position, upper_bound + camera_position)
+        frame_positions = positions - camera_position
+
+        # bboxes stand on their foot position
+        bboxes = np.concatenate([frame_positions - [bbox_size[0] / 2, bbox_size[1]], frame_positions + [bbox_size[0] / 2, 0]], axis=1)
+        tracks["players"].append({track_id + 1: {"bbox": bboxes[track_id].tolist()} for track_id in range(number_of_players)})
+        tracks["referees"].append({number_of_players + i + 1: {"bbox": bboxes[number_of_players + i].tolist()}
+                                   for i in range(number_of_referees)})
+
+        if frame_num % 48 == 0:
+            ball_owner = rng.integers(number_of_players)
+        ball_position += (frame_positions[ball_owner] - ball_position) * 0.2
+        ball_radius = 6 * scale
+        ball_bbox = [ball_position[0] - ball_radius, ball_position[1] - 2 * ball_radius,
+                     ball_position[0] + ball_radius, ball_position[1]]
+        # the detector misses the ball now and then
+        tracks["ball"].append({1: {"bbox": ball_bbox}} if rng.random() > 0.2 else {})
+
+    return tracks, camera_movement.tolist()
+
+
+def make_pitch_texture(size, seed=0):
+    # green noise with mowing stripes and white lines, so optical flow has corners to follow
+    rng = np.random.default_rng(seed)
+    width, height = size
+    texture = np.empty((height, width, 3), dtype=np.uint8)
+    texture[:] = (40, 130, 50)
+    stripes = (np.arange(width) // 120) % 2 == 0
+    texture[:, stripes] = (50, 150, 60)
+    noise = rng.integers(-12, 13, (height, width, 1), dtype=np.int16)
+    texture = np.clip(texture.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+    for x in range(0, width, 400):
+        cv2.line(texture, (x, 0), (x, height), (235, 235, 235), 3)
+    for y in range(0, height, 300):
+        cv2.line(texture, (0, y), (width, y), (235, 235, 235), 3)
+    for x in range(200, width, 400):
+        for y in range(150, height, 300):
+            cv2.circle(texture, (x, y), 60, (235, 235, 235), 2)
+    # advertising boards along the top edge, where the players never are
+    board_height = int(height * 0.12)
+    x = 0
+    while x < width:
+        board_width = int(rng.integers(60, 240))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv2.rectangle(texture, (x, 0), (x + board_width, board_height), color, cv2.FILLED)
+        cv2.putText(texture, "AD", (x + 10, board_height - 10), cv2.FONT_HERSHEY_SIMPLEX, 1.2,
+                    (255 - color[0], 255 - color[1], 255 - color[2]), 3)
+        x += board_width
+    return texture
+
+
+def write_synthetic_video(video_path, tracks, camera_movement, frame_size=(1920, 1080), fps=24, seed=0):
+    frame_width, frame_height = frame_size
+    camera_positions = np.cumsum(np.asarray(camera_movement, dtype=np.float64).reshape(-1, 2), axis=0)
+    margin = int(np.ceil(np.abs(camera_positions).max())) + 1 if len(camera_positions) else 1
+    texture = make_pitch_texture((frame_width + 2 * margin, frame_height + 2 * margin), seed)
+
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, frame_size)
+    for frame_num in range(len(tracks["players"])):
+        # the camera moving by +dx makes the pitch move by -dx in the frame
+        x, y = (margin + camera_positions[frame_num]).astype(int) if frame_num < len(camera_positions) else (margin, margin)
+        frame = texture[y:y + frame_height, x:x + frame_width].copy()
+
+        for track_id, player in tracks["players"][frame_num].items():
+            x1, y1, x2, y2 = (int(v) for v in player["bbox"])
+            middle = (y1 + y2) // 2
+            cv2.rectangle(frame, (x1, y1), (x2, middle), TEAM_SHIRT_COLORS[int(track_id) % 2], cv2.FILLED)
+            cv2.rectangle(frame, (x1, middle), (x2, y2), SHORTS_COLOR, cv2.FILLED)
+        for referee in tracks["referees"][frame_num].values():
+            x1, y1, x2, y2 = (int(v) for v in referee["bbox"])
+            cv2.rectangle(frame, (x1, y1), (x2, y2), REFEREE_COLOR, cv2.FILLED)
+        for ball in tracks["ball"][frame_num].values():
+            x1, y1, x2, y2 = ball["bbox"]
+            cv2.circle(frame, (int((x1 + x2) / 2), int((y1 + y2) / 2)), max(2, int((x2 - x1) / 2)), BALL_COLOR, cv2.FILLED)
+
+        writer.write(frame)
+    writer.release()
+    return video_path
+
+
+def load_stub_dataset(stub_name, stubs_dir='stubs'):
+    # tracks and camera movement of a checked-in stub; the stubs are for 1920x1080 video
+    tracks = read_stub(os.path.join(stubs_dir, f'track_stubs_{stub_name}.pkl'))
+    camera_movement = read_stub(os.path.join(stubs_dir, f'camera_movement_stub_{stub_name}.pkl'))
+    if tracks is None or camera_movement is None:
+        raise FileNotFoundError(f"No track and camera movement stubs for {stub_name} in {stubs_dir}")
+    return tracks, camera_movement
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video_path')
+    parser.add_argument('--stub', default=None, help='draw the tracks of stubs/track_stubs_<STUB>.pkl')
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--fps', type=float, default=24)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.stub is not None:
+        tracks, camera_movement = load_stub_dataset(args.stub)
+        frame_size = (1920, 1080)
+    else:
+        frame_size = (args.width, args.height)
+        tracks, camera_movement = make_synthetic_tracks(args.frames, frame_size, seed=args.seed)
+    write_synthetic_video(args.video_path, tracks, camera_movement, frame_size, args.fps, args.seed)
+
+
+if __name__ == '__main__':
+    main()
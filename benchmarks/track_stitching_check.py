@@ -0,0 +1,86 @@
+"""Round trip of the track id stitching of Tracker.get_track_store_parallel on a track stub.
+
+    python benchmarks/track_stitching_check.py stubs/track_stubs_2.pkl --chunk-sizes 50 100 200
+
+The stub's tracks are cut into chunks that start chunk_overlap frames early, like the worker
+processes track them, and the ids of every chunk are replaced by a random permutation, as a
+fresh ByteTrack would number them. stitch_track_chunks has to give back the stub's rows with
+every stub track under exactly one stitched id and the other way round. Exits with status 1
+otherwise.
+"""
+import argparse
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils import read_stub
+from track_store import TrackStore
+from trackers.track_stitching import stitch_track_chunks, TRACKED_OBJECTS
+
+
+def make_chunks(store, chunk_size, chunk_overlap, rng):
+    # (warm_up_start, chunk_start, rows) of every chunk, with the ids permuted per chunk
+    chunks = []
+    for chunk_start in range(0, len(store), chunk_size):
+        warm_up_start = max(0, chunk_start - chunk_overlap)
+        chunk_end = chunk_start + chunk_size
+        id_permutation = rng.permutation(10000) + 1
+        rows = {}
+        for object_name, object_rows in store.items():
+            object_rows = object_rows[(object_rows['frame'] >= warm_up_start) & (object_rows['frame'] < chunk_end)].copy()
+            if object_name in TRACKED_OBJECTS:
+                object_rows['track_id'] = id_permutation[object_rows['track_id']]
+            rows[object_name] = object_rows
+        chunks.append((warm_up_start, chunk_start, rows))
+    return chunks
+
+
+def compare(store, stitched):
+    # problems found, an empty list when the stitched store matches the stub
+    problems = []
+    if len(stitched) != len(store):
+        problems.append(f"{len(stitched)} frames instead of {len(store)}")
+    for object_name, rows in store.items():
+        stitched_rows = stitched[object_name]
+        if len(stitched_rows) != len(rows) or not np.array_equal(stitched_rows['frame'], rows['frame']) \
+                or not np.array_equal(stitched_rows['bbox'], rows['bbox']):
+            problems.append(f"{object_name}: rows differ")
+            continue
+        pairs = set(zip(rows['track_id'].tolist(), stitched_rows['track_id'].tolist()))
+        stub_ids, stitched_ids = len(np.unique(rows['track_id'])), len(np.unique(stitched_rows['track_id']))
+        if not len(pairs) == stub_ids == stitched_ids:
+            problems.append(f"{object_name}: {stub_ids} stub ids, {stitched_ids} stitched ids, {len(pairs)} pairs")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('stub_path')
+    parser.add_argument('--chunk-sizes', nargs='+', type=int, default=[50, 100, 200])
+    parser.add_argument('--chunk-overlap', type=int, default=48)
+    parser.add_argument('--min-score', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    tracks = read_stub(args.stub_path)
+    if tracks is None:
+        parser.error(f"stub not found: {args.stub_path}")
+    if min(args.chunk_sizes) < args.chunk_overlap:
+        # the ids are matched in the previous chunk's own frames, get_track_store_parallel's chunks are larger
+        parser.error("chunk sizes below the chunk overlap aren't stitched, see Tracker.minimum_chunk_size")
+    store = TrackStore.from_tracks(tracks)
+    rng = np.random.default_rng(args.seed)
+
+    failed = False
+    for chunk_size in args.chunk_sizes:
+        chunks = make_chunks(store, chunk_size, args.chunk_overlap, rng)
+        stitched = stitch_track_chunks(chunks, len(store), args.min_score)
+        problems = compare(store, stitched)
+        print(f"chunk size {chunk_size}, {len(chunks)} chunks: {'; '.join(problems) or 'ok'}")
+        failed |= bool(problems)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1 @@
-from .camera_movement_estimator import CameraMovementEstimator
\ No newline at end of file
+from .camera_movement_estimator import CameraMovementEstimator, attach_frame_ring, estimate_camera_movement_from_ring
\ No newline at end of file
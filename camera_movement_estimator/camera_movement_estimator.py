@@ -1,6 +1,7 @@
 import sys
 import os
 import pickle
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import cv2
 import numpy as np
 
@@ -15,11 +16,77 @@ def resource_path(relative_path):
 # Correct way to import from parent directory using resource_path
 utils_path = resource_path("..")
 sys.path.insert(0, utils_path)
-from utils import measure_distance, measure_xy_distance
+from utils import get_video_properties
+
+
+def estimate_camera_movement_chunk(camera_movement_estimator, video_path, warm_up_start, chunk_start, chunk_end):
+    # runs in a worker process: decode [warm_up_start, chunk_end) and return the movement of [chunk_start, chunk_end).
+    # the warm-up frames only rebuild the reference frame; the result is identical to the serial run once some
+    # warm-up frame after the first one replaced the reference, which is reported as `established`
+    cap = cv2.VideoCapture(video_path)
+    if warm_up_start > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, warm_up_start)
+
+    camara_movement = []
+    established = warm_up_start == 0
+    frame_num = warm_up_start
+    while chunk_end is None or frame_num < chunk_end:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        camera_movement_estimator.update_camera_movement([frame], camara_movement)
+        if frame_num == warm_up_start:
+            first_gray = camera_movement_estimator.old_gray
+        elif frame_num < chunk_start and camera_movement_estimator.old_gray is not first_gray:
+            established = True
+        frame_num += 1
+    cap.release()
+
+    skip = chunk_start - warm_up_start
+    return camara_movement[skip:], camera_movement_estimator.flow_confidence[skip:], established
+
+
+# the SharedFrameRing of this worker process and its count of frames done, set by attach_frame_ring
+worker_frame_ring = None
+worker_frames_done = None
+
+
+def attach_frame_ring(frame_ring, frames_done):
+    global worker_frame_ring, worker_frames_done
+    worker_frame_ring = frame_ring
+    worker_frames_done = frames_done
+
+
+def estimate_camera_movement_from_ring(camera_movement_estimator, camara_movement, start_frame, first_frame,
+                                       checkpoint=None, checkpoint_interval=None):
+    # runs in a worker process: append the movement of the frames the worker's ring gets from
+    # start_frame on to camara_movement, which has the frames before first_frame already; those
+    # are only released. returns camara_movement and the estimator's flow confidence
+    frame_ring = worker_frame_ring
+    frames_checkpointed = len(camara_movement)
+    frame_num = start_frame
+    try:
+        while True:
+            frame = frame_ring.get(frame_num)
+            if frame is None:
+                break
+            if frame_num >= first_frame:
+                camera_movement_estimator.update_camera_movement([frame], camara_movement)
+            del frame
+            frame_ring.release(frame_num)
+            frame_num += 1
+            worker_frames_done.value = frame_num
+            if checkpoint is not None and checkpoint_interval and len(camara_movement) - frames_checkpointed >= checkpoint_interval:
+                frames_checkpointed = camera_movement_estimator.save_checkpoint(checkpoint, camara_movement, frames_checkpointed)
+    except BaseException:
+        # the decoder and the other readers would wait for this one forever
+        frame_ring.abort()
+        raise
+    return camara_movement, camera_movement_estimator.flow_confidence
 
 
 class CameraMovementEstimator:
-    def __init__(self, frame):
+    def __init__(self, frame, fast_mode=False):
         self.minimum_distance = 5
 
         self.lk_params = dict(
@@ -28,10 +95,16 @@ class CameraMovementEstimator:
             criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03)
         ) 
 
-        first_frame_grayscale = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        mask_features = np.zeros_like(first_frame_grayscale)
-        mask_features[:,0:20] = 1
-        mask_features[:,900:1050] = 1
+        # feature columns at the left edge and in the middle of the frame, given for 1920 pixel wide
+        # video and scaled to the actual width
+        frame_height, frame_width = frame.shape[:2]
+        self.mask_columns = [
+            (0, max(1, round(frame_width * 20 / 1920))),
+            (round(frame_width * 900 / 1920), round(frame_width * 1050 / 1920)),
+        ]
+        mask_features = np.zeros((frame_height, frame_width), dtype=np.uint8)
+        for start, end in self.mask_columns:
+            mask_features[:,start:end] = 1
 
         self.features = dict(
             maxCorners = 100,
@@ -41,6 +114,32 @@ class CameraMovementEstimator:
             mask = mask_features
         )
 
+        # fast mode: flow on a downscaled grayscale image of the feature columns only, with
+        # features detected once and tracked forward until too few of them survive
+        self.fast_mode = fast_mode
+        self.fast_mode_scale = 0.5
+        self.minimum_tracked_features = 10
+        self.fast_mode_features = dict(self.features)
+
+        # parallel mode: frames decoded before each chunk to rebuild the reference frame
+        self.chunk_overlap = 8
+        self.minimum_chunk_size = 100
+
+        self.old_gray = None
+        self.old_features = None
+        self.flow_confidence = []
+
+    def get_cache_params(self):
+        # everything besides the video that changes the estimated movement
+        features = {key: value for key, value in self.features.items() if key != 'mask'}
+        params = dict(minimum_distance=self.minimum_distance, lk_params=self.lk_params, features=features,
+                      mask_columns=self.mask_columns, fast_mode=self.fast_mode)
+        if self.fast_mode:
+            fast_mode_features = {key: value for key, value in self.fast_mode_features.items() if key != 'mask'}
+            params.update(fast_mode_scale=self.fast_mode_scale, minimum_tracked_features=self.minimum_tracked_features,
+                          fast_mode_features=fast_mode_features)
+        return params
+
     def add_adjust_positions_to_tracks(self, tracks, camera_movement_per_frame):
         for object, object_tracks in tracks.items():
             for frame_num, track in enumerate(object_tracks):
@@ -50,6 +149,11 @@ class CameraMovementEstimator:
                     position_adjusted = (position[0] - camera_movement[0], position[1] - camera_movement[1])
                     tracks[object][frame_num][track_id]['position_adjusted'] = position_adjusted
 
+    def add_adjust_positions_to_store(self, store, camera_movement_per_frame):
+        camera_movement_per_frame = np.asarray(camera_movement_per_frame, dtype=np.float64).reshape(-1, 2)
+        for object, rows in store.items():
+            rows['position_adjusted'] = rows['position'] - camera_movement_per_frame[rows['frame']]
+
  
     def get_camera_movement(self, frames, read_from_stub = False, stub_path = None):
         # read the stub
@@ -60,39 +164,71 @@ class CameraMovementEstimator:
                     return pickle.load(f)
 
 
-        camara_movement = [[0,0]]*len(frames)
+        self.old_gray = None
+        self.old_features = None
+        self.flow_confidence = []
+        camara_movement = []
+        self.update_camera_movement(frames, camara_movement)
 
-        old_gray = cv2.cvtColor(frames[0], cv2.COLOR_BGR2GRAY)
-        old_features = cv2.goodFeaturesToTrack(old_gray,**self.features)
+        if stub_path is not None:
+            stub_path = resource_path(stub_path) #Use resource path here
+            with open(stub_path, 'wb') as f:
+                pickle.dump(camara_movement,f)
 
-        for frame_num in range(1,len(frames)):
-            frame_gray = cv2.cvtColor(frames[frame_num], cv2.COLOR_BGR2GRAY)
-            
-            old_features = cv2.goodFeaturesToTrack(frame_gray, **self.features)
-            if old_features is None:
-                print('No features found in frame', frame_num)
-                continue  # Skip this iteration of the loop
-
-            print(old_features.dtype, old_features.shape)
-            new_features,_,_ = cv2.calcOpticalFlowPyrLK(old_gray, frame_gray, old_features, None, **self.lk_params)
-            print(old_gray.shape, frame_gray.shape)
-            max_distance = 0
-            camara_movement_x, camara_movement_y = 0, 0
-            for i , (new,old) in enumerate(zip(new_features,old_features)):
-                new_features_point = new.ravel()
-                old_features_point = old.ravel()
-
-                distance = measure_distance(new_features_point, old_features_point)
-
-                if distance > max_distance:
-                    max_distance = distance
-                    camara_movement_x, camara_movement_y = measure_xy_distance(old_features_point, new_features_point)
-
-            if max_distance > self.minimum_distance:
-                camara_movement[frame_num] = [camara_movement_x, camara_movement_y]
-            
-            old_features = cv2.goodFeaturesToTrack(frame_gray, **self.features)
-            old_gray = frame_gray
+        return camara_movement
+    
+    
+    def get_camera_movement_parallel(self, video_path, num_workers=None, chunk_size=None, read_from_stub = False, stub_path = None):
+        # same result as get_camera_movement on the decoded video, with chunks of frames estimated in worker
+        # processes that decode the video themselves. in fast mode every chunk starts tracking afresh, so only
+        # the default mode is guaranteed to match the serial run exactly
+        if read_from_stub and stub_path is not None:
+            stub_path = resource_path(stub_path) #Use resource path here
+            if os.path.exists(stub_path):
+                with open(stub_path, 'rb') as f:
+                    return pickle.load(f)
+
+        self.old_gray = None
+        self.old_features = None
+        self.flow_confidence = []
+
+        number_of_frames = get_video_properties(video_path)['frame_count']
+        num_workers = num_workers or os.cpu_count() or 1
+        if chunk_size is None:
+            chunk_size = max(self.minimum_chunk_size, -(-number_of_frames // (num_workers * 4)))
+        chunk_starts = list(range(0, number_of_frames, chunk_size))
+        if not chunk_starts:
+            chunk_starts = [0]
+
+        chunk_results = {}
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            def submit(chunk_index, overlap):
+                chunk_start = chunk_starts[chunk_index]
+                # the last chunk reads to the end, in case the container's frame count is off
+                chunk_end = chunk_starts[chunk_index + 1] if chunk_index + 1 < len(chunk_starts) else None
+                future = executor.submit(estimate_camera_movement_chunk, self, video_path,
+                                         max(0, chunk_start - overlap), chunk_start, chunk_end)
+                pending[future] = (chunk_index, overlap)
+
+            pending = {}
+            for chunk_index in range(len(chunk_starts)):
+                submit(chunk_index, self.chunk_overlap)
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    chunk_index, overlap = pending.pop(future)
+                    camara_movement, flow_confidence, established = future.result()
+                    if not established:
+                        # no warm-up frame had features, look further back for the reference frame
+                        submit(chunk_index, max(1, overlap * 2))
+                        continue
+                    chunk_results[chunk_index] = (camara_movement, flow_confidence)
+
+        camara_movement = []
+        for chunk_index in range(len(chunk_starts)):
+            camara_movement += chunk_results[chunk_index][0]
+            self.flow_confidence += chunk_results[chunk_index][1]
 
         if stub_path is not None:
             stub_path = resource_path(stub_path) #Use resource path here
@@ -100,7 +236,156 @@ class CameraMovementEstimator:
                 pickle.dump(camara_movement,f)
 
         return camara_movement
-    
+
+    def update_camera_movement(self, frames, camara_movement):
+        # estimate the movement of a window of frames, appending it after the frames already in camara_movement
+        # and the per-frame flow confidence (share of features tracked successfully) to self.flow_confidence.
+        # only the previous grayscale frame (and in fast mode its features) is carried over between windows
+        for frame in frames:
+            if self.fast_mode:
+                movement, confidence = self.measure_frame_movement_fast(frame)
+            else:
+                movement, confidence = self.measure_frame_movement(frame)
+            camara_movement.append(movement)
+            self.flow_confidence.append(confidence)
+
+        return camara_movement
+
+    def save_checkpoint(self, checkpoint, camara_movement, frames_checkpointed):
+        # append the movement of the frames from frames_checkpointed on and the reference frame
+        # to the checkpoint; returns the frames checkpointed now
+        arrays = dict(camera_movement=np.asarray(camara_movement[frames_checkpointed:], dtype=np.float64).reshape(-1, 2),
+                      flow_confidence=np.asarray(self.flow_confidence[frames_checkpointed:], dtype=np.float64))
+        checkpoint.append(len(camara_movement), arrays, dict(old_gray=self.old_gray, old_features=self.old_features))
+        return len(camara_movement)
+
+    def resume_from_checkpoint(self, checkpoint):
+        # the movement of the frames in the checkpoint, with the reference frame restored so
+        # update_camera_movement continues with the next frame; an empty list without a checkpoint
+        loaded = checkpoint.load()
+        if loaded is None:
+            return []
+        _, arrays, state = loaded
+        self.old_gray = state['old_gray']
+        self.old_features = state['old_features']
+        self.flow_confidence = arrays['flow_confidence'].tolist()
+        return arrays['camera_movement'].tolist()
+
+    def measure_frame_movement(self, frame):
+        frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.old_gray is None:
+            self.old_gray = frame_gray
+            return [0,0], 1.0
+
+        old_features = cv2.goodFeaturesToTrack(frame_gray, **self.features)
+        if old_features is None:
+            # keep the last frame that had features as the reference
+            return [0,0], 0.0
+
+        new_features, status, _ = cv2.calcOpticalFlowPyrLK(self.old_gray, frame_gray, old_features, None, **self.lk_params)
+        movement = self.get_max_displacement(old_features, new_features)
+        self.old_gray = frame_gray
+
+        return movement, float(np.mean(status))
+
+    def measure_frame_movement_fast(self, frame):
+        frame_gray = self.get_feature_columns_gray(frame)
+        if self.old_gray is None:
+            self.old_gray = frame_gray
+            self.old_features = self.detect_fast_mode_features(frame_gray)
+            return [0,0], 1.0
+
+        redetected = False
+        if self.old_features is None or len(self.old_features) < self.minimum_tracked_features:
+            self.old_features = self.detect_fast_mode_features(self.old_gray)
+            redetected = True
+        if self.old_features is None:
+            self.old_gray = frame_gray
+            return [0,0], 0.0
+
+        new_features, tracked = self.track_fast_mode_features(frame_gray)
+        if np.count_nonzero(tracked) < self.minimum_tracked_features and not redetected:
+            # most of the tracked features left the columns during this frame, start over
+            self.old_features = self.detect_fast_mode_features(self.old_gray)
+            if self.old_features is None:
+                self.old_gray = frame_gray
+                return [0,0], 0.0
+            new_features, tracked = self.track_fast_mode_features(frame_gray)
+
+        movement = self.get_median_displacement(self.old_features[tracked], new_features[tracked], 1 / self.fast_mode_scale)
+
+        self.old_features = new_features[tracked].reshape(-1, 1, 2)
+        self.old_gray = frame_gray
+
+        return movement, float(np.mean(tracked))
+
+    def track_fast_mode_features(self, frame_gray):
+        new_features, status, _ = cv2.calcOpticalFlowPyrLK(self.old_gray, frame_gray, self.old_features, None, **self.lk_params)
+        tracked = (status.ravel() == 1) & self.is_inside_feature_columns(new_features, frame_gray.shape[0])
+        return new_features, tracked
+
+    def get_feature_columns_gray(self, frame):
+        # downscaled grayscale image of just the feature columns, side by side with a blank gap
+        # of one flow window between them so no window straddles two columns
+        gap = np.zeros((int(round(frame.shape[0] * self.fast_mode_scale)), self.lk_params['winSize'][0]), dtype=np.uint8)
+        columns = []
+        for start, end in self.mask_columns:
+            column = cv2.cvtColor(np.ascontiguousarray(frame[:, start:end]), cv2.COLOR_BGR2GRAY)
+            column = cv2.resize(column, (max(1, int(round((end - start) * self.fast_mode_scale))), gap.shape[0]), interpolation=cv2.INTER_AREA)
+            if columns:
+                columns.append(gap)
+            columns.append(column)
+        return np.hstack(columns)
+
+    def get_feature_column_ranges(self):
+        # x ranges of the feature columns inside the image built by get_feature_columns_gray
+        column_ranges = []
+        column_start = 0
+        for start, end in self.mask_columns:
+            column_width = max(1, int(round((end - start) * self.fast_mode_scale)))
+            column_ranges.append((column_start, column_start + column_width))
+            column_start += column_width + self.lk_params['winSize'][0]
+        return column_ranges
+
+    def detect_fast_mode_features(self, frame_gray):
+        # the borders between the columns and the gap are strong static edges, so keep
+        # features half a flow window away from them
+        margin = self.lk_params['winSize'][0] // 2
+        mask = np.zeros_like(frame_gray)
+        for start, end in self.get_feature_column_ranges():
+            mask[margin:-margin, start + margin:end - margin] = 1
+        return cv2.goodFeaturesToTrack(frame_gray, **dict(self.fast_mode_features, mask=mask))
+
+    def is_inside_feature_columns(self, features, height):
+        # features that drift onto a column border latch onto the static edge, so drop
+        # them once they come within the detection margin
+        margin = self.lk_params['winSize'][0] // 2
+        features = features.reshape(-1, 2)
+        inside = (features[:, 1] >= margin) & (features[:, 1] < height - margin)
+        inside_column = np.zeros(len(features), dtype=bool)
+        for start, end in self.get_feature_column_ranges():
+            inside_column |= (features[:, 0] >= start + margin) & (features[:, 0] < end - margin)
+        return inside & inside_column
+
+    def get_median_displacement(self, old_features, new_features, scale=1):
+        # tracked features all follow the camera, so their median movement is robust to the odd bad track
+        if len(old_features) == 0:
+            return [0,0]
+        displacement = np.median((old_features.reshape(-1, 2) - new_features.reshape(-1, 2)) * scale, axis=0)
+        if np.hypot(displacement[0], displacement[1]) > self.minimum_distance:
+            return displacement.tolist()
+        return [0,0]
+
+    def get_max_displacement(self, old_features, new_features, scale=1):
+        # movement of the feature that moved the most, if it moved more than minimum_distance
+        if len(old_features) == 0:
+            return [0,0]
+        displacement = (old_features.reshape(-1, 2) - new_features.reshape(-1, 2)) * scale
+        distances = np.hypot(displacement[:, 0], displacement[:, 1])
+        feature = np.argmax(distances)
+        if distances[feature] > self.minimum_distance:
+            return displacement[feature].tolist()
+        return [0,0]
     
     def draw_camera_movement(self, frames, camera_movement_per_frame):
         output_frames = []
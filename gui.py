@@ -2,8 +2,10 @@ import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import tkinterdnd2 as tkdnd
 import main  # Assuming main.py is in the same directory
+from progress_events import ChromeTraceWriter
 import sys
 import threading
+import multiprocessing
 import os  # For `resource_path` and `os.path.normpath`
 import platform #For playing video
 
@@ -66,6 +68,11 @@ class FootballAnalysisGUI:
         self.status_label = ttk.Label(main_frame, text="")
         self.status_label.pack(pady=10)
 
+        # Timing trace of the run, saved next to the output video
+        self.save_trace = tk.BooleanVar(value=False)
+        self.trace_check = ttk.Checkbutton(main_frame, text="Save timing trace", variable=self.save_trace)
+        self.trace_check.pack()
+
         # Log window with scrollbar
         log_frame = ttk.Frame(main_frame)
         log_frame.pack(pady=10, padx=10, fill=tk.BOTH, expand=True)
@@ -112,11 +119,17 @@ class FootballAnalysisGUI:
         output_path = resource_path(output_path) #Use resource path here
         self.progress.start()
         self.update_log("Processing video...")
+        hooks = []
+        if self.save_trace.get():
+            # open in chrome://tracing or ui.perfetto.dev
+            hooks.append(ChromeTraceWriter(os.path.splitext(output_path)[0] + '_trace.json'))
         try:
-            result = main.process_video(input_path, output_path)
+            result = main.process_video(input_path, output_path, hooks=hooks)
             if result is not None:
-                for message in result:
-                    self.update_log(message)
+                for event in result:
+                    self.update_progress(event)
+                    if event.kind != "progress":
+                        self.update_log(str(event))
             else:
                 self.update_log("Processing completed, but no messages were returned.")
             self.update_log("Video processed successfully!")
@@ -126,9 +139,27 @@ class FootballAnalysisGUI:
             self.show_error_message(str(e))
             print(f"Error: {str(e)}", file=sys.stderr)
         finally:
+            for hook in hooks:
+                hook.close()
             self.progress.stop()
             self.update_play_button(output_path)
 
+    def update_progress(self, event):
+        """Show the running stage, with a determinate bar for the stages that count frames."""
+        def update():
+            if event.kind == "progress" and event.frames_total:
+                if str(self.progress['mode']) != 'determinate':
+                    self.progress.stop()
+                    self.progress.config(mode='determinate', maximum=event.frames_total)
+                self.progress['value'] = event.frames_done
+                self.status_label.config(text=str(event))
+            elif event.kind == "stage_start":
+                if str(self.progress['mode']) != 'indeterminate':
+                    self.progress.config(mode='indeterminate', value=0)
+                    self.progress.start()
+                self.status_label.config(text=f"{event.stage.replace('_', ' ').capitalize()}...")
+        self.master.after(0, update)
+
     def show_success_message(self, output_path):
         self.output_path = output_path
         self.master.after(0, lambda: messagebox.showinfo("Success", f"Output video generated successfully at {output_path}"))
@@ -165,6 +196,9 @@ class FootballAnalysisGUI:
         self.log_window.config(state='disabled')
         self.master.update_idletasks()
 
+# worker processes (e.g. parallel camera movement) re-run this script when frozen by PyInstaller
+multiprocessing.freeze_support()
+
 # Initialize the main window
 root = tkdnd.TkinterDnD.Tk()
 root.title("Football Analysis Tool")
@@ -0,0 +1,41 @@
+"""Track and annotate a camera, a stream or a growing recording as it comes in.
+
+    python live.py 0 --output live_output.avi
+    python live.py http://192.168.1.20:8080/video --budget 0.15
+    python live.py recording.mp4 --follow --output recording_output.avi
+
+The source is a camera index, a stream URL that OpenCV can open (RTSP, MJPEG over HTTP) or a
+video file, which is played at its frame rate. Every frame is written as soon as it is annotated,
+at most --budget seconds after it was captured: frames that are over budget are dropped, and the
+detector runs on fewer frames while processing falls behind. A latency line (p50/p90/p99) is
+printed every second.
+"""
+import argparse
+from main import process_live
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help='camera index, stream URL or video file')
+    parser.add_argument('--output', default=None, help='annotated video to write, none by default')
+    parser.add_argument('--budget', type=float, default=0.2, help='end-to-end latency budget in seconds')
+    parser.add_argument('--follow', action='store_true', help='keep reading a video file that is still being written')
+    parser.add_argument('--codec', default='XVID')
+    parser.add_argument('--writer-backend', default='opencv', choices=['opencv', 'ffmpeg'])
+    parser.add_argument('--backend', default='pytorch', choices=['pytorch', 'onnx', 'openvino'])
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--int8', action='store_true')
+    args = parser.parse_args()
+
+    source = int(args.source) if args.source.isdigit() else args.source
+    detector_options = dict(backend=args.backend, imgsz=args.imgsz, int8=args.int8, batch_size=1)
+    try:
+        for event in process_live(source, args.output, args.budget, detector_options, follow=args.follow,
+                                  codec=args.codec, writer_backend=args.writer_backend):
+            print(event)
+    except KeyboardInterrupt:
+        print("Stopped.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,3 @@
+from .live_processor import LiveProcessor
+from .latency_scheduler import LatencyScheduler
+from .frame_source import FrameSource
\ No newline at end of file
@@ -0,0 +1,107 @@
+from collections import deque
+import threading
+import time
+import os
+import cv2
+
+
+class FrameSource:
+    """Reads frames from a cv2.VideoCapture source on a background thread.
+
+    source is a camera index, a stream URL (e.g. an MJPEG stream over HTTP) or a file. Files are
+    read at their frame rate, the way a camera would deliver them, unless realtime is False. With
+    follow, a file that is still being written is reopened at the next frame whenever the end is
+    reached, until no new frame arrived for idle_timeout seconds. Only the newest max_queued
+    frames are kept; older ones are overwritten when processing falls behind.
+    """
+
+    def __init__(self, source, max_queued=4, realtime=None, follow=False, idle_timeout=5.0, poll_interval=0.2):
+        self.source = source
+        self.is_file = isinstance(source, str) and os.path.exists(source)
+        self.realtime = self.is_file if realtime is None else realtime
+        self.follow = follow and self.is_file
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+
+        self.cap = cv2.VideoCapture(source)
+        if not self.cap.isOpened():
+            raise ValueError(f"Could not open video source {source}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 24
+        self.frame_size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+        self.frames = deque(maxlen=max_queued)
+        self.condition = threading.Condition()
+        self.finished = False
+        self.stopped = False
+        self.error = None
+        self.frames_read = 0
+        self.frames_overwritten = 0
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self):
+        try:
+            start_time = time.perf_counter()
+            last_frame_time = start_time
+            while not self.stopped:
+                if self.realtime:
+                    delay = start_time + self.frames_read / self.fps - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                ret, frame = self.cap.read()
+                if not ret:
+                    if not self.follow or time.perf_counter() - last_frame_time > self.idle_timeout:
+                        break
+                    # the writer may not have flushed the next frame yet; reopen and seek past the frames read
+                    time.sleep(self.poll_interval)
+                    self.cap.release()
+                    self.cap = cv2.VideoCapture(self.source)
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.frames_read)
+                    # pace the frames that arrive from here on from now
+                    start_time = time.perf_counter() - self.frames_read / self.fps
+                    continue
+
+                last_frame_time = time.perf_counter()
+                with self.condition:
+                    if len(self.frames) == self.frames.maxlen:
+                        self.frames_overwritten += 1
+                    self.frames.append((self.frames_read, last_frame_time, frame))
+                    self.condition.notify()
+                self.frames_read += 1
+        except Exception as e:
+            self.error = e
+        finally:
+            self.cap.release()
+            with self.condition:
+                self.finished = True
+                self.condition.notify()
+
+    def get(self):
+        # (frame number, capture time, frame) of the oldest waiting frame, or None at the end
+        with self.condition:
+            while not self.frames and not self.finished:
+                self.condition.wait()
+            if self.frames:
+                return self.frames.popleft()
+        if self.error is not None:
+            raise self.error
+        return None
+
+    def pending(self):
+        # frames waiting behind the one being processed
+        return len(self.frames)
+
+    def stop(self):
+        self.stopped = True
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
@@ -0,0 +1,53 @@
+from collections import deque
+import numpy as np
+
+
+class LatencyScheduler:
+    """Keeps the end-to-end latency of the live mode under latency_budget seconds.
+
+    A frame that is over budget before it is processed is dropped when a newer frame is already
+    waiting. Detection runs next to the per-frame work and is started on every
+    detection_interval-th frame at most. The interval grows by one for every frame over budget
+    and shrinks by one for every frame under half of it, so detection takes the time that is left.
+    """
+
+    def __init__(self, latency_budget=0.2, max_detection_interval=25, window=300):
+        self.latency_budget = latency_budget
+        self.max_detection_interval = max_detection_interval
+        self.detection_interval = 1
+        self.frames_since_detection = 0
+        # latencies of the most recent frames, for the percentiles
+        self.latencies = deque(maxlen=window)
+
+        self.processed_frames = 0
+        self.dropped_frames = 0
+        self.detected_frames = 0
+
+    def should_drop(self, frame_age, newer_frames):
+        if newer_frames > 0 and frame_age > self.latency_budget:
+            self.dropped_frames += 1
+            return True
+        return False
+
+    def should_detect(self, detector_busy):
+        self.frames_since_detection += 1
+        if detector_busy or self.frames_since_detection < self.detection_interval:
+            return False
+        self.frames_since_detection = 0
+        self.detected_frames += 1
+        return True
+
+    def record_latency(self, latency):
+        self.latencies.append(latency)
+        self.processed_frames += 1
+        if latency > self.latency_budget:
+            self.detection_interval = min(self.max_detection_interval, self.detection_interval + 1)
+        elif latency < self.latency_budget / 2:
+            self.detection_interval = max(1, self.detection_interval - 1)
+
+    def get_latency_percentiles(self):
+        # milliseconds over the recent frames
+        if not self.latencies:
+            return {}
+        p50, p90, p99 = np.percentile(np.array(self.latencies) * 1000, [50, 90, 99])
+        return {"p50": float(p50), "p90": float(p90), "p99": float(p99), "max": max(self.latencies) * 1000}
@@ -0,0 +1,137 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import sys
+sys.path.append('../')
+from camera_movement_estimator import CameraMovementEstimator
+from team_assigner import TeamAssigner
+from player_ball_assigner import PlayerBallAssigner
+from annotation_renderer import AnnotationRenderer
+from track_store import TrackStore
+from .latency_scheduler import LatencyScheduler
+
+
+class LiveProcessor:
+    """Tracks and annotates frames one at a time as they arrive.
+
+    Detection runs on its own thread, on the frames the LatencyScheduler picks, while the frames
+    in between are annotated right away with the last tracks. Those are moved along with the
+    camera movement measured since their frame, so they stay on the players during a pan. The
+    detections are passed through ByteTrack on the calling thread, in the order of their frames.
+
+    Team colours are fitted on the players of the first detected frames; until then players are
+    drawn in the default colour. Speed and distance need the whole track and are left out.
+    process_frame() draws on the frame in place; finish() returns a TrackStore of the frames
+    processed, with camera adjusted positions.
+    """
+
+    def __init__(self, tracker, latency_budget=0.2):
+        self.tracker = tracker
+        self.scheduler = LatencyScheduler(latency_budget)
+        self.camera_movement_estimator = None
+        self.team_assigner = TeamAssigner()
+        self.player_ball_assigner = PlayerBallAssigner()
+        self.annotation_renderer = AnnotationRenderer(num_workers=1)
+        self.detection_executor = ThreadPoolExecutor(max_workers=1)
+
+        self.pending_detection = None
+        # latest tracked frame and the camera offset of its frame
+        self.frame_tracks = {object_name: {} for object_name in tracker.create_empty_tracks()}
+        self.tracks_camera_offset = np.zeros(2)
+        # how far the pitch moved in the image since the first frame
+        self.camera_offset = np.zeros(2)
+        self.camera_movement_per_frame = []
+
+        self.fit_colors = []
+        self.team_ball_frames = np.zeros(3)
+        self.ball_control_team = 0
+        # processed frames are collected as dicts and appended to the store in blocks
+        self.track_store = TrackStore()
+        self.unstored_tracks = tracker.create_empty_tracks()
+        self.store_block_size = 256
+
+    def detect(self, frame):
+        return self.tracker.detect_frames([frame])[0]
+
+    def update_tracks(self, detection, camera_offset):
+        tracks = self.tracker.create_empty_tracks()
+        self.tracker.add_detection_to_tracks(detection, tracks)
+        self.frame_tracks = {object_name: object_tracks[0] for object_name, object_tracks in tracks.items()}
+        self.tracks_camera_offset = camera_offset
+
+    def get_frame_tracks(self):
+        # the last tracks moved by the camera movement since their frame
+        shift = self.camera_offset - self.tracks_camera_offset
+        shift = np.array([shift[0], shift[1], shift[0], shift[1]])
+        return {object_name: {track_id: {"bbox": (np.asarray(track["bbox"]) + shift).tolist()}
+                              for track_id, track in object_tracks.items()}
+                for object_name, object_tracks in self.frame_tracks.items()}
+
+    def assign_teams(self, frame, players, new_detection):
+        if not players:
+            return
+        if self.team_assigner.team_colors:
+            bboxes = [player["bbox"] for player in players.values()]
+            for player, team in zip(players.values(), self.team_assigner.get_player_teams(frame, bboxes, list(players))):
+                player["team"] = team
+        elif new_detection and len(players) >= 2:
+            self.fit_colors.append(self.team_assigner.get_player_colors(frame, [player["bbox"] for player in players.values()]))
+            if len(self.fit_colors) == self.team_assigner.number_of_fit_frames:
+                self.team_assigner.fit_team_model(np.concatenate(self.fit_colors))
+                self.annotation_renderer = AnnotationRenderer(self.team_assigner.team_colors, num_workers=1)
+
+    def assign_ball(self, players, ball):
+        # possession counted per frame like get_team_ball_control: frames without an assigned
+        # player go to the team that had the ball last
+        if 1 in ball:
+            assigned_player = self.player_ball_assigner.assign_ball_to_player(players, ball[1]["bbox"])
+            if assigned_player != -1:
+                players[assigned_player]["has_ball"] = True
+                self.ball_control_team = players[assigned_player].get("team", 0)
+        self.team_ball_frames[self.ball_control_team] += 1
+        controlled_frames = self.team_ball_frames[1:].sum()
+        if controlled_frames == 0:
+            return np.zeros(2)
+        return self.team_ball_frames[1:] / controlled_frames * 100
+
+    def process_frame(self, frame):
+        if self.camera_movement_estimator is None:
+            self.camera_movement_estimator = CameraMovementEstimator(frame, fast_mode=True)
+        self.camera_movement_estimator.update_camera_movement([frame], self.camera_movement_per_frame)
+        # the estimator gives the camera's movement, the pitch moves the other way in the image
+        self.camera_offset = self.camera_offset - np.asarray(self.camera_movement_per_frame[-1])
+
+        new_detection = False
+        if self.pending_detection is not None and self.pending_detection[0].done():
+            future, camera_offset = self.pending_detection
+            self.pending_detection = None
+            self.update_tracks(future.result(), camera_offset)
+            new_detection = True
+        if self.scheduler.should_detect(self.pending_detection is not None):
+            # the detector gets a copy, the frame is drawn on in the meantime
+            self.pending_detection = (self.detection_executor.submit(self.detect, frame.copy()), self.camera_offset.copy())
+
+        frame_tracks = self.get_frame_tracks()
+        self.assign_teams(frame, frame_tracks["players"], new_detection)
+        possession_percentages = self.assign_ball(frame_tracks["players"], frame_tracks["ball"])
+
+        frame_store = TrackStore.from_tracks({object_name: [object_tracks] for object_name, object_tracks in frame_tracks.items()})
+        self.annotation_renderer.draw_frame(frame, 0, frame_store)
+        self.annotation_renderer.draw_team_ball_control(frame, possession_percentages)
+
+        for object_name, object_tracks in frame_tracks.items():
+            self.unstored_tracks[object_name].append(object_tracks)
+        if len(self.unstored_tracks["players"]) == self.store_block_size:
+            self.store_tracks()
+        return frame
+
+    def store_tracks(self):
+        self.track_store.append_tracks(self.unstored_tracks)
+        self.unstored_tracks = self.tracker.create_empty_tracks()
+
+    def finish(self):
+        self.detection_executor.shutdown(wait=True)
+        self.store_tracks()
+        self.tracker.add_position_to_store(self.track_store)
+        if self.camera_movement_per_frame:
+            self.camera_movement_estimator.add_adjust_positions_to_store(self.track_store, self.camera_movement_per_frame)
+        return self.track_store
@@ -1,12 +1,24 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from utils import read_video, save_video
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from utils import read_video, iter_video_windows, read_frame, get_video_properties, read_stub, VideoWriter, SharedFrameRing
 from trackers import Tracker
 from team_assigner import TeamAssigner
-from camera_movement_estimator import CameraMovementEstimator
+from camera_movement_estimator import CameraMovementEstimator, attach_frame_ring, estimate_camera_movement_from_ring
 from view_transformer import ViewTransformer
 from speed_and_distance_estimator import SpeedAndDistance_Estimator
+from track_store import TrackStore
+from result_cache import ResultCache
+from annotation_renderer import AnnotationRenderer
+from player_ball_assigner import PlayerBallAssigner
+from progress_events import ProgressReporter, ChromeTraceWriter
+from analytics_export import AnalyticsWriter, get_analytics_columns, write_player_summary, get_summary_path
+from pitch_analytics import PitchHeatmap, MinimapRenderer
+from live_processor import LiveProcessor, FrameSource
+import multiprocessing
 import os
 import sys
+import time
+import cv2
+import numpy as np
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -18,98 +30,632 @@ def resource_path(relative_path):
 
     return os.path.join(base_path, relative_path)
 
-def initialize_tracker(video_frames, video_number):
+def read_legacy_stub(stub_path, number_of_frames):
+    # the old stubs/*_{video name}.pkl files are keyed by file name only, so they are used
+    # only when the result cache misses and the stub covers exactly the video's frames
+    stub = read_stub(stub_path)
+    if stub is None:
+        return None
+    stub_frames = len(stub["players"]) if isinstance(stub, dict) else len(stub)
+    return stub if stub_frames == number_of_frames else None
+
+def get_track_cache_key(tracker, input_path, result_cache, tracking_workers=1, window_size=64):
+    params = tracker.get_cache_params(window_size)
+    if tracking_workers > 1:
+        # chunked tracking stitches the track ids at the chunk boundaries, so its tracks differ
+        params = dict(params, tracking_workers=tracking_workers, chunk_overlap=tracker.chunk_overlap,
+                      minimum_chunk_size=tracker.minimum_chunk_size, stitch_min_iou=tracker.stitch_min_iou)
+    return result_cache.key("tracks", input_path, tracker.model_path, params)
+
+def get_camera_movement_cache_key(camera_movement_estimator, input_path, result_cache):
+    return result_cache.key("camera_movement", input_path, params=camera_movement_estimator.get_cache_params())
+
+def get_track_checkpoint(result_cache, track_cache_key, window_size):
+    # keyframes depend on where the windows end, so a checkpoint only continues the same windows
+    return result_cache.checkpoint(f"{track_cache_key}-window{window_size}")
+
+def initialize_tracker(video_frames, input_path, result_cache, use_legacy_stubs=True, detector_options=None,
+                       window_size=64, progress=None, tracking_workers=1, checkpoint_interval=1024):
+    progress = progress or ProgressReporter()
     model_path = resource_path("models/best.pt")  # Use resource_path
-    tracker = Tracker(model_path)
-    tracks = tracker.get_object_tracks(video_frames,
-                                       read_from_stub=True,
-                                       stub_path=f'stubs/track_stubs_{video_number}.pkl')
-    tracker.add_position_to_tracks(tracks)
-    return tracks, tracker
-
-def estimate_camera_movement(video_frames, video_number):
-    camera_movement_estimator = CameraMovementEstimator(video_frames[0])
-    camera_movement_per_frame = camera_movement_estimator.get_camera_movement(video_frames,
-                                                                              read_from_stub=True,
-                                                                              stub_path=f'stubs/camera_movement_stub_{video_number}.pkl')
+    tracker = Tracker(model_path, **(detector_options or {}))
+    cache_key = get_track_cache_key(tracker, input_path, result_cache, tracking_workers, window_size)
+    track_store = result_cache.load(cache_key, TrackStore.load)
+    cache_source = "result_cache" if track_store is not None else None
+    if track_store is None:
+        video_number = os.path.basename(input_path).split('.')[0]
+        # the legacy stubs come from the default pytorch detector
+        use_legacy_stub = use_legacy_stubs and not detector_options
+        tracks = read_legacy_stub(f'stubs/track_stubs_{video_number}.pkl', len(video_frames)) if use_legacy_stub else None
+        if tracks is not None:
+            cache_source = "legacy_stub"
+            track_store = TrackStore.from_tracks(tracks)
+    progress.cache("tracking", cache_source)
+
+    if track_store is None and tracking_workers > 1:
+        # the worker processes decode their chunks of the video themselves
+        track_store = tracker.get_track_store_parallel(input_path, tracking_workers, window_size=window_size)
+        result_cache.save(cache_key, track_store.save)
+    elif track_store is None:
+        # window by window like the streaming pass, for the progress events, continuing after the
+        # frames of an interrupted run's checkpoint
+        checkpoint = get_track_checkpoint(result_cache, cache_key, window_size)
+        track_store = tracker.resume_from_checkpoint(checkpoint)
+        frames_checkpointed = len(track_store)
+        if frames_checkpointed:
+            progress.message(f"Tracking resumed from the checkpoint at frame {frames_checkpointed}")
+        for start in range(len(track_store), len(video_frames), window_size):
+            tracker.update_track_store(video_frames[start:start + window_size], track_store)
+            progress.progress("tracking", len(track_store), len(video_frames))
+            if checkpoint_interval and len(track_store) - frames_checkpointed >= checkpoint_interval:
+                frames_checkpointed = tracker.save_checkpoint(checkpoint, track_store, frames_checkpointed)
+        result_cache.save(cache_key, track_store.save)
+        checkpoint.remove()
+    return track_store, tracker
+
+def get_flow_confidence_message(flow_confidence):
+    # share of tracked features per frame; low values mean the movement of those frames is a guess
+    flow_confidence = np.asarray(flow_confidence, dtype=np.float64)
+    if len(flow_confidence) == 0:
+        return "Camera movement flow confidence: no frames."
+    return (f"Camera movement flow confidence: mean {flow_confidence.mean():.2f}, "
+            f"{np.count_nonzero(flow_confidence < 0.5)} of {len(flow_confidence)} frames below 0.5.")
+
+def estimate_camera_movement(video_frames, input_path, result_cache, num_workers=1, use_legacy_stubs=True,
+                             window_size=64, progress=None, checkpoint_interval=1024, fast_mode=False):
+    progress = progress or ProgressReporter()
+    camera_movement_estimator = CameraMovementEstimator(video_frames[0], fast_mode=fast_mode)
+    cache_key = get_camera_movement_cache_key(camera_movement_estimator, input_path, result_cache)
+    camera_movement_per_frame = result_cache.load_camera_movement(cache_key)
+    if camera_movement_per_frame is not None:
+        progress.cache("camera_movement", "result_cache")
+        return camera_movement_per_frame
+
+    video_number = os.path.basename(input_path).split('.')[0]
+    if use_legacy_stubs:
+        camera_movement_per_frame = read_legacy_stub(f'stubs/camera_movement_stub_{video_number}.pkl', len(video_frames))
+        if camera_movement_per_frame is not None:
+            progress.cache("camera_movement", "legacy_stub")
+            return camera_movement_per_frame
+    progress.cache("camera_movement", None)
+
+    checkpoint = result_cache.checkpoint(cache_key)
+    if num_workers > 1:
+        camera_movement_per_frame = camera_movement_estimator.get_camera_movement_parallel(input_path, num_workers=num_workers)
+    else:
+        camera_movement_per_frame = camera_movement_estimator.resume_from_checkpoint(checkpoint)
+        frames_checkpointed = len(camera_movement_per_frame)
+        if frames_checkpointed:
+            progress.message(f"Camera movement resumed from the checkpoint at frame {frames_checkpointed}")
+        for start in range(len(camera_movement_per_frame), len(video_frames), window_size):
+            camera_movement_estimator.update_camera_movement(video_frames[start:start + window_size], camera_movement_per_frame)
+            progress.progress("camera_movement", len(camera_movement_per_frame), len(video_frames))
+            if checkpoint_interval and len(camera_movement_per_frame) - frames_checkpointed >= checkpoint_interval:
+                frames_checkpointed = camera_movement_estimator.save_checkpoint(checkpoint, camera_movement_per_frame,
+                                                                                frames_checkpointed)
+    progress.message(get_flow_confidence_message(camera_movement_estimator.flow_confidence))
+    result_cache.save_camera_movement(cache_key, camera_movement_per_frame)
+    checkpoint.remove()
     return camera_movement_per_frame
 
-def transform_view(tracks):
+def transform_view(track_store):
     view_transformer = ViewTransformer()
-    view_transformer.add_transformed_position_to_tracks(tracks)
-    
-def interpolate_ball_positions(tracker, tracks):
-    tracks["ball"] = tracker.interpolate_ball_positions(tracks["ball"])
+    view_transformer.add_transformed_position_to_store(track_store)
+
+def get_view_transform_message(track_store):
+    # the interpolated ball needs its positions too, so a ball without any on the pitch means a
+    # stage ran out of order
+    ball_rows = track_store["ball"]
+    on_pitch = np.count_nonzero(~np.isnan(ball_rows['position_transformed']).any(axis=1))
+    message = f"View transformation completed. Ball on the pitch in {on_pitch} of {len(ball_rows)} frames."
+    if len(ball_rows) and not on_pitch:
+        message += " Warning: the ball has no pitch positions."
+    return message
+
+def interpolate_ball_positions(tracker, track_store):
+    tracker.interpolate_ball_positions_in_store(track_store)
 
-def estimate_speed_and_distance(tracks):
-    speed_and_distance_estimator = SpeedAndDistance_Estimator()
-    speed_and_distance_estimator.add_speed_and_distance_to_tracks(tracks)
+def assign_ball_possession(track_store):
+    # has_ball for the player closest to the ball, and the running team possession percentages
+    player_ball_assigner = PlayerBallAssigner()
+    assigned_players = player_ball_assigner.assign_ball_to_players_in_store(track_store)
+    team_ball_control = player_ball_assigner.get_team_ball_control(track_store, assigned_players)
+    return player_ball_assigner.get_possession_percentages(team_ball_control)
+
+def get_possession_message(possession_percentages):
+    if len(possession_percentages) == 0:
+        return "Ball possession completed."
+    team_1, team_2 = possession_percentages[-1]
+    return f"Ball possession completed. Team 1: {team_1:.1f}%, Team 2: {team_2:.1f}%"
+
+def estimate_speed_and_distance(track_store, frame_rate):
+    speed_and_distance_estimator = SpeedAndDistance_Estimator(frame_rate)
+    speed_and_distance_estimator.add_speed_and_distance_to_store(track_store)
     
-def assign_team(video_frames, tracks):
+def assign_team(track_store, input_path=None, video_frames=None):
     team_assigner = TeamAssigner()
-    team_assigner.assign_team_color(video_frames[0], tracks['players'][0])
-    for frame_num, player_track in enumerate(tracks['players']):
-        for player_id, track in player_track.items():
-            team = team_assigner.get_player_team(video_frames[frame_num], track['bbox'], player_id)
-            tracks['players'][frame_num][player_id]['team'] = team
-            tracks['players'][frame_num][player_id]['team_color'] = team_assigner.team_colors[team]
-
-def process_video(input_path, output_path):
+    team_assigner.add_team_to_store(track_store, video_path=input_path, video_frames=video_frames)
+    return team_assigner
+
+def start_shared_frame_pass(input_path, video_properties, window_size, start_frame, camera_movement_estimator,
+                            camera_movement, camera_movement_start, checkpoint, checkpoint_interval, executor):
+    # decode the video once into a SharedFrameRing on a thread of executor, for the tracker and for
+    # the camera movement estimator in a worker process. returns the ring, the decoder's future, the
+    # worker's executor, the future of its camera movement and its count of frames done
+    context = multiprocessing.get_context('spawn')
+    # the tracker holds a window of frames while the decoder and the estimator go on
+    frame_ring = SharedFrameRing((video_properties['height'], video_properties['width'], 3), window_size + 16,
+                                 readers=2, context=context)
+    frames_done = context.Value('q', start_frame, lock=False)
+    camera_movement_executor = ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=attach_frame_ring,
+                                                   initargs=(frame_ring, frames_done))
+    camera_movement_future = camera_movement_executor.submit(
+        estimate_camera_movement_from_ring, camera_movement_estimator, camera_movement, start_frame,
+        camera_movement_start, checkpoint, checkpoint_interval)
+
+    def abort_on_failure(future):
+        # a worker that died (BrokenProcessPool) can't abort the ring itself, and the decoder and
+        # the tracker would wait for its frames forever
+        if future.cancelled() or future.exception() is not None:
+            frame_ring.abort()
+    camera_movement_future.add_done_callback(abort_on_failure)
+    decoder = executor.submit(frame_ring.decode, input_path, start_frame)
+    return frame_ring, decoder, camera_movement_executor, camera_movement_future, frames_done
+
+def write_annotated_video(frame_windows, track_store, team_colors, video_writer, possession_percentages=None,
+                          progress=None, minimap=False):
+    # annotate window by window; the writer encodes the previous window on its own thread.
+    # minimap draws the top-down positions in a corner of every frame.
+    # yields a progress event per window and the encoding throughput at the end
+    progress = progress or ProgressReporter()
+    if minimap:
+        view_transformer = ViewTransformer()
+        minimap = MinimapRenderer(view_transformer.court_length, view_transformer.court_width, team_colors)
+    annotation_renderer = AnnotationRenderer(team_colors, possession_percentages=possession_percentages,
+                                             minimap=minimap or None)
+    number_of_frames = len(track_store)
+    frame_num = 0
+    with video_writer:
+        for frame_window in frame_windows:
+            frame_window = frame_window[:number_of_frames - frame_num]
+            if not frame_window:
+                break
+            annotation_renderer.render_frames(frame_window, track_store, frame_num)
+            for frame in frame_window:
+                video_writer.write(frame)
+            frame_num += len(frame_window)
+            yield progress.progress("rendering", frame_num, number_of_frames)
+    stats = video_writer.get_stats()
+    yield progress.message(f"Encoded {stats['frames']} frames at {stats['encode_fps']:.1f} fps ({stats['wall_fps']:.1f} fps overall).")
+
+def export_analytics(track_store, analytics_path, frame_rate, window_size=64, progress=None):
+    # the per-frame analytics to analytics_path in windows of frames, and the per-player summary
+    # next to it, see AnalyticsWriter. yields a progress event per window.
+    # every row has an image position once the stages ran in order, so rows without one are reported
+    progress = progress or ProgressReporter()
+    number_of_frames = len(track_store)
+    with AnalyticsWriter(analytics_path) as analytics_writer:
+        for start in range(0, number_of_frames, window_size):
+            analytics_writer.write(get_analytics_columns(track_store, start, start + window_size, frame_rate))
+            yield progress.progress("analytics_export", min(start + window_size, number_of_frames), number_of_frames)
+    write_player_summary(get_summary_path(analytics_path), track_store, frame_rate)
+    for object_name, rows in track_store.items():
+        missing = np.count_nonzero(np.isnan(rows['position']).any(axis=1))
+        if missing:
+            yield progress.message(f"Warning: {missing} of {len(rows)} {object_name} rows were exported without a position.")
+
+def build_heatmaps(track_store, heatmap_path, frame_rate, window_size=64, progress=None):
+    # per-player and per-team occupancy of the pitch to heatmap_path (.npz, see PitchHeatmap),
+    # added window by window, and a picture of each team's heatmap next to it.
+    # yields a progress event per window
+    progress = progress or ProgressReporter()
+    view_transformer = ViewTransformer()
+    pitch_heatmap = PitchHeatmap(view_transformer.court_length, view_transformer.court_width, frame_rate)
+    number_of_frames = len(track_store)
+    for start in range(0, number_of_frames, window_size):
+        pitch_heatmap.add_store_frames(track_store, start, start + window_size)
+        yield progress.progress("heatmaps", min(start + window_size, number_of_frames), number_of_frames)
+    pitch_heatmap.save(heatmap_path)
+    for team in (1, 2):
+        cv2.imwrite(f"{os.path.splitext(heatmap_path)[0]}_team{team}.png",
+                    pitch_heatmap.render(pitch_heatmap.get_team_heatmap(team)))
+
+def process_video(input_path, output_path, streaming=False, window_size=64, camera_movement_workers=1,
+                  codec='XVID', writer_backend='opencv', cache_dir='cache', use_legacy_stubs=True,
+                  detector_options=None, hooks=None, tracking_workers=1, checkpoint_interval=1024,
+                  analytics_path=None, heatmap_path=None, minimap=False, shared_frames=False,
+                  camera_movement_fast_mode=False):
+    # camera_movement_workers > 1 estimates camera movement in that many worker processes, and
+    # tracking_workers > 1 tracks that many chunks of the video at once, see Tracker.get_track_store_parallel.
+    # detector_options are passed to Tracker, e.g. dict(backend='openvino', imgsz=480, keyframe_interval=4,
+    # ball_search_window=384).
+    # writer_backend='ffmpeg' encodes H.264 through a local ffmpeg binary instead of cv2 and codec.
+    # tracks and camera movement are cached in cache_dir by video content, model and parameters.
+    # until then they are checkpointed every checkpoint_interval frames (None turns it off), and a
+    # run that was interrupted continues from its checkpoints; not with parallel workers, though.
+    # analytics_path (.csv, or .parquet and .arrow with pyarrow) gets the positions, speed, distance
+    # and team of every object in every frame, see export_analytics; output_path None skips drawing
+    # and encoding the video, for when only those numbers are needed. heatmap_path (.npz) gets the
+    # time every player and team spent on each part of the pitch, see build_heatmaps, and minimap
+    # draws a top-down view of the positions into the video. shared_frames (streaming only) decodes
+    # the video once into shared memory, read by the tracker and by the camera movement estimator
+    # in a worker process, see SharedFrameRing. camera_movement_fast_mode estimates the camera
+    # movement on downscaled feature columns with features tracked over frames, see
+    # CameraMovementEstimator; either way the flow confidence of the frames is reported.
+    # yields ProgressEvents (str() gives the log line) and passes them to every hook, e.g. a
+    # JsonlTraceWriter or ChromeTraceWriter from progress_events
+    if streaming:
+        yield from process_video_streaming(input_path, output_path, window_size, camera_movement_workers,
+                                           codec, writer_backend, cache_dir, use_legacy_stubs, detector_options,
+                                           hooks, tracking_workers, checkpoint_interval, analytics_path,
+                                           heatmap_path, minimap, shared_frames, camera_movement_fast_mode)
+        return
+
+    progress = ProgressReporter(hooks)
     video_number = os.path.basename(input_path).split('.')[0]
-    yield f"Processing video: {video_number}"
+    yield progress.message(f"Processing video: {video_number}")
     
     # Read the video
-    print("Reading video...")
+    yield progress.start_stage("reading", "Reading video...")
     video_frames = read_video(input_path)
     if isinstance(video_frames, tuple):
         video_frames = video_frames[0]  # Assuming frames are the first element
-    yield f"Video read successfully. Total frames: {len(video_frames)}"
+    yield progress.end_stage("reading", f"Video read successfully. Total frames: {len(video_frames)}", len(video_frames))
+    frame_rate = get_video_properties(input_path)['fps'] or 24
+    result_cache = ResultCache(cache_dir)
     
     with ThreadPoolExecutor() as executor:
         # Initialize tracker and estimate camera movement concurrently
+        yield progress.start_stage("tracking")
+        yield progress.start_stage("camera_movement")
         futures = {
-            executor.submit(initialize_tracker, video_frames, video_number): 'tracker',
-            executor.submit(estimate_camera_movement, video_frames, video_number): 'camera_movement'
+            executor.submit(initialize_tracker, video_frames, input_path, result_cache, use_legacy_stubs,
+                            detector_options, window_size, progress, tracking_workers, checkpoint_interval): 'tracking',
+            executor.submit(estimate_camera_movement, video_frames, input_path, result_cache,
+                            camera_movement_workers, use_legacy_stubs, window_size, progress,
+                            checkpoint_interval, camera_movement_fast_mode): 'camera_movement'
         }
         
-        for future in as_completed(futures):
-            task = futures[future]
-            try:
-                result = future.result()
-                if task == 'tracker':
-                    tracks, tracker = result
-                elif task == 'camera_movement':
-                    camera_movement_per_frame = result
-            except Exception as e:
-                print(f"Error occurred during {task}: {e}")
-                return
-
-        # Continue processing
-        camera_movement_estimator = CameraMovementEstimator(video_frames[0])
-        camera_movement_estimator.add_adjust_positions_to_tracks(tracks, camera_movement_per_frame)
-        yield "Camera movement estimation completed."
-        
-        transform_view(tracks)
-        yield "View transformation completed."
-        
-        interpolate_ball_positions(tracker, tracks)
-        yield "Ball position interpolation completed."
-        
-        estimate_speed_and_distance(tracks)
-        yield "Speed and distance estimation completed."
-        
-        assign_team(video_frames, tracks)
-        yield "Team assignment completed."
+        pending = set(futures)
+        cached_stages = set()
+        while pending:
+            # wake up now and then to pass on the progress events of the two threads
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for event in progress.queued_events():
+                if event.kind == "cache" and event.cache_hit:
+                    cached_stages.add(event.stage)
+                yield event
+            for future in done:
+                task = futures[future]
+                try:
+                    result = future.result()
+                    if task == 'tracking':
+                        track_store, tracker = result
+                    elif task == 'camera_movement':
+                        camera_movement_per_frame = result
+                except Exception as e:
+                    print(f"Error occurred during {task}: {e}")
+                    return
+                yield progress.end_stage(task, frames=None if task in cached_stages else len(video_frames))
+
+        yield progress.message(f"Result cache: {result_cache.hits} hits, {result_cache.misses} misses.")
+
+        # Continue processing. the ball is interpolated first, so the positions below are
+        # computed for the interpolated frames too
+        yield progress.start_stage("ball_interpolation")
+        interpolate_ball_positions(tracker, track_store)
+        yield progress.end_stage("ball_interpolation", "Ball position interpolation completed.")
+
+        yield progress.start_stage("camera_adjustment")
+        tracker.add_position_to_store(track_store)
+        camera_movement_estimator = CameraMovementEstimator(video_frames[0], fast_mode=camera_movement_fast_mode)
+        camera_movement_estimator.add_adjust_positions_to_store(track_store, camera_movement_per_frame)
+        yield progress.end_stage("camera_adjustment", "Camera movement estimation completed.")
         
-        # Draw annotations and save the video
-        output_video_frames = tracker.draw_annotations(video_frames, tracks)
-        speed_and_distance_estimator = SpeedAndDistance_Estimator()
-        speed_and_distance_estimator.draw_speed_and_distance(output_video_frames, tracks)
+        yield progress.start_stage("view_transform")
+        transform_view(track_store)
+        yield progress.end_stage("view_transform", get_view_transform_message(track_store))
+
+        yield progress.start_stage("speed_and_distance")
+        estimate_speed_and_distance(track_store, frame_rate)
+        yield progress.end_stage("speed_and_distance", "Speed and distance estimation completed.")
+
+        yield progress.start_stage("team_assignment")
+        try:
+            team_assigner = assign_team(track_store, video_frames=video_frames)
+        except ValueError as e:
+            yield progress.message(f"Error occurred during team_assignment: {e}")
+            raise
+        yield progress.end_stage("team_assignment", "Team assignment completed.")
+
+        yield progress.start_stage("ball_possession")
+        possession_percentages = assign_ball_possession(track_store)
+        yield progress.end_stage("ball_possession", get_possession_message(possession_percentages))
         
-        yield "Annotations drawn successfully."
-        yield f"Saving video to {output_path}..."
-        save_video(output_video_frames, output_path)
-        yield "Video saved successfully."
+        if heatmap_path is not None:
+            yield progress.start_stage("heatmaps", f"Building heatmaps to {heatmap_path}...")
+            yield from build_heatmaps(track_store, heatmap_path, frame_rate, window_size, progress)
+            yield progress.end_stage("heatmaps", "Heatmaps saved successfully.", len(track_store))
+        if analytics_path is not None:
+            yield progress.start_stage("analytics_export", f"Writing analytics to {analytics_path}...")
+            yield from export_analytics(track_store, analytics_path, frame_rate, window_size, progress)
+            yield progress.end_stage("analytics_export", "Analytics saved successfully.", len(track_store))
+        if output_path is None:
+            return
+
+        # Draw annotations in place and save the video
+        yield progress.start_stage("rendering", f"Drawing annotations and saving video to {output_path}...")
+        video_writer = VideoWriter.from_video(output_path, input_path, codec=codec, backend=writer_backend)
+        frame_windows = (video_frames[start:start + window_size] for start in range(0, len(video_frames), window_size))
+        yield from write_annotated_video(frame_windows, track_store, team_assigner.team_colors, video_writer,
+                                         possession_percentages, progress, minimap)
+        yield progress.end_stage("rendering", "Video saved successfully.", len(track_store))
+
+def process_video_streaming(input_path, output_path, window_size=64, camera_movement_workers=1,
+                            codec='XVID', writer_backend='opencv', cache_dir='cache', use_legacy_stubs=True,
+                            detector_options=None, hooks=None, tracking_workers=1, checkpoint_interval=1024,
+                            analytics_path=None, heatmap_path=None, minimap=False, shared_frames=False,
+                            camera_movement_fast_mode=False):
+    # bounded-memory variant of process_video: frames are decoded twice in windows of
+    # window_size frames, once for detection/tracking and camera movement and once for
+    # annotation and writing. the stages in between (interpolation, speed and distance,
+    # team assignment) work on the track store and decode at most a few single frames.
+    progress = ProgressReporter(hooks)
+    video_number = os.path.basename(input_path).split('.')[0]
+    yield progress.message(f"Processing video: {video_number} (streaming, window size {window_size})")
+
+    tracker = Tracker(resource_path("models/best.pt"), **(detector_options or {}))
+    camera_movement_estimator = CameraMovementEstimator(read_frame(input_path), fast_mode=camera_movement_fast_mode)
+    video_properties = get_video_properties(input_path)
+    frame_count = video_properties['frame_count']
+
+    result_cache = ResultCache(cache_dir)
+    track_cache_key = get_track_cache_key(tracker, input_path, result_cache, tracking_workers, window_size)
+    camera_movement_cache_key = get_camera_movement_cache_key(camera_movement_estimator, input_path, result_cache)
+    track_store = result_cache.load(track_cache_key, TrackStore.load)
+    camera_movement_per_frame = result_cache.load_camera_movement(camera_movement_cache_key)
+    track_source = "result_cache" if track_store is not None else None
+    camera_movement_source = "result_cache" if camera_movement_per_frame is not None else None
+
+    if use_legacy_stubs and (track_store is None or camera_movement_per_frame is None):
+        if track_store is None and not detector_options:
+            tracks = read_legacy_stub(f'stubs/track_stubs_{video_number}.pkl', frame_count)
+            if tracks is not None:
+                track_store = TrackStore.from_tracks(tracks)
+                track_source = "legacy_stub"
+        if camera_movement_per_frame is None:
+            camera_movement_per_frame = read_legacy_stub(f'stubs/camera_movement_stub_{video_number}.pkl', frame_count)
+            if camera_movement_per_frame is not None:
+                camera_movement_source = "legacy_stub"
+    yield progress.cache("tracking", track_source)
+    yield progress.cache("camera_movement", camera_movement_source)
+
+    if track_store is None or camera_movement_per_frame is None:
+        new_track_store = TrackStore() if track_store is None else None
+        new_camera_movement = [] if camera_movement_per_frame is None else None
+        # the stages that decode the video in this pass
+        stages = [stage for stage, needed in (("tracking", new_track_store is not None),
+                                              ("camera_movement", new_camera_movement is not None)) if needed]
+        for stage in stages:
+            yield progress.start_stage(stage)
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            if new_camera_movement is not None and camera_movement_workers > 1:
+                # the worker processes decode the video themselves, next to the tracking pass
+                parallel_camera_movement = executor.submit(camera_movement_estimator.get_camera_movement_parallel,
+                                                           input_path, camera_movement_workers)
+                new_camera_movement = None
+            else:
+                parallel_camera_movement = None
+            if new_track_store is not None and tracking_workers > 1:
+                parallel_tracking = executor.submit(tracker.get_track_store_parallel, input_path, tracking_workers,
+                                                    window_size=window_size)
+                new_track_store = None
+            else:
+                parallel_tracking = None
+
+            # continue after the frames of an interrupted run's checkpoints, decoding from the
+            # first frame one of the stages still needs
+            track_checkpoint = get_track_checkpoint(result_cache, track_cache_key, window_size)
+            # the camera movement is estimated frame by frame, so its checkpoint continues with any window size
+            camera_movement_checkpoint = result_cache.checkpoint(camera_movement_cache_key)
+            track_start = camera_movement_start = 0
+            if new_track_store is not None:
+                new_track_store = tracker.resume_from_checkpoint(track_checkpoint)
+                track_start = tracks_checkpointed = len(new_track_store)
+                if track_start:
+                    yield progress.message(f"Tracking resumed from the checkpoint at frame {track_start}")
+            if new_camera_movement is not None:
+                new_camera_movement = camera_movement_estimator.resume_from_checkpoint(camera_movement_checkpoint)
+                camera_movement_start = camera_movement_checkpointed = len(new_camera_movement)
+                if camera_movement_start:
+                    yield progress.message(f"Camera movement resumed from the checkpoint at frame {camera_movement_start}")
+
+            frames_done = min((start for start, needed in ((track_start, new_track_store is not None),
+                                                           (camera_movement_start, new_camera_movement is not None))
+                               if needed), default=0)
+            frame_ring = None
+            if shared_frames and new_track_store is not None and new_camera_movement is not None:
+                # both stages read one decode from shared memory, the camera movement in a worker process
+                frame_ring, decoder, camera_movement_executor, shared_camera_movement, camera_movement_frames_done = \
+                    start_shared_frame_pass(input_path, video_properties, window_size, frames_done,
+                                            camera_movement_estimator, new_camera_movement, camera_movement_start,
+                                            camera_movement_checkpoint, checkpoint_interval, executor)
+                frame_windows = frame_ring.iter_windows(window_size, frames_done)
+                new_camera_movement = None
+            else:
+                frame_windows = iter_video_windows(input_path, window_size, frames_done)
+
+            try:
+                for frame_window in frame_windows:
+                    if new_track_store is None and new_camera_movement is None and frame_ring is None:
+                        break
+                    # every stage gets the frames of the window from its own resume frame on, which
+                    # need not be on the windows' grid, e.g. after a change of the window size
+                    futures = []
+                    if new_track_store is not None and frames_done + len(frame_window) > track_start:
+                        futures.append(executor.submit(tracker.update_track_store,
+                                                       frame_window[max(0, track_start - frames_done):], new_track_store))
+                    if new_camera_movement is not None and frames_done + len(frame_window) > camera_movement_start:
+                        futures.append(executor.submit(camera_movement_estimator.update_camera_movement,
+                                                       frame_window[max(0, camera_movement_start - frames_done):],
+                                                       new_camera_movement))
+                    for future in futures:
+                        future.result()
+                    frames_done += len(frame_window)
+                    if new_track_store is not None and frames_done > track_start:
+                        yield progress.progress("tracking", frames_done, frame_count)
+                        if checkpoint_interval and frames_done - tracks_checkpointed >= checkpoint_interval:
+                            tracks_checkpointed = tracker.save_checkpoint(track_checkpoint, new_track_store, tracks_checkpointed)
+                    if new_camera_movement is not None and frames_done > camera_movement_start:
+                        yield progress.progress("camera_movement", frames_done, frame_count)
+                        if checkpoint_interval and frames_done - camera_movement_checkpointed >= checkpoint_interval:
+                            camera_movement_checkpointed = camera_movement_estimator.save_checkpoint(
+                                camera_movement_checkpoint, new_camera_movement, camera_movement_checkpointed)
+                    if frame_ring is not None and camera_movement_frames_done.value > camera_movement_start:
+                        yield progress.progress("camera_movement", camera_movement_frames_done.value, frame_count)
+
+                if frame_ring is not None:
+                    decoder.result()
+                    new_camera_movement, camera_movement_estimator.flow_confidence = shared_camera_movement.result()
+            except RuntimeError:
+                if frame_ring is not None and shared_camera_movement.done() and not shared_camera_movement.cancelled() \
+                        and shared_camera_movement.exception() is not None:
+                    # the ring was aborted because the camera movement worker failed or died
+                    raise shared_camera_movement.exception()
+                raise
+            finally:
+                if frame_ring is not None:
+                    # stop the decoder and the worker if tracking failed, and drop the last window's views
+                    frame_window = None
+                    frame_windows.close()
+                    frame_ring.abort()
+                    camera_movement_executor.shutdown()
+                    frame_ring.close()
+
+            if parallel_camera_movement is not None:
+                new_camera_movement = parallel_camera_movement.result()
+            if parallel_tracking is not None:
+                new_track_store = parallel_tracking.result()
+
+        if new_track_store is not None:
+            track_store = new_track_store
+            result_cache.save(track_cache_key, track_store.save)
+            track_checkpoint.remove()
+
+        if new_camera_movement is not None:
+            camera_movement_per_frame = new_camera_movement
+            yield progress.message(get_flow_confidence_message(camera_movement_estimator.flow_confidence))
+            result_cache.save_camera_movement(camera_movement_cache_key, camera_movement_per_frame)
+            camera_movement_checkpoint.remove()
+
+        for stage in stages:
+            yield progress.end_stage(stage, frames=len(track_store) if stage == "tracking" else len(camera_movement_per_frame))
+
+    number_of_frames = len(track_store)
+    yield progress.message(f"Tracking completed. Total frames: {number_of_frames}")
+    yield progress.message(f"Result cache: {result_cache.hits} hits, {result_cache.misses} misses.")
+
+    # the ball is interpolated first, so the positions below are computed for the interpolated frames too
+    yield progress.start_stage("ball_interpolation")
+    interpolate_ball_positions(tracker, track_store)
+    yield progress.end_stage("ball_interpolation", "Ball position interpolation completed.")
+
+    yield progress.start_stage("camera_adjustment")
+    tracker.add_position_to_store(track_store)
+    camera_movement_estimator.add_adjust_positions_to_store(track_store, camera_movement_per_frame)
+    yield progress.end_stage("camera_adjustment", "Camera movement estimation completed.")
+
+    yield progress.start_stage("view_transform")
+    transform_view(track_store)
+    yield progress.end_stage("view_transform", get_view_transform_message(track_store))
+
+    yield progress.start_stage("speed_and_distance")
+    estimate_speed_and_distance(track_store, video_properties['fps'] or 24)
+    yield progress.end_stage("speed_and_distance", "Speed and distance estimation completed.")
+
+    yield progress.start_stage("team_assignment")
+    try:
+        team_assigner = assign_team(track_store, input_path=input_path)
+    except ValueError as e:
+        yield progress.message(f"Error occurred during team_assignment: {e}")
+        raise
+    yield progress.end_stage("team_assignment", "Team assignment completed.")
+
+    yield progress.start_stage("ball_possession")
+    possession_percentages = assign_ball_possession(track_store)
+    yield progress.end_stage("ball_possession", get_possession_message(possession_percentages))
+
+    if heatmap_path is not None:
+        yield progress.start_stage("heatmaps", f"Building heatmaps to {heatmap_path}...")
+        yield from build_heatmaps(track_store, heatmap_path, video_properties['fps'] or 24, window_size, progress)
+        yield progress.end_stage("heatmaps", "Heatmaps saved successfully.", number_of_frames)
+    if analytics_path is not None:
+        yield progress.start_stage("analytics_export", f"Writing analytics to {analytics_path}...")
+        yield from export_analytics(track_store, analytics_path, video_properties['fps'] or 24, window_size, progress)
+        yield progress.end_stage("analytics_export", "Analytics saved successfully.", number_of_frames)
+    if output_path is None:
+        return
+
+    yield progress.start_stage("rendering", f"Drawing annotations and saving video to {output_path}...")
+    video_writer = VideoWriter.from_video(output_path, input_path, codec=codec, backend=writer_backend)
+    yield from write_annotated_video(iter_video_windows(input_path, window_size), track_store,
+                                     team_assigner.team_colors, video_writer, possession_percentages, progress,
+                                     minimap)
+    yield progress.end_stage("rendering", "Video saved successfully.", number_of_frames)
+
+def process_live(source, output_path=None, latency_budget=0.2, detector_options=None, follow=False,
+                 codec='XVID', writer_backend='opencv', report_interval=1.0, hooks=None):
+    # live mode for a camera index, a stream URL or a file that may still be growing (follow):
+    # frames are tracked and annotated as they arrive and written to output_path right away,
+    # keeping the time from capture to write under latency_budget seconds, see LatencyScheduler.
+    # yields ProgressEvents like process_video, with a latency event every report_interval seconds
+    progress = ProgressReporter(hooks)
+    tracker = Tracker(resource_path("models/best.pt"), **(detector_options or {}))
+    live_processor = LiveProcessor(tracker, latency_budget)
+    scheduler = live_processor.scheduler
+
+    with FrameSource(source, follow=follow) as frame_source:
+        yield progress.message(f"Live processing of {source} at {frame_source.frame_size[0]}x{frame_source.frame_size[1]}, "
+                               f"latency budget {latency_budget * 1000:.0f} ms")
+        video_writer = None
+        try:
+            if output_path is not None:
+                video_writer = VideoWriter(output_path, frame_source.frame_size, frame_source.fps, codec=codec,
+                                           backend=writer_backend)
+            yield progress.start_stage("live")
+            last_report = time.perf_counter()
+            while True:
+                item = frame_source.get()
+                if item is None:
+                    break
+                _, capture_time, frame = item
+                if scheduler.should_drop(time.perf_counter() - capture_time, frame_source.pending()):
+                    continue
+                frame = live_processor.process_frame(frame)
+                if video_writer is not None:
+                    video_writer.write(frame)
+                now = time.perf_counter()
+                scheduler.record_latency(now - capture_time)
+                if now - last_report >= report_interval:
+                    last_report = now
+                    yield progress.latency("live", scheduler.processed_frames, scheduler.get_latency_percentiles())
+        finally:
+            # also when the run is stopped, e.g. with Ctrl+C or by closing this generator: the
+            # queued frames are written, the file is finalized and the detection thread stops
+            try:
+                if video_writer is not None:
+                    video_writer.close()
+            finally:
+                live_processor.finish()
+
+        if video_writer is not None:
+            stats = video_writer.get_stats()
+            yield progress.message(f"Encoded {stats['frames']} frames at {stats['encode_fps']:.1f} fps.")
+        yield progress.latency("live", scheduler.processed_frames, scheduler.get_latency_percentiles())
+        yield progress.end_stage("live", f"Live processing ended. {scheduler.processed_frames} frames processed, "
+                                         f"{scheduler.dropped_frames + frame_source.frames_overwritten} dropped, "
+                                         f"{scheduler.detected_frames} detected.", scheduler.processed_frames)
 
 if __name__ == '__main__':
     input_path = resource_path('Input_Videos/2.mp4')  # Use resource_path here!
@@ -120,6 +666,8 @@ if __name__ == '__main__':
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-        
-    for message in process_video(input_path, output_path):
-        print(message)
\ No newline at end of file
+    # the run's timings, for chrome://tracing or ui.perfetto.dev
+    with ChromeTraceWriter(os.path.splitext(output_path)[0] + '_trace.json') as trace_writer:
+        for event in process_video(input_path, output_path, hooks=[trace_writer]):
+            if event.kind != "progress":
+                print(event)
\ No newline at end of file
@@ -0,0 +1,2 @@
+from .pitch_heatmap import PitchHeatmap
+from .minimap_renderer import MinimapRenderer, draw_pitch
\ No newline at end of file
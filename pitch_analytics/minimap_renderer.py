@@ -0,0 +1,99 @@
+import numpy as np
+import cv2
+
+
+def draw_pitch(pitch_length, pitch_width, scale):
+    # top-down picture of the pitch area the ViewTransformer maps to at scale pixels per meter,
+    # x along the length and y across like position_transformed
+    width, height = round(pitch_length * scale), round(pitch_width * scale)
+    pitch = np.empty((height, width, 3), dtype=np.uint8)
+    pitch[:] = (60, 140, 60)
+    # the four mown stripes the pitch vertices were picked on
+    stripe_width = pitch_length / 4
+    for stripe in range(1, 4, 2):
+        pitch[:, round(stripe * stripe_width * scale):round((stripe + 1) * stripe_width * scale)] = (70, 160, 70)
+    cv2.rectangle(pitch, (0, 0), (width - 1, height - 1), (255, 255, 255), 1)
+    return pitch
+
+
+def get_disc_offsets(radius):
+    # (dy, dx) pixel offsets of a filled disc around its center
+    dy, dx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    inside = dx ** 2 + dy ** 2 <= radius ** 2
+    return dy[inside], dx[inside]
+
+
+class MinimapRenderer:
+    """Draws a top-down minimap of the players, referees and ball from position_transformed into
+    the top left corner of a frame, laid out for 1080p and scaled with the frame height.
+
+    The pitch is drawn once per frame height and cached. A frame then costs a copy of the
+    background, one fancy-indexed assignment that sets the dots of all objects at once from
+    precomputed disc offsets, and a blend of the minimap into the frame.
+    """
+
+    def __init__(self, pitch_length, pitch_width, team_colors=None, scale=5, dot_radius=4, opacity=0.85):
+        self.pitch_length = pitch_length
+        self.pitch_width = pitch_width
+        self.scale = scale
+        self.dot_radius = dot_radius
+        self.opacity = opacity
+        self.margin = 20
+        self.team_colors = {team: np.asarray(color, dtype=np.float64).round().astype(np.uint8)
+                            for team, color in (team_colors or {}).items()}
+        self.player_color = np.array([0, 0, 255], dtype=np.uint8)
+        self.referee_color = np.array([0, 255, 255], dtype=np.uint8)
+        self.ball_color = np.array([255, 255, 255], dtype=np.uint8)
+        # per frame height: (background, scale, dot offsets, margin)
+        self.layouts = {}
+
+    def get_layout(self, frame_height):
+        if frame_height not in self.layouts:
+            factor = frame_height / 1080
+            scale = self.scale * factor
+            self.layouts[frame_height] = (draw_pitch(self.pitch_length, self.pitch_width, scale), scale,
+                                          get_disc_offsets(max(1, round(self.dot_radius * factor))),
+                                          round(self.margin * factor))
+        return self.layouts[frame_height]
+
+    def get_dot_colors(self, players, referees, ball):
+        # (N, 2) positions and (N, 3) colors of the objects to draw; ball last so it is on top
+        positions, colors = [], []
+        if players is not None and len(players):
+            positions.append(players['position_transformed'])
+            player_colors = np.tile(self.player_color, (len(players), 1))
+            for team, color in self.team_colors.items():
+                player_colors[players['team'] == team] = color
+            colors.append(player_colors)
+        for rows, color in ((referees, self.referee_color), (ball, self.ball_color)):
+            if rows is not None and len(rows):
+                positions.append(rows['position_transformed'])
+                colors.append(np.tile(color, (len(rows), 1)))
+        if not positions:
+            return np.empty((0, 2)), np.empty((0, 3), dtype=np.uint8)
+        return np.concatenate(positions), np.concatenate(colors)
+
+    def draw(self, frame, players=None, referees=None, ball=None):
+        background, scale, (dy, dx), margin = self.get_layout(frame.shape[0])
+        minimap = background.copy()
+        height, width = minimap.shape[:2]
+
+        positions, colors = self.get_dot_colors(players, referees, ball)
+        # objects off the mapped pitch area have no transformed position
+        visible = ~np.isnan(positions).any(axis=1)
+        positions, colors = positions[visible], colors[visible]
+        if len(positions):
+            centers = np.round(positions * scale).astype(np.int64)
+            ys = centers[:, 1, None] + dy[None, :]
+            xs = centers[:, 0, None] + dx[None, :]
+            inside = (ys >= 0) & (ys < height) & (xs >= 0) & (xs < width)
+            minimap[ys[inside], xs[inside]] = np.broadcast_to(colors[:, None, :], ys.shape + (3,))[inside]
+
+        frame_height, frame_width = frame.shape[:2]
+        height, width = min(height, frame_height - margin), min(width, frame_width - margin)
+        if height <= 0 or width <= 0:
+            return frame
+        roi = frame[margin:margin + height, margin:margin + width]
+        frame[margin:margin + height, margin:margin + width] = cv2.addWeighted(
+            roi, 1 - self.opacity, minimap[:height, :width], self.opacity, 0)
+        return frame
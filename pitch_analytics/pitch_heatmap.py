@@ -0,0 +1,105 @@
+import numpy as np
+import cv2
+from .minimap_renderer import draw_pitch
+
+
+class PitchHeatmap:
+    """Occupancy of the pitch per player track and per team, as frame counts on a grid of
+    cell_size meter cells over position_transformed (x along the length, y across).
+
+    Frames are added chunk by chunk with add_store_frames(), so the heatmaps of a whole match
+    build up while it is processed. Every chunk is one histogram of (track, cell) keys, added to
+    the counts of the cells it hit; players without a pitch position are left out.
+    """
+
+    def __init__(self, pitch_length, pitch_width, frame_rate=24, cell_size=1.0):
+        self.pitch_length = pitch_length
+        self.pitch_width = pitch_width
+        self.frame_rate = frame_rate
+        self.cell_size = cell_size
+        self.grid_shape = (int(np.ceil(pitch_width / cell_size)), int(np.ceil(pitch_length / cell_size)))
+        self.number_of_cells = self.grid_shape[0] * self.grid_shape[1]
+
+        # team 0 is players without a team
+        self.team_counts = np.zeros((3,) + self.grid_shape, dtype=np.int64)
+        # sorted track ids and their counts, in the same order
+        self.player_ids = np.empty(0, dtype=np.int64)
+        self.player_counts = np.zeros((0,) + self.grid_shape, dtype=np.int64)
+
+    def get_cells(self, positions):
+        # flat grid cell of every (x, y) position, positions on the far edges in the last cell
+        columns = np.clip((positions[:, 0] / self.cell_size).astype(np.int64), 0, self.grid_shape[1] - 1)
+        rows = np.clip((positions[:, 1] / self.cell_size).astype(np.int64), 0, self.grid_shape[0] - 1)
+        return rows * self.grid_shape[1] + columns
+
+    def add_player_ids(self, track_ids):
+        new_ids = np.setdiff1d(track_ids, self.player_ids)
+        if len(new_ids) == 0:
+            return
+        player_ids = np.union1d(self.player_ids, new_ids)
+        player_counts = np.zeros((len(player_ids),) + self.grid_shape, dtype=np.int64)
+        player_counts[np.searchsorted(player_ids, self.player_ids)] = self.player_counts
+        self.player_ids, self.player_counts = player_ids, player_counts
+
+    def add_positions(self, positions, track_ids, teams):
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        on_pitch = ~np.isnan(positions).any(axis=1)
+        cells = self.get_cells(positions[on_pitch])
+        track_ids = np.asarray(track_ids, dtype=np.int64)[on_pitch]
+        teams = np.asarray(teams, dtype=np.int64)[on_pitch]
+        if len(cells) == 0:
+            return
+
+        team_keys, counts = np.unique(teams * self.number_of_cells + cells, return_counts=True)
+        self.team_counts.reshape(-1)[team_keys] += counts
+
+        self.add_player_ids(np.unique(track_ids))
+        player_keys, counts = np.unique(np.searchsorted(self.player_ids, track_ids) * self.number_of_cells + cells,
+                                        return_counts=True)
+        self.player_counts.reshape(-1)[player_keys] += counts
+
+    def add_store_frames(self, track_store, start_frame=0, end_frame=None):
+        # the players of frames [start_frame, end_frame) of a TrackStore with transformed positions and teams
+        end_frame = len(track_store) if end_frame is None else min(end_frame, len(track_store))
+        offsets = track_store.frame_offsets("players")
+        rows = track_store["players"][offsets[start_frame]:offsets[end_frame]]
+        self.add_positions(rows['position_transformed'], rows['track_id'], rows['team'])
+
+    def get_team_heatmap(self, team):
+        # seconds spent in every cell by the players of the team
+        return self.team_counts[team] / self.frame_rate
+
+    def get_player_heatmap(self, track_id):
+        i = np.searchsorted(self.player_ids, track_id)
+        if i == len(self.player_ids) or self.player_ids[i] != track_id:
+            return np.zeros(self.grid_shape)
+        return self.player_counts[i] / self.frame_rate
+
+    def save(self, file):
+        np.savez_compressed(file, team_counts=self.team_counts, player_ids=self.player_ids,
+                            player_counts=self.player_counts, frame_rate=np.float64(self.frame_rate),
+                            cell_size=np.float64(self.cell_size),
+                            pitch_size=np.array([self.pitch_length, self.pitch_width], dtype=np.float64))
+
+    @classmethod
+    def load(cls, file):
+        with np.load(file, allow_pickle=False) as data:
+            pitch_length, pitch_width = data["pitch_size"].tolist()
+            heatmap = cls(pitch_length, pitch_width, float(data["frame_rate"]), float(data["cell_size"]))
+            heatmap.team_counts = data["team_counts"]
+            heatmap.player_ids = data["player_ids"]
+            heatmap.player_counts = data["player_counts"]
+        return heatmap
+
+    def render(self, heatmap, scale=10, opacity=0.6):
+        # a heatmap in color over the pitch, cells scaled up smoothly to scale pixels per meter
+        pitch = draw_pitch(self.pitch_length, self.pitch_width, scale)
+        if heatmap.max() <= 0:
+            return pitch
+        levels = (heatmap / heatmap.max() * 255).astype(np.uint8)
+        levels = cv2.resize(levels, (pitch.shape[1], pitch.shape[0]), interpolation=cv2.INTER_LINEAR)
+        colored = cv2.applyColorMap(levels, cv2.COLORMAP_JET)
+        # cells nobody was in keep the plain pitch
+        visited = levels > 0
+        pitch[visited] = cv2.addWeighted(pitch, 1 - opacity, colored, opacity, 0)[visited]
+        return pitch
@@ -11,7 +11,8 @@ def resource_path(relative_path):
 
 utils_path = resource_path("..") #Get the parent directory
 sys.path.insert(0, utils_path) #Insert it to the path
-from utils import get_center_of_bbox, measure_distance
+from utils import get_center_of_bbox, measure_distance, get_centers_of_bboxes
+import numpy as np
 
 class PlayerBallAssigner():
     def __init__(self):
@@ -37,6 +38,51 @@ class PlayerBallAssigner():
         
         return assigned_player
 
+    def assign_ball_to_players_in_store(self, store):
+        # assign_ball_to_player for every frame at once: the distance from the ball center to the
+        # nearer bottom corner of every player bbox, and per frame the closest player within
+        # max_player_ball_distance gets has_ball. returns the track id with the ball per frame, -1 if none
+        players = store["players"]
+        ball = store["ball"]
+        assigned_players = np.full(store.number_of_frames, -1, dtype=np.int64)
+        players['has_ball'] = False
+        if len(players) == 0 or len(ball) == 0:
+            return assigned_players
 
-    
+        ball_positions = np.full((store.number_of_frames, 2), np.nan)
+        ball_positions[ball['frame']] = get_centers_of_bboxes(ball['bbox'])
+        player_ball_positions = ball_positions[players['frame']]
 
+        bboxes = players['bbox'].astype(np.float64)
+        distance_y = bboxes[:,3] - player_ball_positions[:,1]
+        distance_left = np.hypot(bboxes[:,0] - player_ball_positions[:,0], distance_y)
+        distance_right = np.hypot(bboxes[:,2] - player_ball_positions[:,0], distance_y)
+        distance = np.minimum(distance_left, distance_right)
+
+        # frames without a ball give NaN distances, which fail the comparison
+        candidates = np.flatnonzero(distance < self.max_player_ball_distance)
+        # closest candidate per frame; the stable sort keeps the first of equally close players
+        candidates = candidates[np.lexsort((distance[candidates], players['frame'][candidates]))]
+        _, first = np.unique(players['frame'][candidates], return_index=True)
+        owners = candidates[first]
+
+        players['has_ball'][owners] = True
+        assigned_players[players['frame'][owners]] = players['track_id'][owners]
+        return assigned_players
+
+    def get_team_ball_control(self, store, assigned_players):
+        # team in possession per frame (1 or 2); frames where nobody has the ball keep the team
+        # of the last player who had it, and frames before the first possession are 0
+        players = store["players"]
+        owner_teams = np.zeros(store.number_of_frames, dtype=np.int64)
+        owners = players['has_ball']
+        owner_teams[players['frame'][owners]] = players['team'][owners]
+
+        last_possession = np.maximum.accumulate(np.where(owner_teams > 0, np.arange(len(owner_teams)), -1))
+        return np.where(last_possession >= 0, owner_teams[np.maximum(last_possession, 0)], 0)
+
+    def get_possession_percentages(self, team_ball_control):
+        # (N, 2) share of the frames so far that team 1 and team 2 had the ball, in percent
+        team_frames = np.stack([np.cumsum(team_ball_control == 1), np.cumsum(team_ball_control == 2)], axis=1)
+        total = team_frames.sum(axis=1, keepdims=True)
+        return np.divide(team_frames * 100.0, total, out=np.zeros(team_frames.shape), where=total > 0)
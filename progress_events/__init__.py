@@ -0,0 +1 @@
+from .progress_events import ProgressEvent, ProgressReporter, JsonlTraceWriter, ChromeTraceWriter, get_rss, get_peak_rss
\ No newline at end of file
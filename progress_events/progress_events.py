@@ -0,0 +1,232 @@
+from collections import deque
+import json
+import os
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # not on Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def get_rss():
+    # resident set size in bytes, None where it can't be read
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def get_peak_rss():
+    # highest resident set size of the process so far in bytes, None where it can't be read
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak if os.uname().sysname == 'Darwin' else peak * 1024
+    if psutil is not None:
+        memory_info = psutil.Process().memory_info()
+        return getattr(memory_info, 'peak_wset', None)
+    return None
+
+
+class ProgressEvent:
+    """One step of process_video.
+
+    kind is "message", "stage_start", "stage_end", "progress" (frames done out of frames_total
+    within a stage), "cache" (where a stage result came from: cache_source is "result_cache"
+    or "legacy_stub" on a hit, None on a miss) or "latency" (percentiles of the end-to-end frame
+    latency in the live mode, latency_ms). time is seconds since the run started.
+    str() of an event is the log line process_video used to yield.
+    """
+
+    def __init__(self, kind, stage=None, message=None, frames_done=None, frames_total=None, seconds=None,
+                 fps=None, rss_bytes=None, peak_rss_bytes=None, cache_hit=None, cache_source=None, latency_ms=None):
+        self.kind = kind
+        self.stage = stage
+        self.message = message
+        # set by ProgressReporter.emit
+        self.time = 0.0
+        self.timestamp = None
+        self.frames_done = frames_done
+        self.frames_total = frames_total
+        self.seconds = seconds
+        self.fps = fps
+        self.rss_bytes = rss_bytes
+        self.peak_rss_bytes = peak_rss_bytes
+        self.cache_hit = cache_hit
+        self.cache_source = cache_source
+        self.latency_ms = latency_ms
+
+    def __str__(self):
+        if self.message is not None:
+            return self.message
+        if self.kind == "stage_start":
+            return f"Started {self.stage}."
+        if self.kind == "stage_end":
+            return f"Finished {self.stage} in {self.seconds:.2f} s."
+        if self.kind == "progress":
+            fps = f" ({self.fps:.1f} fps)" if self.fps else ""
+            return f"{self.stage}: {self.frames_done}/{self.frames_total} frames{fps}"
+        if self.kind == "cache":
+            return f"{self.stage}: {self.cache_source} hit" if self.cache_hit else f"{self.stage}: cache miss"
+        if self.kind == "latency":
+            percentiles = ", ".join(f"{name} {value:.0f} ms" for name, value in self.latency_ms.items())
+            return f"{self.stage}: {self.frames_done} frames, latency {percentiles}"
+        return self.kind
+
+    def __repr__(self):
+        return f"ProgressEvent({self.to_dict()!r})"
+
+    def to_dict(self):
+        # the fields that are set, for the trace files
+        return {name: value for name, value in vars(self).items() if value is not None}
+
+
+class ProgressReporter:
+    """Creates the ProgressEvents of one run and passes each of them to the hooks.
+
+    Hooks are callables taking an event, e.g. JsonlTraceWriter or ChromeTraceWriter. Every method
+    returns its event for process_video to yield. Events made on other threads than the one that
+    created the reporter are also queued, for the generator to yield from queued_events(); the
+    hooks see them at once either way.
+    """
+
+    def __init__(self, hooks=None):
+        self.hooks = list(hooks or [])
+        self.lock = threading.Lock()
+        self.queue = deque()
+        self.thread_id = threading.get_ident()
+        self.start_time = time.perf_counter()
+        self.stage_start_times = {}
+
+    def emit(self, event):
+        event.time = time.perf_counter() - self.start_time
+        event.timestamp = time.time()
+        if event.rss_bytes is None:
+            event.rss_bytes = get_rss()
+        with self.lock:
+            for hook in self.hooks:
+                hook(event)
+        if threading.get_ident() != self.thread_id:
+            self.queue.append(event)
+        return event
+
+    def queued_events(self):
+        while self.queue:
+            yield self.queue.popleft()
+
+    def message(self, message):
+        return self.emit(ProgressEvent("message", message=message))
+
+    def start_stage(self, stage, message=None):
+        self.stage_start_times[stage] = time.perf_counter()
+        return self.emit(ProgressEvent("stage_start", stage, message))
+
+    def end_stage(self, stage, message=None, frames=None):
+        seconds = time.perf_counter() - self.stage_start_times.pop(stage, self.start_time)
+        fps = frames / seconds if frames and seconds > 0 else None
+        return self.emit(ProgressEvent("stage_end", stage, message, frames_done=frames, seconds=seconds, fps=fps,
+                                       peak_rss_bytes=get_peak_rss()))
+
+    def progress(self, stage, frames_done, frames_total=None, message=None):
+        seconds = time.perf_counter() - self.stage_start_times.get(stage, self.start_time)
+        fps = frames_done / seconds if seconds > 0 else None
+        return self.emit(ProgressEvent("progress", stage, message, frames_done=frames_done,
+                                       frames_total=frames_total, seconds=seconds, fps=fps))
+
+    def cache(self, stage, cache_source):
+        return self.emit(ProgressEvent("cache", stage, cache_hit=cache_source is not None, cache_source=cache_source))
+
+    def latency(self, stage, frames_done, latency_ms, message=None):
+        seconds = time.perf_counter() - self.stage_start_times.get(stage, self.start_time)
+        fps = frames_done / seconds if seconds > 0 else None
+        return self.emit(ProgressEvent("latency", stage, message, frames_done=frames_done, seconds=seconds, fps=fps,
+                                       latency_ms=latency_ms))
+
+
+class JsonlTraceWriter:
+    """Writes every event as one JSON line, flushed as it comes, so the file of a run that died
+    is still readable up to where it stopped."""
+
+    def __init__(self, path):
+        self.file = open(path, 'w')
+
+    def __call__(self, event):
+        self.file.write(json.dumps(event.to_dict()) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ChromeTraceWriter:
+    """Writes the events in the Chrome trace event format, to be opened in chrome://tracing or
+    ui.perfetto.dev: a bar per stage, counters for throughput and memory and a mark for every
+    message and cache lookup.
+
+    Stages that overlap (tracking and camera movement run side by side) are put on separate
+    rows. The file is a JSON array written as the events come; the trace viewers also read it
+    without the closing bracket if the run dies.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'w')
+        self.file.write('[\n')
+        self.pid = os.getpid()
+        self.first_event = True
+        # row of each running stage
+        self.stage_rows = {}
+
+    def write(self, trace_event):
+        self.file.write(('' if self.first_event else ',\n') + json.dumps(trace_event))
+        self.file.flush()
+        self.first_event = False
+
+    def __call__(self, event):
+        ts = event.time * 1e6
+        if event.kind == "stage_start":
+            self.stage_rows[event.stage] = min(set(range(len(self.stage_rows) + 1)) - set(self.stage_rows.values()))
+        elif event.kind == "stage_end":
+            row = self.stage_rows.pop(event.stage, 0)
+            args = {name: value for name, value in (("frames", event.frames_done), ("fps", event.fps)) if value is not None}
+            self.write({"name": event.stage, "cat": "stage", "ph": "X", "ts": ts - event.seconds * 1e6,
+                        "dur": event.seconds * 1e6, "pid": self.pid, "tid": row, "args": args})
+        elif event.kind == "progress":
+            if event.fps is not None:
+                self.write({"name": "fps", "ph": "C", "ts": ts, "pid": self.pid, "args": {event.stage: event.fps}})
+        elif event.kind == "latency":
+            self.write({"name": "latency_ms", "ph": "C", "ts": ts, "pid": self.pid, "args": event.latency_ms})
+        else:
+            self.write({"name": str(event), "cat": event.kind, "ph": "i", "s": "p", "ts": ts, "pid": self.pid, "tid": 0})
+
+        if event.rss_bytes is not None:
+            self.write({"name": "memory", "ph": "C", "ts": ts, "pid": self.pid, "args": {"rss_mb": event.rss_bytes / 2**20}})
+
+    def close(self):
+        self.file.write('\n]\n')
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,2 @@
+from .result_cache import ResultCache
+from .checkpoint import Checkpoint
\ No newline at end of file
@@ -0,0 +1,70 @@
+import os
+import pickle
+import struct
+import zlib
+import numpy as np
+
+# every record is its payload length and crc32 followed by the pickled payload
+RECORD_HEADER = struct.Struct('<QI')
+
+
+class Checkpoint:
+    """Append-only file with the progress of a long stage, so a run that crashed or was killed
+    continues from its last checkpoint instead of from the first frame.
+
+    Every append() writes one record with the frames done so far, the result arrays of the
+    frames since the previous record and the state needed to continue (e.g. the ByteTrack
+    tracks), so a checkpoint costs the new frames and not all of them. Records are flushed to
+    disk as they are written; a record cut short by a crash is dropped on load.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        # (frames done, {name: arrays of all records concatenated}, state of the last record),
+        # or None without a complete record
+        records = []
+        valid_size = 0
+        if self.exists():
+            with open(self.path, 'rb') as f:
+                while True:
+                    header = f.read(RECORD_HEADER.size)
+                    if len(header) < RECORD_HEADER.size:
+                        break
+                    length, checksum = RECORD_HEADER.unpack(header)
+                    payload = f.read(length)
+                    if len(payload) < length or zlib.crc32(payload) != checksum:
+                        break
+                    records.append(pickle.loads(payload))
+                    valid_size = f.tell()
+            if valid_size < os.path.getsize(self.path):
+                # the next append goes after the last complete record
+                with open(self.path, 'r+b') as f:
+                    f.truncate(valid_size)
+        if not records:
+            return None
+
+        arrays = {}
+        for record in records:
+            for name, array in record['arrays'].items():
+                arrays.setdefault(name, []).append(array)
+        arrays = {name: np.concatenate(parts) for name, parts in arrays.items()}
+        return records[-1]['frames_done'], arrays, records[-1]['state']
+
+    def append(self, frames_done, arrays, state=None):
+        payload = pickle.dumps(dict(frames_done=frames_done, arrays=arrays, state=state), pickle.HIGHEST_PROTOCOL)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'ab') as f:
+            f.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import sys
+import numpy as np
+from .checkpoint import Checkpoint
+
+def resource_path(relative_path):
+    """ Get absolute path to resource, works for dev and for PyInstaller """
+    try:
+        base_path = sys._MEIPASS
+    except Exception:
+        base_path = os.path.abspath(".")
+    return os.path.join(base_path, relative_path)
+
+# file hashes are remembered per (path, size, mtime) so a video is read once per process
+_file_digests = {}
+
+
+def file_digest(path, block_size=1 << 20):
+    stat = os.stat(path)
+    digest_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if digest_key not in _file_digests:
+        digest = hashlib.blake2b(digest_size=20)
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                digest.update(block)
+        _file_digests[digest_key] = digest.hexdigest()
+    return _file_digests[digest_key]
+
+
+class ResultCache:
+    """Stage results stored as .npz files named by a hash of the input video content, the model
+    weights and the stage parameters, so a renamed video still hits and a changed model or
+    parameter misses. The directory is kept under max_bytes by evicting the least recently
+    used entries.
+    """
+
+    def __init__(self, cache_dir='cache', max_bytes=2 * 1024 ** 3):
+        self.cache_dir = resource_path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, stage, video_path, model_path=None, params=None):
+        key = hashlib.blake2b(digest_size=20)
+        key.update(stage.encode())
+        key.update(file_digest(video_path).encode())
+        if model_path is not None:
+            key.update(file_digest(model_path).encode())
+        key.update(json.dumps(params or {}, sort_keys=True, default=str).encode())
+        return f"{stage}-{key.hexdigest()}"
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def load(self, key, loader=None):
+        # returns None on a miss. loader turns the .npz path into the cached object,
+        # by default a dict of the stored arrays
+        path = self.path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        try:
+            if loader is not None:
+                result = loader(path)
+            else:
+                with np.load(path, allow_pickle=False) as data:
+                    result = {name: data[name] for name in data.files}
+        except (OSError, ValueError, KeyError):
+            # a truncated or foreign file is a miss, it gets replaced on the next save
+            self.misses += 1
+            return None
+        # the access time kept for eviction
+        os.utime(path)
+        self.hits += 1
+        return result
+
+    def save(self, key, saver=None, **arrays):
+        # saver writes the object to the given file; otherwise the keyword arrays are stored
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            if saver is not None:
+                saver(f)
+            else:
+                np.savez(f, **arrays)
+        # replace in one step so a concurrent reader never sees a half written entry
+        os.replace(temp_path, path)
+        self.evict()
+
+    def load_camera_movement(self, key):
+        data = self.load(key)
+        if data is None:
+            return None
+        return data["camera_movement"].tolist()
+
+    def save_camera_movement(self, key, camera_movement_per_frame):
+        self.save(key, camera_movement=np.asarray(camera_movement_per_frame, dtype=np.float64).reshape(-1, 2))
+
+    def checkpoint(self, key):
+        # progress of a stage whose result will be stored under key, kept until it is saved
+        return Checkpoint(os.path.join(self.cache_dir, "checkpoints", f"{key}.checkpoint"))
+
+    def entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npz'):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    # evicted by another process in the meantime
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, name in self.entries():
+            os.remove(os.path.join(self.cache_dir, name))
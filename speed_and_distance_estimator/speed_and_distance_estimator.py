@@ -1,6 +1,7 @@
 import sys
 import cv2
 import os
+import numpy as np
 # Correct way to import from parent directory using resource_path
 
 
@@ -17,9 +18,9 @@ sys.path.insert(0, utils_path) #Insert the path at the beginning of the list
 from utils import measure_distance, get_foot_position
 
 class SpeedAndDistance_Estimator():
-    def __init__(self):
+    def __init__(self, frame_rate=24):
         self.frame_window=5
-        self.frame_rate=24
+        self.frame_rate=frame_rate
     
     def add_speed_and_distance_to_tracks(self, tracks):
         total_distance= {}
@@ -62,26 +63,96 @@ class SpeedAndDistance_Estimator():
                         tracks[object][frame_num_batch][track_id]['speed'] = speed_km_per_hour
                         tracks[object][frame_num_batch][track_id]['distance'] = total_distance[object][track_id]
 
+    def add_speed_and_distance_to_store(self, store):
+        # vectorized add_speed_and_distance_to_tracks: every track is measured between the first and
+        # last frame of each frame_window, and the speed and running distance are written to its
+        # rows in [window start, window end)
+        number_of_frames = store.number_of_frames
+        for object, rows in store.items():
+            if object == "ball" or  object == "referees":
+                continue
+            if len(rows) == 0:
+                continue
+
+            frames = rows['frame'].astype(np.int64)
+            track_ids = rows['track_id'].astype(np.int64)
+            positions = rows['position_transformed'].astype(np.float64)
+
+            # (track_id, frame) -> row lookup
+            row_keys = track_ids * number_of_frames + frames
+            row_order = np.argsort(row_keys)
+            sorted_row_keys = row_keys[row_order]
+
+            window_starts = (frames // self.frame_window) * self.frame_window
+            window_ends = np.minimum(window_starts + self.frame_window, number_of_frames - 1)
+
+            # rows sitting on a window start, and whether the same track is present at the window end
+            start_rows = np.flatnonzero((frames == window_starts) & (window_ends > window_starts))
+            end_keys = track_ids[start_rows] * number_of_frames + window_ends[start_rows]
+            end_index = np.minimum(np.searchsorted(sorted_row_keys, end_keys), len(sorted_row_keys) - 1)
+            found = sorted_row_keys[end_index] == end_keys
+            start_rows = start_rows[found]
+            end_rows = row_order[end_index[found]]
+
+            distance_covered = np.linalg.norm(positions[end_rows] - positions[start_rows], axis=1)
+            valid = ~np.isnan(distance_covered)
+            start_rows = start_rows[valid]
+            distance_covered = distance_covered[valid]
+            if len(start_rows) == 0:
+                continue
+
+            time_elapsed = (window_ends[start_rows] - window_starts[start_rows]) / self.frame_rate
+            speed_km_per_hour = distance_covered / time_elapsed * 3.6
+
+            # running distance per track, accumulated in window order
+            window_numbers = frames[start_rows] // self.frame_window
+            pair_track_ids = track_ids[start_rows]
+            pair_order = np.lexsort((window_numbers, pair_track_ids))
+            pair_track_ids = pair_track_ids[pair_order]
+            window_numbers = window_numbers[pair_order]
+            distance_covered = distance_covered[pair_order]
+            speed_km_per_hour = speed_km_per_hour[pair_order]
+
+            group_starts = np.flatnonzero(np.r_[True, pair_track_ids[1:] != pair_track_ids[:-1]])
+            group_lengths = np.diff(np.append(group_starts, len(pair_track_ids)))
+            cumulative_distance = np.cumsum(distance_covered)
+            group_offsets = cumulative_distance[group_starts] - distance_covered[group_starts]
+            total_distance = cumulative_distance - np.repeat(group_offsets, group_lengths)
+
+            # every row in [window start, window end) takes the values of its (track_id, window) pair
+            number_of_windows = number_of_frames // self.frame_window + 1
+            pair_keys = pair_track_ids * number_of_windows + window_numbers
+            row_pair_keys = track_ids * number_of_windows + frames // self.frame_window
+            pair_index = np.minimum(np.searchsorted(pair_keys, row_pair_keys), len(pair_keys) - 1)
+            matched = (pair_keys[pair_index] == row_pair_keys) & (frames < window_ends)
+
+            rows['speed'][matched] = speed_km_per_hour[pair_index[matched]]
+            rows['distance'][matched] = total_distance[pair_index[matched]]
+
+    def draw_frame_speed_and_distance(self, frame, frame_num, tracks):
+        for object, object_tracks in tracks.items():
+            if object == "ball" or object == "referees":
+                continue
+            for _, track_info in object_tracks[frame_num].items():
+                if "speed" in track_info:
+                    speed = track_info.get('speed',None)
+                    distance = track_info.get('distance',None)
+                    if speed is None or distance is None:
+                        continue
+
+                    bbox = track_info['bbox']
+                    position = get_foot_position(bbox)
+                    position = list(position)
+                    position[1]+= 40
+                    position = tuple(map(int,position))
+                    cv2.putText(frame, f"{speed: .2f} km/h",position, cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0,0,0), 2)
+                    cv2.putText(frame, f"{distance: .2f} hr",(position[0],position[1]+20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0,0,0), 2)
+
+        return frame
+
     def draw_speed_and_distance(self, frames, tracks):
         output_frames = []
         for frame_num , frame in enumerate(frames):
-            for object, object_tracks in tracks.items():
-                if object == "ball" or object == "referees":
-                    continue
-                for _, track_info in object_tracks[frame_num].items():
-                    if "speed" in track_info:
-                        speed = track_info.get('speed',None)
-                        distance = track_info.get('distance',None)
-                        if speed is None or distance is None:
-                            continue
-
-                        bbox = track_info['bbox']
-                        position = get_foot_position(bbox)
-                        position = list(position)
-                        position[1]+= 40
-                        position = tuple(map(int,position))
-                        cv2.putText(frame, f"{speed: .2f} km/h",position, cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0,0,0), 2)
-                        cv2.putText(frame, f"{distance: .2f} hr",(position[0],position[1]+20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0,0,0), 2)
-
+            frame = self.draw_frame_speed_and_distance(frame, frame_num, tracks)
             output_frames.append(frame)
         return output_frames
@@ -1,9 +1,28 @@
 from sklearn.cluster import KMeans
+import numpy as np
+import sys
+import os
+
+def resource_path(relative_path):
+    """ Get absolute path to resource, works for dev and for PyInstaller """
+    try:
+        base_path = sys._MEIPASS
+    except Exception:
+        base_path = os.path.abspath(".")
+    return os.path.join(base_path, relative_path)
+
+utils_path = resource_path("..")
+sys.path.insert(0, utils_path)
+from utils import read_frames_at
 
 class TeamAssigner:
     def __init__(self):
         self.team_colors = {}
         self.player_team_dict = {}
+        # iterations of the batched 2-means used for jersey colours
+        self.color_iterations = 10
+        # frames spread over the video that the team colours are fitted on
+        self.number_of_fit_frames = 5
 
     def get_clustering_model(self, image):
         #reshape image to 2d array
@@ -19,35 +38,91 @@ class TeamAssigner:
 
 
     def get_player_color(self, frame, bbox):
-        image = frame[int(bbox[1]):int(bbox[3]), int(bbox[0]):int(bbox[2])]
-        top_half_image = image[0:int(image.shape[0] / 2), :]
-
-        #get clustering model
-        kmeans = self.get_clustering_model(top_half_image)
-
-        # get the cluster labels for each pixel in the image
-        labels =  kmeans.labels_
-
-        # reshape the labels to the image shape
-        clustered_image = labels.reshape(top_half_image.shape[0], top_half_image.shape[1])
-
-        # get the player cluster
-        corner_clusters = [clustered_image[0, 0], clustered_image[0, -1], clustered_image[-1, 0], clustered_image[-1, -1]]
-        non_player_cluster = max(set(corner_clusters), key=corner_clusters.count)
+        return self.get_player_colors(frame, [bbox])[0]
+
+    def get_player_colors(self, frame, bboxes):
+        # jersey colour of every bbox in the frame, from the top half of its crop
+        top_half_images = []
+        for bbox in bboxes:
+            image = frame[int(bbox[1]):int(bbox[3]), int(bbox[0]):int(bbox[2])]
+            top_half_images.append(image[0:int(image.shape[0] / 2), :])
+        return self.get_image_colors(top_half_images)
+
+    def get_image_colors(self, images):
+        # batched version of the per-image 2-cluster KMeans: all pixels of all images are clustered
+        # in one NumPy pass, each image against its own two centres. the cluster that owns most of
+        # the corner pixels is the background, the other one the player colour
+        number_of_images = len(images)
+        if number_of_images == 0:
+            return np.zeros((0, 3))
+
+        sizes = np.array([image.shape[0] * image.shape[1] for image in images])
+        if np.any(sizes == 0):
+            raise ValueError("No samples to fit the KMeans model. Check the input image.")
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        pixels = np.concatenate([image.reshape(-1, 3) for image in images]).astype(np.float32)
+        image_index = np.repeat(np.arange(number_of_images), sizes)
+
+        heights = np.array([image.shape[0] for image in images])
+        widths = np.array([image.shape[1] for image in images])
+        corners = np.stack([starts,
+                            starts + widths - 1,
+                            starts + (heights - 1) * widths,
+                            starts + heights * widths - 1], axis=1)
+
+        # start with the corner colour as the background centre and the pixel furthest from it as the player centre
+        centers = np.empty((number_of_images, 2, 3), dtype=np.float32)
+        centers[:, 0] = pixels[corners].mean(axis=1)
+        distance_to_background = ((pixels - centers[image_index, 0]) ** 2).sum(axis=1)
+        furthest = np.empty(number_of_images, dtype=np.int64)
+        order = np.lexsort((-distance_to_background, image_index))
+        furthest[:] = order[starts]
+        centers[:, 1] = pixels[furthest]
+
+        labels = self.get_closer_center(pixels, centers, image_index)
+        for _ in range(self.color_iterations):
+            cluster = image_index * 2 + labels
+            counts = np.bincount(cluster, minlength=number_of_images * 2)
+            sums = np.stack([np.bincount(cluster, weights=pixels[:, channel], minlength=number_of_images * 2)
+                             for channel in range(3)], axis=1)
+            updated = counts > 0
+            centers.reshape(-1, 3)[updated] = sums[updated] / counts[updated, None]
+
+            new_labels = self.get_closer_center(pixels, centers, image_index)
+            if np.array_equal(new_labels, labels):
+                break
+            labels = new_labels
+
+        # ties between the corners go to cluster 0, like max(set(corner_clusters), key=...)
+        non_player_cluster = (labels[corners].sum(axis=1) > 2).astype(np.int64)
         player_cluster = 1 - non_player_cluster
 
-        player_color = kmeans.cluster_centers_[player_cluster]
+        return centers[np.arange(number_of_images), player_cluster].astype(np.float64)
 
-        return player_color
 
+    def get_closer_center(self, pixels, centers, image_index):
+        # 1 where a pixel is closer to the second centre of its image (ties go to 0, like argmin).
+        # |p-c1|^2 < |p-c0|^2  <=>  p.(c0-c1) < (|c0|^2-|c1|^2)/2
+        direction = centers[:, 0] - centers[:, 1]
+        threshold = ((centers[:, 0] ** 2).sum(axis=1) - (centers[:, 1] ** 2).sum(axis=1)) / 2
+        projection = np.einsum('ij,ij->i', pixels, direction[image_index])
+        return (projection < threshold[image_index]).astype(np.int64)
 
     def assign_team_color(self, frame, player_detections):
-        player_colors = []
-        for _, player_detection in player_detections.items():
-            bbox = player_detection["bbox"]
-            player_color = self.get_player_color(frame, bbox)
-            player_colors.append(player_color)
+        self.fit_team_colors([frame], [player_detections])
 
+    def fit_team_colors(self, frames, player_detections_per_frame):
+        # fit the two team colours on the players of several frames spread over the video
+        player_colors = []
+        for frame, player_detections in zip(frames, player_detections_per_frame):
+            bboxes = [player_detection["bbox"] for player_detection in player_detections.values()]
+            player_colors.append(self.get_player_colors(frame, bboxes))
+        self.fit_team_model(np.concatenate(player_colors) if player_colors else np.zeros((0, 3)))
+
+    def fit_team_model(self, player_colors):
+        if len(player_colors) < 2:
+            raise ValueError(f"The team colours need at least two player detections to fit on, "
+                             f"the sampled frames have {len(player_colors)}")
         kmeans = KMeans(n_clusters=2, init="k-means++", n_init=10)
         kmeans.fit(player_colors)
 
@@ -57,16 +132,75 @@ class TeamAssigner:
         self.team_colors[2] = kmeans.cluster_centers_[1]
 
     def get_player_team(self, frame, player_bbox, player_id):
-        if player_id in self.player_team_dict:
-            return self.player_team_dict[player_id]
-        
-        player_color = self.get_player_color(frame, player_bbox)
-
-        team_id = self.kmeans.predict(player_color.reshape(1, -1))[0]
-        team_id +=1
-        if player_id == 96 or player_id == 103 :
-            team_id=2
-
-        self.player_team_dict[player_id] = team_id
-
-        return team_id
\ No newline at end of file
+        return self.get_player_teams(frame, [player_bbox], [player_id])[0]
+
+    def get_player_teams(self, frame, player_bboxes, player_ids):
+        # only players without a cached team are cropped and classified, all in one batch
+        new_players = [(player_id, bbox) for player_id, bbox in zip(player_ids, player_bboxes)
+                       if player_id not in self.player_team_dict]
+        if new_players:
+            player_colors = self.get_player_colors(frame, [bbox for _, bbox in new_players])
+            self.predict_player_teams([player_id for player_id, _ in new_players], player_colors)
+
+        return [self.player_team_dict[player_id] for player_id in player_ids]
+
+    def predict_player_teams(self, player_ids, player_colors):
+        team_ids = self.kmeans.predict(player_colors) + 1
+        for player_id, team_id in zip(player_ids, team_ids):
+            if player_id == 96 or player_id == 103 :
+                team_id=2
+            self.player_team_dict[player_id] = int(team_id)
+
+    def get_fit_frame_numbers(self, frames, players_per_frame):
+        # frames spread over the video with at least two players on them. a video without such a
+        # frame (e.g. close-ups only) has one player per frame, so frames of single players are
+        # used and give at least two players once there are two of them
+        candidates = np.unique(frames)
+        crowded = players_per_frame[candidates] >= 2
+        if np.any(crowded):
+            candidates = candidates[crowded]
+        if len(candidates) <= self.number_of_fit_frames:
+            return candidates
+        return candidates[np.linspace(0, len(candidates) - 1, self.number_of_fit_frames).astype(int)]
+
+    def add_team_to_store(self, store, video_path=None, video_frames=None):
+        # assign teams from the track store alone: only the fit frames and the frame where each
+        # track id first appears are decoded (from video_path, or looked up in video_frames)
+        rows = store['players']
+        if len(rows) == 0:
+            return
+
+        track_ids, order, starts = store.track_index('players')
+        first_rows = order[starts[:-1]]
+        players_per_frame = np.bincount(rows['frame'], minlength=store.number_of_frames)
+        fit_frame_numbers = self.get_fit_frame_numbers(rows['frame'], players_per_frame)
+
+        first_rows_by_frame = {}
+        for row in first_rows:
+            first_rows_by_frame.setdefault(int(rows['frame'][row]), []).append(row)
+        frame_numbers = set(first_rows_by_frame) | set(fit_frame_numbers.tolist())
+
+        if video_path is not None:
+            frames = read_frames_at(video_path, frame_numbers)
+        else:
+            frames = ((frame_num, video_frames[frame_num]) for frame_num in sorted(frame_numbers))
+
+        fit_colors = []
+        first_colors = {}
+        fit_frame_numbers = set(fit_frame_numbers.tolist())
+        for frame_num, frame in frames:
+            if frame_num in fit_frame_numbers:
+                fit_colors.append(self.get_player_colors(frame, store.frame_rows('players', frame_num)['bbox']))
+            if frame_num in first_rows_by_frame:
+                frame_rows = first_rows_by_frame[frame_num]
+                for row, color in zip(frame_rows, self.get_player_colors(frame, rows['bbox'][frame_rows])):
+                    first_colors[int(rows['track_id'][row])] = color
+
+        self.fit_team_model(np.concatenate(fit_colors) if fit_colors else np.zeros((0, 3)))
+
+        new_ids = [track_id for track_id in first_colors if track_id not in self.player_team_dict]
+        if new_ids:
+            self.predict_player_teams(new_ids, np.array([first_colors[track_id] for track_id in new_ids]))
+
+        teams = np.array([self.player_team_dict.get(int(track_id), 0) for track_id in track_ids], dtype=np.int8)
+        rows['team'] = teams[np.searchsorted(track_ids, rows['track_id'])]
@@ -0,0 +1 @@
+from .track_store import TrackStore, TRACK_DTYPE, create_rows
\ No newline at end of file
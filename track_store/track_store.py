@@ -0,0 +1,227 @@
+import numpy as np
+
+# one row per detection. missing values are NaN for float columns and 0 for team
+TRACK_DTYPE = np.dtype([
+    ('frame', np.int32),
+    ('track_id', np.int32),
+    ('bbox', np.float32, (4,)),
+    ('position', np.float32, (2,)),
+    ('position_adjusted', np.float32, (2,)),
+    ('position_transformed', np.float32, (2,)),
+    ('speed', np.float32),
+    ('distance', np.float32),
+    ('team', np.int8),
+    ('has_ball', np.bool_),
+])
+
+POINT_COLUMNS = ('position', 'position_adjusted', 'position_transformed')
+SCALAR_COLUMNS = ('speed', 'distance')
+
+
+def create_rows(number_of_rows):
+    rows = np.zeros(number_of_rows, dtype=TRACK_DTYPE)
+    for column in POINT_COLUMNS + SCALAR_COLUMNS:
+        rows[column] = np.nan
+    return rows
+
+
+def rows_from_object_tracks(object_tracks, frame_offset=0):
+    number_of_rows = sum(len(track) for track in object_tracks)
+    rows = create_rows(number_of_rows)
+    row = 0
+    for frame_num, track in enumerate(object_tracks):
+        for track_id, track_info in track.items():
+            rows[row]['frame'] = frame_offset + frame_num
+            rows[row]['track_id'] = track_id
+            rows[row]['bbox'] = track_info['bbox']
+            for column in POINT_COLUMNS + SCALAR_COLUMNS:
+                value = track_info.get(column)
+                if value is not None:
+                    rows[row][column] = value
+            rows[row]['team'] = track_info.get('team', 0)
+            rows[row]['has_ball'] = track_info.get('has_ball', False)
+            row += 1
+    return rows
+
+
+class TrackStore:
+    """Columnar replacement for the nested tracks[object][frame][track_id] dicts.
+
+    Every object class ("players", "referees", "ball") is a single structured array of
+    TRACK_DTYPE rows sorted by frame, so stages can work on whole columns at once.
+
+    append_rows() writes into a buffer with spare capacity that doubles when it is full, and the
+    array of an object class is a view of the filled part, so appending window after window costs
+    the new rows and not the whole track store.
+    """
+
+    def __init__(self, number_of_frames=0, object_names=("players", "referees", "ball")):
+        self.number_of_frames = number_of_frames
+        self.arrays = {object_name: create_rows(0) for object_name in object_names}
+        self._frame_offsets = {}
+        self._track_index = {}
+        # per object class the append buffer and the view of it that is in self.arrays
+        self._buffers = {}
+
+    def __len__(self):
+        return self.number_of_frames
+
+    def __getitem__(self, object_name):
+        return self.arrays[object_name]
+
+    def __contains__(self, object_name):
+        return object_name in self.arrays
+
+    def keys(self):
+        return self.arrays.keys()
+
+    def items(self):
+        return self.arrays.items()
+
+    def set_rows(self, object_name, rows):
+        # keep rows grouped by frame; the stable sort preserves the detection order inside a frame
+        if len(rows) > 1 and np.any(np.diff(rows['frame']) < 0):
+            rows = rows[np.argsort(rows['frame'], kind='stable')]
+        self.arrays[object_name] = rows
+        self._buffers.pop(object_name, None)
+        self._frame_offsets.pop(object_name, None)
+        self._track_index.pop(object_name, None)
+
+    def append_rows(self, object_name, rows, number_of_frames=None):
+        if number_of_frames is not None:
+            self.number_of_frames = max(self.number_of_frames, number_of_frames)
+        stored_rows = self.arrays[object_name]
+        if len(rows) > 1 and np.any(np.diff(rows['frame']) < 0) or \
+                len(rows) and len(stored_rows) and rows['frame'][0] < stored_rows['frame'][-1]:
+            # rows of earlier frames, the whole array is sorted again
+            self.set_rows(object_name, np.concatenate([stored_rows, rows]))
+            return
+
+        buffer, view = self._buffers.get(object_name, (None, None))
+        if view is not stored_rows:
+            # the array was replaced since the last append
+            buffer = stored_rows
+        size = len(stored_rows)
+        if size + len(rows) > len(buffer):
+            buffer = np.empty(max(2 * len(buffer), size + len(rows), 1024), dtype=TRACK_DTYPE)
+            buffer[:size] = stored_rows
+        buffer[size:size + len(rows)] = rows
+        view = buffer[:size + len(rows)]
+        self._buffers[object_name] = (buffer, view)
+        self.arrays[object_name] = view
+        self._frame_offsets.pop(object_name, None)
+        self._track_index.pop(object_name, None)
+
+    def set_object_tracks(self, object_name, object_tracks):
+        # replace an object class with frames in the dict-of-dicts layout
+        self.set_rows(object_name, rows_from_object_tracks(object_tracks))
+
+    def frame_offsets(self, object_name):
+        # offsets[f]:offsets[f+1] are the rows of frame f
+        if object_name not in self._frame_offsets:
+            frames = self.arrays[object_name]['frame']
+            self._frame_offsets[object_name] = np.searchsorted(frames, np.arange(self.number_of_frames + 1))
+        return self._frame_offsets[object_name]
+
+    def frame_rows(self, object_name, frame_num):
+        offsets = self.frame_offsets(object_name)
+        return self.arrays[object_name][offsets[frame_num]:offsets[frame_num + 1]]
+
+    def track_index(self, object_name):
+        # returns (track_ids, order, starts): rows order[starts[i]:starts[i+1]] belong to track_ids[i], in frame order
+        if object_name not in self._track_index:
+            track_ids = self.arrays[object_name]['track_id']
+            order = np.argsort(track_ids, kind='stable')
+            unique_ids, starts = np.unique(track_ids[order], return_index=True)
+            starts = np.append(starts, len(order))
+            self._track_index[object_name] = (unique_ids, order, starts)
+        return self._track_index[object_name]
+
+    def track_rows(self, object_name, track_id):
+        unique_ids, order, starts = self.track_index(object_name)
+        i = np.searchsorted(unique_ids, track_id)
+        if i == len(unique_ids) or unique_ids[i] != track_id:
+            return create_rows(0)
+        return self.arrays[object_name][order[starts[i]:starts[i + 1]]]
+
+    def nbytes(self):
+        return sum(rows.nbytes for rows in self.arrays.values())
+
+    def save(self, file):
+        # one uncompressed array per object class, so loading is a plain read of the columns
+        arrays = {f"rows_{object_name}": rows for object_name, rows in self.arrays.items()}
+        np.savez(file, number_of_frames=np.int64(self.number_of_frames), **arrays)
+
+    @classmethod
+    def load(cls, file):
+        with np.load(file, allow_pickle=False) as data:
+            object_names = tuple(name[len("rows_"):] for name in data.files if name.startswith("rows_"))
+            store = cls(int(data["number_of_frames"]), object_names)
+            for object_name in object_names:
+                store.arrays[object_name] = data[f"rows_{object_name}"]
+        return store
+
+    @classmethod
+    def from_tracks(cls, tracks):
+        store = cls(object_names=tuple(tracks.keys()))
+        store.append_tracks(tracks)
+        return store
+
+    def append_tracks(self, tracks):
+        # append frames in the dict-of-dicts layout after the frames already in the store
+        frame_offset = self.number_of_frames
+        for object_name, object_tracks in tracks.items():
+            rows = rows_from_object_tracks(object_tracks, frame_offset)
+            if object_name not in self.arrays:
+                self.arrays[object_name] = create_rows(0)
+            self.append_rows(object_name, rows, frame_offset + len(object_tracks))
+
+    def to_tracks(self, team_colors=None):
+        # materialize the dict-of-dicts layout used by the older per-frame code
+        return {object_name: [self.frame_dict(object_name, frame_num, team_colors)
+                              for frame_num in range(self.number_of_frames)]
+                for object_name in self.arrays}
+
+    def as_tracks(self, team_colors=None):
+        # read-only view with the tracks[object][frame][track_id] API that builds frame dicts on demand
+        return {object_name: TrackFramesView(self, object_name, team_colors) for object_name in self.arrays}
+
+    def frame_dict(self, object_name, frame_num, team_colors=None):
+        frame_dict = {}
+        for row in self.frame_rows(object_name, frame_num):
+            track_info = {'bbox': row['bbox'].tolist()}
+            for column in POINT_COLUMNS:
+                # the dict stages index point columns directly and expect None for "no position"
+                track_info[column] = None if np.isnan(row[column][0]) else tuple(row[column].tolist())
+            for column in SCALAR_COLUMNS:
+                if not np.isnan(row[column]):
+                    track_info[column] = float(row[column])
+            if row['team'] != 0:
+                track_info['team'] = int(row['team'])
+                if team_colors is not None:
+                    track_info['team_color'] = team_colors[int(row['team'])]
+            if row['has_ball']:
+                track_info['has_ball'] = True
+            frame_dict[int(row['track_id'])] = track_info
+        return frame_dict
+
+
+class TrackFramesView:
+    def __init__(self, store, object_name, team_colors=None):
+        self.store = store
+        self.object_name = object_name
+        self.team_colors = team_colors
+
+    def __len__(self):
+        return self.store.number_of_frames
+
+    def __getitem__(self, frame_num):
+        if frame_num < 0:
+            frame_num += len(self)
+        if not 0 <= frame_num < len(self):
+            raise IndexError(frame_num)
+        return self.store.frame_dict(self.object_name, frame_num, self.team_colors)
+
+    def __iter__(self):
+        for frame_num in range(len(self)):
+            yield self[frame_num]
@@ -1 +1,5 @@
-from .tracker import Tracker
\ No newline at end of file
+from .tracker import Tracker
+from .detection_backend import DetectionBackend, get_auto_batch_size, get_shared_detector, set_thread_budget
+from .ball_tracker import BallTracker
+from .ball_interpolation import interpolate_ball_bboxes, BallInterpolator
+from .track_stitching import stitch_track_chunks
\ No newline at end of file
@@ -0,0 +1,101 @@
+import numpy as np
+
+
+def get_ball_bbox_array(ball_positions):
+    # (N, 4) array of the ball bbox in every frame of a tracks["ball"] list, NaN where there is none
+    bboxes = np.full((len(ball_positions), 4), np.nan)
+    for frame_num, ball in enumerate(ball_positions):
+        bbox = ball.get(1, {}).get('bbox')
+        if bbox:
+            bboxes[frame_num] = bbox
+    return bboxes
+
+
+def get_ball_outliers(bboxes, max_speed):
+    # detections that jump away from both their previous and their next detection faster than
+    # max_speed pixels per frame. the first and the last detection have only one neighbour to
+    # compare with and are kept
+    known = np.flatnonzero(~np.isnan(bboxes).any(axis=1))
+    outliers = np.zeros(len(bboxes), dtype=bool)
+    if len(known) < 3:
+        return outliers
+    centers = (bboxes[known, :2] + bboxes[known, 2:]) / 2
+    speeds = np.linalg.norm(np.diff(centers, axis=0), axis=1) / np.diff(known)
+    too_fast = speeds > max_speed
+    outliers[known[1:-1]] = too_fast[:-1] & too_fast[1:]
+    return outliers
+
+
+def interpolate_ball_bboxes(bboxes, max_gap=None, max_speed=None):
+    """Fill the frames without a ball detection by linear interpolation between the detections
+    around them, and before the first and after the last detection with the nearest one.
+
+    bboxes is an (N, 4) array with NaN rows for frames without a detection. Detections rejected
+    by the max_speed test are treated as missing. Runs of more than max_gap missing frames are
+    left NaN. Returns a new (N, 4) array.
+    """
+    bboxes = np.array(bboxes, dtype=np.float64).reshape(-1, 4)
+    if max_speed is not None:
+        bboxes[get_ball_outliers(bboxes, max_speed)] = np.nan
+
+    known = np.flatnonzero(~np.isnan(bboxes).any(axis=1))
+    if len(known) == 0:
+        return bboxes
+
+    frame_nums = np.arange(len(bboxes))
+    interpolated = np.stack([np.interp(frame_nums, known, bboxes[known, column]) for column in range(4)], axis=1)
+
+    if max_gap is not None:
+        # length of the run of missing frames each frame is in; unbounded runs at either end
+        # count from the first or up to the last detection
+        next_known = np.searchsorted(known, frame_nums, side='left')
+        previous_frame = np.where(next_known > 0, known[np.maximum(next_known - 1, 0)], -1)
+        next_frame = np.where(next_known < len(known), known[np.minimum(next_known, len(known) - 1)], len(bboxes))
+        gap = next_frame - previous_frame - 1
+        missing = np.ones(len(bboxes), dtype=bool)
+        missing[known] = False
+        interpolated[missing & (gap > max_gap)] = np.nan
+    return interpolated
+
+
+class BallInterpolator:
+    """Incremental interpolate_ball_bboxes for frames that arrive in windows.
+
+    update() returns the rows that can't change any more, which is every frame up to the last
+    accepted detection before the newest one; the newest detection still needs its next
+    neighbour for the outlier test. finish() returns the rest. Concatenated, the rows equal
+    interpolate_ball_bboxes of all frames at once.
+    """
+
+    def __init__(self, max_gap=None, max_speed=None):
+        self.max_gap = max_gap
+        self.max_speed = max_speed
+        # frames from the last returned detection on; its row was returned already unless
+        # nothing has been returned yet
+        self.pending = np.zeros((0, 4))
+        self.first_row_returned = False
+
+    def update(self, bboxes):
+        self.pending = np.concatenate([self.pending, np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)])
+
+        accepted = ~np.isnan(self.pending).any(axis=1)
+        if self.max_speed is not None:
+            accepted &= ~get_ball_outliers(self.pending, self.max_speed)
+        known = np.flatnonzero(~np.isnan(self.pending).any(axis=1))
+        final = np.flatnonzero(accepted[:known[-1]]) if len(known) else []
+        if len(final) == 0 or (self.first_row_returned and final[-1] == 0):
+            return np.zeros((0, 4))
+
+        last_final = final[-1]
+        interpolated = interpolate_ball_bboxes(self.pending, self.max_gap, self.max_speed)
+        rows = interpolated[int(self.first_row_returned):last_final + 1]
+        self.pending = self.pending[last_final:]
+        self.first_row_returned = True
+        return rows
+
+    def finish(self):
+        interpolated = interpolate_ball_bboxes(self.pending, self.max_gap, self.max_speed)
+        rows = interpolated[int(self.first_row_returned):]
+        self.pending = np.zeros((0, 4))
+        self.first_row_returned = False
+        return rows
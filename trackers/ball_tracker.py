@@ -0,0 +1,99 @@
+import numpy as np
+
+
+class BallTracker:
+    """Follows the ball by detecting it in a small window around where it is expected.
+
+    The window is search_window pixels square and cropped from the full resolution frame, so the
+    ball is as large to the detector as it is in the video instead of shrunk by the downscaling of
+    the full-frame input. The window is centred on the last position plus the last velocity.
+    After lost_frames frames without a ball in the window, the full frame is searched again.
+    """
+
+    def __init__(self, detector, search_window=384, lost_frames=5):
+        self.detector = detector
+        self.search_window = search_window
+        self.lost_frames = lost_frames
+        self.ball_classes = detector.get_class_ids(("ball",))
+
+        self.last_center = None
+        self.velocity = np.zeros(2)
+        self.frames_since_seen = 0
+
+        # work done, to compare against detecting the ball on full frames
+        self.window_detections = 0
+        self.full_frame_detections = 0
+        self.pixels_processed = 0
+
+    def get_cache_params(self):
+        return {"search_window": self.search_window, "lost_frames": self.lost_frames}
+
+    def get_checkpoint_state(self):
+        return dict(last_center=self.last_center, velocity=self.velocity, frames_since_seen=self.frames_since_seen,
+                    window_detections=self.window_detections, full_frame_detections=self.full_frame_detections,
+                    pixels_processed=self.pixels_processed)
+
+    def set_checkpoint_state(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def get_best_ball_bbox(self, detection, offset=(0, 0)):
+        if len(detection.boxes) == 0:
+            return None
+        bboxes = detection.boxes.xyxy.cpu().numpy()
+        confidences = detection.boxes.conf.cpu().numpy()
+        bbox = bboxes[np.argmax(confidences)] + np.array([offset[0], offset[1], offset[0], offset[1]])
+        return bbox.tolist()
+
+    def get_search_window(self, frame):
+        # top left corner of the window around the predicted center, kept inside the frame
+        frame_height, frame_width = frame.shape[:2]
+        predicted_center = self.last_center + self.velocity * (self.frames_since_seen + 1)
+        x1 = int(np.clip(predicted_center[0] - self.search_window / 2, 0, max(0, frame_width - self.search_window)))
+        y1 = int(np.clip(predicted_center[1] - self.search_window / 2, 0, max(0, frame_height - self.search_window)))
+        return x1, y1
+
+    def update(self, bbox):
+        if bbox is None:
+            self.frames_since_seen += 1
+            return
+        center = np.array([(bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2])
+        if self.last_center is not None:
+            self.velocity = (center - self.last_center) / (self.frames_since_seen + 1)
+        self.last_center = center
+        self.frames_since_seen = 0
+
+    def is_lost(self):
+        return self.last_center is None or self.frames_since_seen >= self.lost_frames
+
+    def detect_ball(self, frame):
+        if self.is_lost():
+            self.full_frame_detections += 1
+            self.pixels_processed += frame.shape[0] * frame.shape[1]
+            detection = self.detector.predict([frame], classes=self.ball_classes)[0]
+            return self.get_best_ball_bbox(detection)
+
+        x1, y1 = self.get_search_window(frame)
+        crop = frame[y1:y1 + self.search_window, x1:x1 + self.search_window]
+        self.window_detections += 1
+        self.pixels_processed += crop.shape[0] * crop.shape[1]
+        detection = self.detector.predict([crop], imgsz=self.search_window, classes=self.ball_classes)[0]
+        return self.get_best_ball_bbox(detection, (x1, y1))
+
+    def track(self, frames, full_frame_balls=None):
+        # ball bbox or None for every frame. full_frame_balls maps frame indexes that already went
+        # through full-frame detection to the ball bbox found there (or None); those frames get a
+        # window search only when the full frame missed the ball
+        full_frame_balls = full_frame_balls or {}
+        ball_bboxes = []
+        for i, frame in enumerate(frames):
+            if i in full_frame_balls:
+                bbox = full_frame_balls[i]
+                if bbox is None and not self.is_lost():
+                    # the full frame detection can miss the small ball that the window finds
+                    bbox = self.detect_ball(frame)
+            else:
+                bbox = self.detect_ball(frame)
+            self.update(bbox)
+            ball_bboxes.append(bbox)
+        return ball_bboxes
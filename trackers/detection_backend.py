@@ -0,0 +1,139 @@
+from ultralytics import YOLO
+import os
+import shutil
+
+# classes the tracker reads from the detections; goalkeepers are relabelled as players
+TRACKED_CLASSES = ("ball", "goalkeeper", "player", "referee")
+
+BACKENDS = ("pytorch", "onnx", "openvino")
+
+
+def get_available_memory():
+    # bytes of memory available to new allocations, or None where it can't be read
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def get_auto_batch_size(imgsz, cpu_count=None, available_memory=None, maximum_batch_size=32):
+    # on the CPU a batch larger than the number of cores only adds latency, and every frame in a
+    # batch needs its letterboxed input plus the network activations, roughly 40 float copies of it
+    cpu_count = cpu_count or os.cpu_count() or 1
+    available_memory = available_memory if available_memory is not None else get_available_memory()
+    batch_size = min(cpu_count, maximum_batch_size)
+    if available_memory is not None:
+        memory_per_frame = imgsz * imgsz * 3 * 4 * 40
+        # leave half of the free memory to decoding, the tracks and the rest of the pipeline
+        batch_size = min(batch_size, int(available_memory * 0.5 // memory_per_frame))
+    return max(1, batch_size)
+
+
+def set_thread_budget(threads):
+    # CPU threads OpenCV and torch use in this process, for worker processes sharing the cores
+    import cv2
+    cv2.setNumThreads(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+# detectors by their arguments, so the videos processed one after another in a process (e.g. by
+# a batch worker) load the model once
+_shared_detectors = {}
+
+
+def get_shared_detector(model_path, **options):
+    key = (model_path, tuple(sorted(options.items())))
+    if key not in _shared_detectors:
+        _shared_detectors[key] = DetectionBackend(model_path, **options)
+    return _shared_detectors[key]
+
+
+class DetectionBackend:
+    """YOLO detector on one of several runtimes.
+
+    backend="pytorch" runs the .pt weights as before. "onnx" (ONNX Runtime) and "openvino"
+    export the weights once for the given input size and run the exported model on the CPU.
+    int8 quantizes the exported model: dynamic INT8 quantization with ONNX Runtime, or
+    post-training quantization by the OpenVINO export on the calibration_data dataset.
+    Predictions are restricted to TRACKED_CLASSES.
+    """
+
+    def __init__(self, model_path, backend="pytorch", imgsz=640, int8=False, batch_size=None,
+                 conf=0.1, calibration_data=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown detection backend: {backend}. Choose one of {', '.join(BACKENDS)}")
+        if int8 and backend == "pytorch":
+            raise ValueError("int8 needs the onnx or openvino backend")
+
+        self.model_path = model_path
+        self.backend = backend
+        self.imgsz = imgsz
+        self.int8 = int8
+        self.conf = conf
+        self.calibration_data = calibration_data
+        self.batch_size = batch_size or get_auto_batch_size(imgsz)
+
+        self.model = YOLO(self.get_runtime_model_path(), task="detect")
+        self.names = self.model.names
+        self.classes = self.get_class_ids(TRACKED_CLASSES)
+
+    def get_exported_model_path(self):
+        # one export per backend, input size and precision, next to the .pt weights
+        stem = os.path.splitext(self.model_path)[0]
+        suffix = f"_{self.imgsz}" + ("_int8" if self.int8 else "")
+        if self.backend == "onnx":
+            return f"{stem}{suffix}.onnx"
+        return f"{stem}{suffix}_openvino_model"
+
+    def get_runtime_model_path(self):
+        if self.backend == "pytorch":
+            return self.model_path
+        exported_model_path = self.get_exported_model_path()
+        if not os.path.exists(exported_model_path):
+            self.export(exported_model_path)
+        return exported_model_path
+
+    def export(self, exported_model_path):
+        model = YOLO(self.model_path)
+        if self.backend == "onnx":
+            export_path = model.export(format="onnx", imgsz=self.imgsz, dynamic=True, simplify=True)
+            if self.int8:
+                from onnxruntime.quantization import quantize_dynamic, QuantType
+                quantize_dynamic(export_path, exported_model_path, weight_type=QuantType.QUInt8)
+                os.remove(export_path)
+                return
+        else:
+            export_args = dict(format="openvino", imgsz=self.imgsz, dynamic=True, int8=self.int8)
+            if self.int8 and self.calibration_data is not None:
+                export_args["data"] = self.calibration_data
+            export_path = model.export(**export_args)
+        if os.path.isdir(exported_model_path):
+            shutil.rmtree(exported_model_path)
+        os.replace(export_path, exported_model_path)
+
+    def get_cache_params(self):
+        return {"backend": self.backend, "imgsz": self.imgsz, "int8": self.int8, "conf": self.conf}
+
+    def get_class_ids(self, class_names):
+        return [class_id for class_id, name in self.names.items() if name in class_names]
+
+    def predict(self, frames, imgsz=None, classes=None):
+        # imgsz and classes override the defaults, e.g. to run on small crops at native resolution
+        imgsz = imgsz or self.imgsz
+        classes = classes if classes is not None else self.classes
+        detections = []
+        for i in range(0, len(frames), self.batch_size):
+            detections += self.model.predict(frames[i:i+self.batch_size], conf=self.conf, imgsz=imgsz,
+                                             classes=classes, verbose=False)
+        return detections
@@ -0,0 +1,92 @@
+from scipy.optimize import linear_sum_assignment
+import numpy as np
+import sys
+sys.path.append('../')
+from utils import get_iou_matrix
+from track_store import TrackStore
+
+# object classes whose track ids come from ByteTrack; the ball always has id 1
+TRACKED_OBJECTS = ("players", "referees")
+
+
+def get_overlap_scores(previous_rows, next_rows):
+    # (previous ids, next ids, scores): scores[i, j] is the IoU of the bboxes of previous track i
+    # and next track j summed over the frames both rows cover, divided by the number of frames
+    # next track j is in, so a next track that follows a previous one all the way scores ~1
+    previous_ids = np.unique(previous_rows['track_id'])
+    next_ids = np.unique(next_rows['track_id'])
+    scores = np.zeros((len(previous_ids), len(next_ids)))
+    for frame_num in np.unique(next_rows['frame']):
+        previous_frame = previous_rows[previous_rows['frame'] == frame_num]
+        next_frame = next_rows[next_rows['frame'] == frame_num]
+        if len(previous_frame) == 0:
+            continue
+        iou = get_iou_matrix(previous_frame['bbox'], next_frame['bbox'])
+        rows = np.searchsorted(previous_ids, previous_frame['track_id'])
+        columns = np.searchsorted(next_ids, next_frame['track_id'])
+        np.add.at(scores, (rows[:, None], columns[None, :]), iou)
+    frames_per_next_id = np.array([np.count_nonzero(next_rows['track_id'] == track_id) for track_id in next_ids])
+    return previous_ids, next_ids, scores / np.maximum(frames_per_next_id, 1)
+
+
+def match_track_ids(previous_rows, next_rows, min_score=0.5):
+    # {next id: previous id} for the tracks of the same object in the overlap of two chunks,
+    # one to one with the highest total score, leaving out pairs that score below min_score
+    if len(previous_rows) == 0 or len(next_rows) == 0:
+        return {}
+    previous_ids, next_ids, scores = get_overlap_scores(previous_rows, next_rows)
+    previous_index, next_index = linear_sum_assignment(scores, maximize=True)
+    return {int(next_ids[j]): int(previous_ids[i]) for i, j in zip(previous_index, next_index)
+            if scores[i, j] >= min_score}
+
+
+def stitch_track_chunks(chunks, number_of_frames=None, min_score=0.5):
+    """Join the tracks of consecutive chunks of a video into one TrackStore.
+
+    chunks is a list of (warm_up_start, chunk_start, rows) in video order, where rows maps the
+    object names to TRACK_DTYPE rows of frames warm_up_start and on, numbered as in the whole
+    video. Each chunk contributes its frames from chunk_start on. Its tracks are matched to the
+    previous chunk's by bbox overlap in the warm-up frames both chunks tracked, and take over
+    their ids; the tracks without a match get new ids.
+    """
+    object_names = tuple(chunks[0][2].keys()) if chunks else ("players", "referees", "ball")
+    parts = {object_name: [] for object_name in object_names}
+    next_id = 1
+    previous_rows = None
+    for warm_up_start, chunk_start, rows in chunks:
+        id_map = {}
+        if previous_rows is not None:
+            for object_name in TRACKED_OBJECTS:
+                if object_name not in rows:
+                    continue
+                previous_overlap = previous_rows[object_name]
+                previous_overlap = previous_overlap[previous_overlap['frame'] >= warm_up_start]
+                next_overlap = rows[object_name]
+                next_overlap = next_overlap[next_overlap['frame'] < chunk_start]
+                for next_track_id, previous_track_id in match_track_ids(previous_overlap, next_overlap, min_score).items():
+                    # players and referees share ByteTrack's ids, the first match of an id counts
+                    id_map.setdefault(next_track_id, previous_track_id)
+
+        kept_rows = {}
+        for object_name, object_rows in rows.items():
+            object_rows = object_rows[object_rows['frame'] >= chunk_start].copy()
+            if object_name in TRACKED_OBJECTS and len(object_rows):
+                unique_ids, inverse = np.unique(object_rows['track_id'], return_inverse=True)
+                for track_id in unique_ids.tolist():
+                    if track_id not in id_map:
+                        id_map[track_id] = next_id
+                        next_id += 1
+                    next_id = max(next_id, id_map[track_id] + 1)
+                object_rows['track_id'] = np.array([id_map[track_id] for track_id in unique_ids.tolist()])[inverse]
+            kept_rows[object_name] = object_rows
+            parts[object_name].append(object_rows)
+        previous_rows = kept_rows
+
+    if number_of_frames is None:
+        number_of_frames = max((int(rows['frame'].max()) + 1 for object_parts in parts.values()
+                                for rows in object_parts if len(rows)), default=0)
+    store = TrackStore(number_of_frames, object_names)
+    for object_name, object_parts in parts.items():
+        if object_parts:
+            store.set_rows(object_name, np.concatenate(object_parts))
+    return store
@@ -1,13 +1,19 @@
-from ultralytics import YOLO
+from concurrent.futures import ProcessPoolExecutor
 import supervision as sv
+import bisect
+import multiprocessing
 import numpy as np
-import pandas as pd
 import pickle
 import cv2
 import os
 import sys
 sys.path.append('../')
-from utils import get_center_of_bbox , get_bbox_width , get_foot_position
+from utils import get_center_of_bbox , get_bbox_width , get_foot_position, get_centers_of_bboxes, get_foot_positions, get_video_properties
+from .detection_backend import get_shared_detector, set_thread_budget
+from .ball_tracker import BallTracker
+from .ball_interpolation import get_ball_bbox_array, interpolate_ball_bboxes
+from .track_stitching import stitch_track_chunks
+from track_store import TrackStore, create_rows
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -17,11 +23,82 @@ def resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
+def track_video_chunk(model_path, options, video_path, warm_up_start, chunk_end, window_size=64):
+    # runs in a worker process: track [warm_up_start, chunk_end) with a fresh Tracker and return the
+    # rows of every object class, numbered as frames of the whole video, and the end of the frames read
+    tracker = Tracker(model_path, **options)
+    track_store = TrackStore()
+    cap = cv2.VideoCapture(video_path)
+    if warm_up_start > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, warm_up_start)
+
+    frames = []
+    frame_num = warm_up_start
+    while chunk_end is None or frame_num < chunk_end:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+        frame_num += 1
+        if len(frames) == window_size:
+            tracker.update_track_store(frames, track_store)
+            frames = []
+    if frames:
+        tracker.update_track_store(frames, track_store)
+    cap.release()
+
+    rows = {}
+    for object_name, object_rows in track_store.items():
+        object_rows = object_rows.copy()
+        object_rows['frame'] += warm_up_start
+        rows[object_name] = object_rows
+    return rows, frame_num
+
 class Tracker:
-    def __init__(self, model_path):
-        model_path = resource_path(model_path)  # Use resource_path here!
-        self.model = YOLO(model_path)
+    def __init__(self, model_path, backend="pytorch", imgsz=640, int8=False, batch_size=None,
+                 keyframe_interval=1, scene_change_threshold=None, ball_search_window=None, ball_lost_frames=5):
+        # backend, imgsz, int8 and batch_size select the detection runtime, see DetectionBackend.
+        # keyframe_interval > 1 or a scene_change_threshold runs detection on keyframes only.
+        # ball_search_window follows the ball in native resolution crops of that size, see BallTracker.
+        # model_path None gives a tracker for the position and interpolation steps on existing tracks
+        self.model_path = None
+        self.detector = None
+        self.model = None
+        # to build the same tracker in worker processes
+        self.options = dict(backend=backend, imgsz=imgsz, int8=int8, batch_size=batch_size,
+                            keyframe_interval=keyframe_interval, scene_change_threshold=scene_change_threshold,
+                            ball_search_window=ball_search_window, ball_lost_frames=ball_lost_frames)
+        if model_path is not None:
+            model_path = resource_path(model_path)  # Use resource_path here!
+            self.model_path = model_path
+            self.detector = get_shared_detector(model_path, backend=backend, imgsz=imgsz, int8=int8, batch_size=batch_size)
+            self.model = self.detector.model
         self.tracker = sv.ByteTrack()
+        self.ball_tracker = None
+        # ball interpolation: longest run of missing frames that is filled, and the speed in
+        # pixels per frame above which an isolated detection is dropped as a false positive
+        self.ball_max_gap = 48
+        self.max_ball_speed = 150
+        if ball_search_window is not None and self.detector is not None:
+            self.ball_tracker = BallTracker(self.detector, ball_search_window, ball_lost_frames)
+
+        self.keyframe_interval = keyframe_interval
+        self.scene_change_threshold = scene_change_threshold
+        self.scene_thumbnail_size = (64, 36)
+        self.keyframe_thumbnail = None
+        self.previous_keyframe_tracks = None
+        self.previous_keyframe_num = None
+        self.keyframe_nums = []
+
+        # frames tracked so far and how many of them went through detection
+        self.frame_count = 0
+        self.detected_frame_count = 0
+
+        # get_track_store_parallel: frames every chunk tracks ahead of its own for the track ids
+        # to be matched with the previous chunk's, and the smallest chunk worth a process
+        self.chunk_overlap = 48
+        self.minimum_chunk_size = 480
+        self.stitch_min_iou = 0.5
 
     def add_position_to_tracks(self, tracks):
         for object, object_tracks in tracks.items():
@@ -33,30 +110,53 @@ class Tracker:
                     else:
                         position = get_foot_position(bbox)
                     tracks[object][frame_num][track_id]['position'] = position
-                        
-
-
-    def interpolate_ball_positions(self, ball_positions):
-        ball_positions = [ x.get(1,{}).get('bbox',[])for x in ball_positions]
-        df_ball_positions = pd.DataFrame(ball_positions, columns=['x', 'y', 'w', 'h'])
-
-        #interpolate missing values
-        df_ball_positions = df_ball_positions.interpolate()
-        df_ball_positions = df_ball_positions.bfill()
 
-        ball_positions = [{1:{"bbox": x}} for x in df_ball_positions.to_numpy().tolist()]
+    def add_position_to_store(self, store):
+        for object, rows in store.items():
+            if object == 'ball':
+                rows['position'] = get_centers_of_bboxes(rows['bbox'])
+            else:
+                rows['position'] = get_foot_positions(rows['bbox'])
 
-        return ball_positions
 
+    def interpolate_ball_positions(self, ball_positions):
+        ball_bboxes = self.interpolate_ball_bboxes(get_ball_bbox_array(ball_positions))
+        return [{1:{"bbox": bbox}} if not np.isnan(bbox[0]) else {} for bbox in ball_bboxes.tolist()]
+
+    def interpolate_ball_bboxes(self, ball_bboxes):
+        # (N, 4) ball bboxes with NaN rows for frames without a ball, see interpolate_ball_bboxes
+        return interpolate_ball_bboxes(ball_bboxes, self.ball_max_gap, self.max_ball_speed)
+
+    def interpolate_ball_positions_in_store(self, store):
+        # the ball rows are rebuilt from the bboxes, so this runs before add_position_to_store
+        # and the stages after it
+        ball_rows = store["ball"]
+        ball_bboxes = np.full((store.number_of_frames, 4), np.nan)
+        ball_bboxes[ball_rows['frame']] = ball_rows['bbox']
+        ball_bboxes = self.interpolate_ball_bboxes(ball_bboxes)
+
+        frame_nums = np.flatnonzero(~np.isnan(ball_bboxes[:, 0]))
+        rows = create_rows(len(frame_nums))
+        rows['frame'] = frame_nums
+        rows['track_id'] = 1
+        rows['bbox'] = ball_bboxes[frame_nums]
+        store.set_rows("ball", rows)
+
+
+    def get_cache_params(self, window_size=None):
+        # everything besides the video and the model weights that changes the tracks. the last frame
+        # of every window is a keyframe, so with keyframes the window size changes them too
+        params = dict(self.detector.get_cache_params(), tracker=type(self.tracker).__name__,
+                      keyframe_interval=self.keyframe_interval, scene_change_threshold=self.scene_change_threshold,
+                      ball_tracker=self.ball_tracker.get_cache_params() if self.ball_tracker is not None else None)
+        if self.keyframe_interval > 1 or self.scene_change_threshold is not None:
+            params['window_size'] = window_size
+        return params
 
     def detect_frames(self, frames):
-        batch_size = 20
-        detections = []
-        for i in range(0, len(frames), batch_size):
-            detections_batch = self.model.predict(frames[i:i+batch_size], conf=0.1)
-            detections += detections_batch
-
-        return detections
+        if self.detector is None:
+            raise ValueError("This Tracker was created without a model and can't detect")
+        return self.detector.predict(frames)
 
     def get_object_tracks(self, frames , read_from_stub = False , stub_path = None):
 
@@ -66,52 +166,9 @@ class Tracker:
                 with open(stub_path, 'rb') as f:
                     tracks = pickle.load(f)
                 return tracks
-        detections = self.detect_frames(frames)
-
-        tracks = {
-            "players": [],
-            "referees": [],
-            "ball": []
-        }
-
-
-        for frame_num, detection in enumerate(detections):
-            cls_names = detection.names
-            cls_names_inv = {v: k for k, v in cls_names.items()}
-
-
-            #covert detections to supervision format
-            detection_supervision = sv.Detections.from_ultralytics(detection)
-
-            #convert goalkeeper to player object
-            for object_ind , class_id in enumerate(detection_supervision.class_id):
-                if cls_names[class_id] == "goalkeeper":
-                    detection_supervision.class_id[object_ind] = cls_names_inv["player"]
-
-            #track the objects
-            detection_with_tracks = self.tracker.update_with_detections(detection_supervision)
-
-            tracks["players"].append({})
-            tracks["referees"].append({})
-            tracks["ball"].append({})
-
-            for frame_detection in detection_with_tracks:
-                bbox = frame_detection[0].tolist()
-                cls_id = frame_detection[3]
-                track_id = frame_detection[4]
-
-                if cls_id == cls_names_inv['player']:
-                    tracks["players"][frame_num][track_id] = {"bbox": bbox}
 
-                if cls_id == cls_names_inv['referee']:
-                    tracks["referees"][frame_num][track_id] = {"bbox": bbox}
-
-            for frame_detection in detection_supervision:
-                bbox = frame_detection[0].tolist()
-                cls_id = frame_detection[3]
-
-                if cls_id == cls_names_inv['ball']:
-                    tracks["ball"][frame_num][1] = {"bbox": bbox}
+        tracks = self.create_empty_tracks()
+        self.update_tracks(frames, tracks)
 
         if stub_path is not None:
             stub_path = resource_path(stub_path) #Use resource path here
@@ -120,6 +177,237 @@ class Tracker:
 
         return tracks
 
+    def get_track_store_parallel(self, video_path, num_workers=None, chunk_size=None, window_size=64):
+        # update_track_store over the whole video, with chunks of frames tracked in worker processes
+        # that decode the video themselves. ByteTrack is sequential, so every chunk starts a fresh
+        # one chunk_overlap frames early, and its track ids are stitched to the previous chunk's by
+        # bbox overlap in those frames. the ids differ from a serial run's, and a track that is lost
+        # right at a chunk boundary can come back under a new id
+        number_of_frames = get_video_properties(video_path)['frame_count']
+        num_workers = num_workers or os.cpu_count() or 1
+        if chunk_size is None:
+            chunk_size = max(self.minimum_chunk_size, -(-number_of_frames // num_workers))
+        chunk_starts = list(range(0, number_of_frames, chunk_size))
+        if not chunk_starts:
+            chunk_starts = [0]
+
+        # the workers share the cores instead of each using all of them
+        threads = max(1, (os.cpu_count() or 1) // min(num_workers, len(chunk_starts)))
+        # spawned, as this runs on a thread next to others and forking a process with threads of
+        # torch or OpenCV running can deadlock the child
+        with ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=set_thread_budget, initargs=(threads,)) as executor:
+            futures = []
+            for chunk_index, chunk_start in enumerate(chunk_starts):
+                warm_up_start = max(0, chunk_start - self.chunk_overlap)
+                # the last chunk reads to the end, in case the container's frame count is off
+                chunk_end = chunk_starts[chunk_index + 1] if chunk_index + 1 < len(chunk_starts) else None
+                futures.append((warm_up_start, chunk_start, executor.submit(
+                    track_video_chunk, self.model_path, self.options, video_path, warm_up_start, chunk_end,
+                    window_size)))
+
+            chunks = []
+            for warm_up_start, chunk_start, future in futures:
+                rows, frames_read = future.result()
+                chunks.append((warm_up_start, chunk_start, rows))
+
+        self.frame_count += frames_read
+        return stitch_track_chunks(chunks, frames_read, self.stitch_min_iou)
+
+    def create_empty_tracks(self):
+        return {
+            "players": [],
+            "referees": [],
+            "ball": []
+        }
+
+    def update_track_store(self, frames, track_store):
+        # same as update_tracks, but the window is appended to a TrackStore so the
+        # per-detection dicts only live as long as one window
+        window_tracks = self.update_tracks(frames, self.create_empty_tracks())
+        track_store.append_tracks(window_tracks)
+        return track_store
+
+    def get_checkpoint_state(self):
+        # what update_track_store carries over from one window to the next. recent supervision
+        # versions wrap ByteTrack in a deprecation decorator that can't be pickled, so its
+        # attributes are kept instead of the object
+        state = dict(byte_track=vars(self.tracker), frame_count=self.frame_count,
+                     detected_frame_count=self.detected_frame_count, keyframe_thumbnail=self.keyframe_thumbnail,
+                     previous_keyframe_tracks=self.previous_keyframe_tracks,
+                     previous_keyframe_num=self.previous_keyframe_num)
+        if self.ball_tracker is not None:
+            state['ball_tracker'] = self.ball_tracker.get_checkpoint_state()
+        return state
+
+    def set_checkpoint_state(self, state):
+        self.tracker.__dict__.update(state['byte_track'])
+        self.frame_count = state['frame_count']
+        self.detected_frame_count = state['detected_frame_count']
+        self.keyframe_thumbnail = state['keyframe_thumbnail']
+        self.previous_keyframe_tracks = state['previous_keyframe_tracks']
+        self.previous_keyframe_num = state['previous_keyframe_num']
+        if self.ball_tracker is not None:
+            self.ball_tracker.set_checkpoint_state(state['ball_tracker'])
+
+    def save_checkpoint(self, checkpoint, track_store, frames_checkpointed):
+        # append the frames of track_store from frames_checkpointed on and the tracker state to
+        # the checkpoint; returns the frames checkpointed now
+        arrays = {}
+        for object_name, rows in track_store.items():
+            arrays[f"rows_{object_name}"] = rows[np.searchsorted(rows['frame'], frames_checkpointed):]
+        # the keyframes are in order, so only the new ones are looked at
+        new_keyframes = self.keyframe_nums[bisect.bisect_left(self.keyframe_nums, frames_checkpointed):]
+        arrays["keyframe_nums"] = np.asarray(new_keyframes, dtype=np.int64)
+        checkpoint.append(len(track_store), arrays, self.get_checkpoint_state())
+        return len(track_store)
+
+    def resume_from_checkpoint(self, checkpoint):
+        # the TrackStore of the frames in the checkpoint, with this tracker in the state it had
+        # after them, so update_track_store continues with the next frame as if never stopped.
+        # an empty TrackStore without a checkpoint
+        loaded = checkpoint.load()
+        if loaded is None:
+            return TrackStore()
+        frames_done, arrays, state = loaded
+        object_names = tuple(name[len("rows_"):] for name in arrays if name.startswith("rows_"))
+        track_store = TrackStore(frames_done, object_names)
+        for object_name in object_names:
+            track_store.set_rows(object_name, arrays[f"rows_{object_name}"])
+        self.keyframe_nums = arrays["keyframe_nums"].tolist()
+        self.set_checkpoint_state(state)
+        return track_store
+
+    def update_tracks(self, frames, tracks):
+        # detect and track a window of frames, appending them after the frames already in tracks.
+        # the ByteTrack state is kept on self.tracker so consecutive windows continue the same tracks
+        frame_offset = len(tracks["players"])
+        if self.keyframe_interval > 1 or self.scene_change_threshold is not None:
+            keyframes = self.update_tracks_from_keyframes(frames, tracks)
+        else:
+            detections = self.detect_frames(frames)
+            for detection in detections:
+                self.add_detection_to_tracks(detection, tracks)
+            keyframes = range(len(frames))
+            self.frame_count += len(frames)
+            self.detected_frame_count += len(frames)
+
+        if self.ball_tracker is not None:
+            self.update_ball_tracks(frames, tracks, frame_offset, keyframes)
+        return tracks
+
+    def update_ball_tracks(self, frames, tracks, frame_offset, keyframes):
+        # the full-frame detections seed the ball tracker, which searches the other frames (and
+        # the keyframes where the full frame missed the ball) in a window around the ball
+        ball_tracks = tracks["ball"]
+        full_frame_balls = {i: ball_tracks[frame_offset + i].get(1, {}).get("bbox") for i in keyframes}
+        for i, bbox in enumerate(self.ball_tracker.track(frames, full_frame_balls)):
+            if bbox is not None:
+                ball_tracks[frame_offset + i] = {1: {"bbox": bbox}}
+
+    def add_detection_to_tracks(self, detection, tracks):
+        # track the detections of one frame and append the frame to tracks
+        frame_num = len(tracks["players"])
+        cls_names = detection.names
+        cls_names_inv = {v: k for k, v in cls_names.items()}
+
+
+        #covert detections to supervision format
+        detection_supervision = sv.Detections.from_ultralytics(detection)
+
+        #convert goalkeeper to player object
+        for object_ind , class_id in enumerate(detection_supervision.class_id):
+            if cls_names[class_id] == "goalkeeper":
+                detection_supervision.class_id[object_ind] = cls_names_inv["player"]
+
+        #track the objects
+        detection_with_tracks = self.tracker.update_with_detections(detection_supervision)
+
+        tracks["players"].append({})
+        tracks["referees"].append({})
+        tracks["ball"].append({})
+
+        for frame_detection in detection_with_tracks:
+            bbox = frame_detection[0].tolist()
+            cls_id = frame_detection[3]
+            track_id = frame_detection[4]
+
+            if cls_id == cls_names_inv['player']:
+                tracks["players"][frame_num][track_id] = {"bbox": bbox}
+
+            if cls_id == cls_names_inv['referee']:
+                tracks["referees"][frame_num][track_id] = {"bbox": bbox}
+
+        for frame_detection in detection_supervision:
+            bbox = frame_detection[0].tolist()
+            cls_id = frame_detection[3]
+
+            if cls_id == cls_names_inv['ball']:
+                tracks["ball"][frame_num][1] = {"bbox": bbox}
+
+    def get_scene_thumbnail(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, self.scene_thumbnail_size, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def get_keyframes(self, frames):
+        # every keyframe_interval-th frame of the video, frames that differ from the last keyframe by
+        # more than scene_change_threshold (mean absolute difference of small grayscale thumbnails),
+        # and the last frame of the window so the frames in between never wait for the next window
+        keyframes = []
+        for i, frame in enumerate(frames):
+            is_keyframe = (self.frame_count + i) % self.keyframe_interval == 0 or i == len(frames) - 1
+            if self.scene_change_threshold is not None:
+                thumbnail = self.get_scene_thumbnail(frame)
+                if self.keyframe_thumbnail is None or np.mean(np.abs(thumbnail - self.keyframe_thumbnail)) > self.scene_change_threshold:
+                    is_keyframe = True
+                if is_keyframe:
+                    self.keyframe_thumbnail = thumbnail
+            if is_keyframe:
+                keyframes.append(i)
+        return keyframes
+
+    def update_tracks_from_keyframes(self, frames, tracks):
+        # detect and track the keyframes only; ByteTrack sees them as consecutive frames and the
+        # frames in between get the bboxes linearly interpolated between the two keyframes.
+        # returns the indexes of the keyframes in frames
+        keyframes = self.get_keyframes(frames)
+        detections = self.detect_frames([frames[i] for i in keyframes])
+        frame_offset = len(tracks["players"])
+
+        for keyframe, detection in zip(keyframes, detections):
+            keyframe_num = frame_offset + keyframe
+            # placeholders for the frames since the previous keyframe, filled in below
+            while len(tracks["players"]) < keyframe_num:
+                for object_tracks in tracks.values():
+                    object_tracks.append({})
+            self.add_detection_to_tracks(detection, tracks)
+
+            keyframe_tracks = {object: object_tracks[keyframe_num] for object, object_tracks in tracks.items()}
+            if self.previous_keyframe_tracks is not None:
+                gap = self.frame_count + keyframe - self.previous_keyframe_num
+                for step in range(1, gap):
+                    frame_num = keyframe_num - gap + step
+                    for object, object_tracks in tracks.items():
+                        object_tracks[frame_num] = self.interpolate_frame_tracks(
+                            self.previous_keyframe_tracks[object], keyframe_tracks[object], step / gap)
+            self.previous_keyframe_tracks = keyframe_tracks
+            self.previous_keyframe_num = self.frame_count + keyframe
+            self.keyframe_nums.append(self.previous_keyframe_num)
+
+        self.frame_count += len(frames)
+        self.detected_frame_count += len(keyframes)
+        return keyframes
+
+    def interpolate_frame_tracks(self, previous_tracks, next_tracks, weight):
+        # objects present in both keyframes move linearly; the others are left out of the frame
+        frame_tracks = {}
+        for track_id, track_info in previous_tracks.items():
+            if track_id in next_tracks:
+                previous_bbox = np.asarray(track_info['bbox'])
+                next_bbox = np.asarray(next_tracks[track_id]['bbox'])
+                frame_tracks[track_id] = {"bbox": ((1 - weight) * previous_bbox + weight * next_bbox).tolist()}
+        return frame_tracks
+
     def draw_ellipse(self,frame,bbox,color,track_id=None): 
         y2 = int(bbox[3])
         x_center, _ = get_center_of_bbox(bbox)
@@ -185,35 +473,33 @@ class Tracker:
     
 
 
-    def draw_annotations(self, video_frames, tracks):
-        output_video_frames = []
-        for frame_num, frame in enumerate(video_frames):
-
-            player_dict= tracks["players"][frame_num]
-            ball_dict= tracks["ball"][frame_num]
-            referee_dict= tracks["referees"][frame_num]
-
-            #draw players
-            for track_id, player in player_dict.items():
-                color = player.get("team_color", (0,0,255))
-                frame = self.draw_ellipse(frame, player["bbox"], color, track_id)
-
-                if player.get("has_ball", False):
-                    frame = self.draw_triangle(frame, player["bbox"], (0,0,255))
+    def draw_frame_annotations(self, frame, frame_num, tracks):
+        player_dict= tracks["players"][frame_num]
+        ball_dict= tracks["ball"][frame_num]
+        referee_dict= tracks["referees"][frame_num]
 
-            #draw referee
-            for _, referee in referee_dict.items():
-                frame = self.draw_ellipse(frame, referee["bbox"], (0,255,255))
+        #draw players
+        for track_id, player in player_dict.items():
+            color = player.get("team_color", (0,0,255))
+            frame = self.draw_ellipse(frame, player["bbox"], color, track_id)
 
-            #draw ball
-            for track_id, ball in ball_dict.items():
-                frame = self.draw_triangle(frame, ball["bbox"], (0,255,0))
+            if player.get("has_ball", False):
+                frame = self.draw_triangle(frame, player["bbox"], (0,0,255))
 
-            
+        #draw referee
+        for _, referee in referee_dict.items():
+            frame = self.draw_ellipse(frame, referee["bbox"], (0,255,255))
 
+        #draw ball
+        for track_id, ball in ball_dict.items():
+            frame = self.draw_triangle(frame, ball["bbox"], (0,255,0))
 
+        return frame
 
+    def draw_annotations(self, video_frames, tracks):
+        output_video_frames = []
+        for frame_num, frame in enumerate(video_frames):
+            frame = self.draw_frame_annotations(frame, frame_num, tracks)
             output_video_frames.append(frame)
 
         return output_video_frames
-        
\ No newline at end of file
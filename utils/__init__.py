@@ -1,2 +1,5 @@
-from .video_utils import read_video, save_video
-from .bbox_utils import get_center_of_bbox, get_bbox_width, measure_distance, measure_xy_distance, get_foot_position
\ No newline at end of file
+from .video_utils import read_video, save_video, iter_video_frames, iter_video_windows, read_frame, read_frames_at, get_video_properties, create_video_writer
+from .bbox_utils import get_center_of_bbox, get_bbox_width, measure_distance, measure_xy_distance, get_foot_position, get_centers_of_bboxes, get_foot_positions, get_iou_matrix
+from .stub_utils import read_stub
+from .video_writer import VideoWriter
+from .shared_frame_ring import SharedFrameRing
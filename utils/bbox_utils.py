@@ -1,3 +1,5 @@
+import numpy as np
+
 def get_center_of_bbox(bbox):
     x1,y1,x2,y2 = bbox
     return int((x1+x2)/2),int((y1+y2)/2)
@@ -13,4 +15,26 @@ def measure_xy_distance(p1,p2):
 
 def get_foot_position(bbox):
     x1,y1,x2,y2 = bbox
-    return int((x1+x2)/2),int(y2)
\ No newline at end of file
+    return int((x1+x2)/2),int(y2)
+
+def get_centers_of_bboxes(bboxes):
+    # vectorized get_center_of_bbox for an (N, 4) array, truncating like int()
+    bboxes = np.asarray(bboxes, dtype=np.float64)
+    return np.trunc(np.stack([(bboxes[:,0]+bboxes[:,2])/2, (bboxes[:,1]+bboxes[:,3])/2], axis=1))
+
+def get_foot_positions(bboxes):
+    # vectorized get_foot_position for an (N, 4) array, truncating like int()
+    bboxes = np.asarray(bboxes, dtype=np.float64)
+    return np.trunc(np.stack([(bboxes[:,0]+bboxes[:,2])/2, bboxes[:,3]], axis=1))
+
+def get_iou_matrix(bboxes_a, bboxes_b):
+    # (N, M) intersection over union between two arrays of x1,y1,x2,y2 boxes
+    bboxes_a = np.asarray(bboxes_a, dtype=np.float64).reshape(-1, 4)
+    bboxes_b = np.asarray(bboxes_b, dtype=np.float64).reshape(-1, 4)
+    top_left = np.maximum(bboxes_a[:,None,:2], bboxes_b[None,:,:2])
+    bottom_right = np.minimum(bboxes_a[:,None,2:], bboxes_b[None,:,2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(bboxes_a[:,2:] - bboxes_a[:,:2], axis=1)
+    area_b = np.prod(bboxes_b[:,2:] - bboxes_b[:,:2], axis=1)
+    union = area_a[:,None] + area_b[None,:] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
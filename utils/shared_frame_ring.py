@@ -0,0 +1,204 @@
+import multiprocessing
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+
+
+class SharedFrameRing:
+    """Ring buffer of decoded video frames in shared memory, read by several stages at once,
+    also from other processes, without copying or pickling the frames.
+
+    decode() reads the video straight into the slots. Every stage gets read-only NumPy views
+    of the slots with get() or iter_windows() and gives each frame back with release(); a
+    slot is reused for a later frame once all `readers` stages released it. Frame n is in slot
+    n % slots, so a stage that holds a window of frames needs slots larger than the window.
+
+    The ring is passed to worker processes when they start (e.g. in a ProcessPoolExecutor's
+    initargs), where it attaches to the same memory. The creating process calls close() at
+    the end, which also frees the memory.
+
+    Every wait, also for the lock, gives up after poll_interval seconds to look whether the ring
+    was aborted, so a reader process that died without releasing its frames (or the lock) stops
+    the others as soon as someone calls abort(), e.g. from its future's done callback.
+    """
+
+    def __init__(self, frame_shape, slots=16, readers=1, dtype=np.uint8, context=None, poll_interval=0.5):
+        context = context or multiprocessing.get_context()
+        self.frame_shape = tuple(frame_shape)
+        self.slots = slots
+        self.readers = readers
+        self.poll_interval = poll_interval
+        self.dtype = np.dtype(dtype)
+        self.frame_bytes = int(np.prod(self.frame_shape)) * self.dtype.itemsize
+        self.condition = context.Condition()
+        self.shm = shared_memory.SharedMemory(create=True, size=self.get_header_bytes() + slots * self.frame_bytes)
+        self.owner = True
+        self.attach_arrays()
+        self.refcounts[:] = 0
+        self.frame_nums[:] = -1
+        # frames published, frames in the video once decoding ended (-1 before), aborted
+        self.state[:] = (0, -1, 0)
+
+    def get_header_bytes(self):
+        # refcounts, frame numbers and state, padded so the frames start 64-byte aligned
+        return -(-(self.slots * (4 + 8) + 3 * 8) // 64) * 64
+
+    def attach_arrays(self):
+        buffer = self.shm.buf
+        self.refcounts = np.ndarray((self.slots,), np.int32, buffer, 0)
+        self.frame_nums = np.ndarray((self.slots,), np.int64, buffer, self.slots * 4)
+        self.state = np.ndarray((3,), np.int64, buffer, self.slots * 12)
+        self.frames = np.ndarray((self.slots,) + self.frame_shape, self.dtype, buffer, self.get_header_bytes())
+
+    def __getstate__(self):
+        return dict(name=self.shm.name, frame_shape=self.frame_shape, slots=self.slots, readers=self.readers,
+                    dtype=self.dtype.str, frame_bytes=self.frame_bytes, condition=self.condition,
+                    poll_interval=self.poll_interval)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.dtype = np.dtype(self.dtype)
+        # worker processes share the creating process's resource tracker, so the block stays
+        # registered once and is unlinked by the creating process only
+        self.shm = shared_memory.SharedMemory(state['name'])
+        self.owner = False
+        self.attach_arrays()
+
+    def is_aborted(self):
+        return self.state[2] != 0
+
+    def lock(self):
+        # take the lock, False when the ring is aborted first; a process that died holding it
+        # would block a plain acquire forever
+        while not self.condition.acquire(timeout=self.poll_interval):
+            if self.is_aborted():
+                return False
+        return True
+
+    def wait_until(self, predicate):
+        # True once predicate() holds, False when the ring is aborted first
+        while self.lock():
+            try:
+                if self.condition.wait_for(lambda: predicate() or self.is_aborted(), self.poll_interval):
+                    return not self.is_aborted()
+            finally:
+                self.condition.release()
+        return False
+
+    def update(self, update):
+        # update() under the lock and wake up the waiting parties, skipped when the ring is aborted
+        if not self.lock():
+            return
+        try:
+            update()
+            self.condition.notify_all()
+        finally:
+            self.condition.release()
+
+    def abort(self):
+        # stop every reader and the decoder, e.g. after a stage failed. the flag is set without
+        # the lock, which may be held by a process that died; the others see it within poll_interval
+        self.state[2] = 1
+        if self.condition.acquire(timeout=self.poll_interval):
+            try:
+                self.condition.notify_all()
+            finally:
+                self.condition.release()
+
+    def acquire_slot(self, frame_num):
+        # writable view of the slot of frame_num once its previous frame is released, None when aborted
+        slot = frame_num % self.slots
+        if not self.wait_until(lambda: self.refcounts[slot] == 0):
+            return None
+        return self.frames[slot]
+
+    def publish(self, frame_num):
+        slot = frame_num % self.slots
+
+        def update():
+            self.frame_nums[slot] = frame_num
+            self.refcounts[slot] = self.readers
+            self.state[0] = frame_num + 1
+        self.update(update)
+
+    def finish(self):
+        # no frames after the ones published
+        def update():
+            self.state[1] = self.state[0]
+        self.update(update)
+
+    def decode(self, video_path, start_frame=0):
+        # decode the video from start_frame on into the ring; blocks while all slots are in use
+        cap = cv2.VideoCapture(video_path)
+        if start_frame > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        frame_num = start_frame
+        try:
+            while True:
+                slot = self.acquire_slot(frame_num)
+                if slot is None:
+                    break
+                # OpenCV decodes into the slot when the frame fits it
+                ret, frame = cap.read(slot)
+                if not ret:
+                    break
+                if frame.ctypes.data != slot.ctypes.data:
+                    raise ValueError(f"Frame {frame_num} of {video_path} is {frame.shape}, the ring holds {self.frame_shape}")
+                self.publish(frame_num)
+                frame_num += 1
+        finally:
+            cap.release()
+            self.finish()
+        return frame_num
+
+    def get(self, frame_num):
+        # read-only view of frame_num once it is decoded, None after the last frame
+        slot = frame_num % self.slots
+        if not self.wait_until(lambda: self.frame_nums[slot] == frame_num or 0 <= self.state[1] <= frame_num):
+            raise RuntimeError("The frame ring was aborted")
+        # the frame stays in its slot until this reader released it
+        if self.frame_nums[slot] != frame_num:
+            return None
+        frame = self.frames[slot]
+        frame.flags.writeable = False
+        return frame
+
+    def release(self, frame_num):
+        slot = frame_num % self.slots
+
+        def update():
+            self.refcounts[slot] -= 1
+        self.update(update)
+
+    def iter_windows(self, window_size, start_frame=0):
+        # windows of up to window_size frames like iter_video_windows, as views that are released
+        # when the next window is requested, so they must not be kept
+        frame_num = start_frame
+        while True:
+            window = []
+            while len(window) < window_size:
+                frame = self.get(frame_num + len(window))
+                if frame is None:
+                    break
+                window.append(frame)
+            if not window:
+                return
+            try:
+                yield window
+            finally:
+                for i in range(len(window)):
+                    self.release(frame_num + i)
+            frame_num += len(window)
+
+    def close(self):
+        # views of the frames must be gone before the memory can be closed
+        self.refcounts = self.frame_nums = self.state = self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
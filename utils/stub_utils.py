@@ -0,0 +1,20 @@
+import pickle
+import os
+import sys
+
+def resource_path(relative_path):
+    """ Get absolute path to resource, works for dev and for PyInstaller """
+    try:
+        base_path = sys._MEIPASS
+    except Exception:
+        base_path = os.path.abspath(".")
+    return os.path.join(base_path, relative_path)
+
+def read_stub(stub_path):
+    if stub_path is None:
+        return None
+    stub_path = resource_path(stub_path)
+    if not os.path.exists(stub_path):
+        return None
+    with open(stub_path, 'rb') as f:
+        return pickle.load(f)
@@ -12,9 +12,80 @@ def read_video(video_path):
     print(f"Video at {video_path} read successfully. Total frames: {len(frames)}")
     return frames
 
-def save_video(output_video_frames,output_video_path):
-    fourcc = cv2.VideoWriter_fourcc(*'XVID')
-    out = cv2.VideoWriter(output_video_path, fourcc, 24, (output_video_frames[0].shape[1], output_video_frames[0].shape[0]))
+def iter_video_frames(video_path, start_frame=0):
+    # decode one frame at a time instead of holding the whole video in memory
+    cap = cv2.VideoCapture(video_path)
+    if start_frame > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+    finally:
+        cap.release()
+
+def iter_video_windows(video_path, window_size, start_frame=0):
+    window = []
+    for frame in iter_video_frames(video_path, start_frame):
+        window.append(frame)
+        if len(window) == window_size:
+            yield window
+            window = []
+    if window:
+        yield window
+
+def read_frame(video_path, frame_num=0):
+    cap = cv2.VideoCapture(video_path)
+    if frame_num > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+    ret, frame = cap.read()
+    cap.release()
+    if not ret:
+        raise ValueError(f"Could not read frame {frame_num} from {video_path}")
+    return frame
+
+def read_frames_at(video_path, frame_numbers):
+    # yield (frame_num, frame) for the requested frames in increasing order, seeking only
+    # when the next requested frame is far enough ahead that decoding up to it costs more
+    max_sequential_gap = 32
+    cap = cv2.VideoCapture(video_path)
+    next_frame_num = 0
+    try:
+        for frame_num in sorted(set(frame_numbers)):
+            if frame_num - next_frame_num > max_sequential_gap or frame_num < next_frame_num:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+                next_frame_num = frame_num
+            while next_frame_num < frame_num:
+                if not cap.grab():
+                    return
+                next_frame_num += 1
+            ret, frame = cap.read()
+            if not ret:
+                return
+            next_frame_num += 1
+            yield frame_num, frame
+    finally:
+        cap.release()
+
+def get_video_properties(video_path):
+    cap = cv2.VideoCapture(video_path)
+    properties = {
+        "fps": cap.get(cv2.CAP_PROP_FPS),
+        "frame_count": int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+        "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+    }
+    cap.release()
+    return properties
+
+def create_video_writer(output_video_path, frame_size, fps=24, codec='XVID'):
+    fourcc = cv2.VideoWriter_fourcc(*codec)
+    return cv2.VideoWriter(output_video_path, fourcc, fps, frame_size)
+
+def save_video(output_video_frames,output_video_path, fps=24, codec='XVID'):
+    out = create_video_writer(output_video_path, (output_video_frames[0].shape[1], output_video_frames[0].shape[0]), fps, codec)
     for frame in output_video_frames:
         out.write(frame)
     out.release()
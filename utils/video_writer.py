@@ -0,0 +1,144 @@
+import subprocess
+import threading
+import queue
+import shutil
+import tempfile
+import time
+import cv2
+
+
+class VideoWriter:
+    """Writes frames on a background thread behind a bounded queue, so encoding overlaps with
+    whatever produces the frames.
+
+    backend="opencv" uses cv2.VideoWriter with the given fourcc codec. backend="ffmpeg" pipes raw
+    frames to a local ffmpeg binary and encodes multithreaded H.264 (write to an .mp4 path).
+    Frames are queued by reference, so they must not be modified after write().
+    """
+
+    def __init__(self, output_video_path, frame_size, fps=24, codec='XVID', backend='opencv',
+                 queue_size=32, ffmpeg_path='ffmpeg', ffmpeg_threads=0, ffmpeg_preset='veryfast', ffmpeg_crf=23):
+        self.output_video_path = output_video_path
+        self.frame_size = (int(frame_size[0]), int(frame_size[1]))
+        self.fps = fps
+        self.codec = codec
+        self.backend = backend
+        self.ffmpeg_path = ffmpeg_path
+        self.ffmpeg_threads = ffmpeg_threads
+        self.ffmpeg_preset = ffmpeg_preset
+        self.ffmpeg_crf = ffmpeg_crf
+
+        self.frames_written = 0
+        self.encode_seconds = 0.0
+        self.start_time = time.perf_counter()
+        self.end_time = None
+
+        self._error = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._open()
+        self._thread = threading.Thread(target=self._run, name="VideoWriter", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_video(cls, output_video_path, video_path, **kwargs):
+        # take fps and frame size from the source video
+        cap = cv2.VideoCapture(video_path)
+        writer = cls.from_capture(output_video_path, cap, **kwargs)
+        cap.release()
+        return writer
+
+    @classmethod
+    def from_capture(cls, output_video_path, cap, **kwargs):
+        fps = cap.get(cv2.CAP_PROP_FPS) or 24
+        frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        return cls(output_video_path, frame_size, fps=fps, **kwargs)
+
+    def _open(self):
+        if self.backend == 'opencv':
+            fourcc = cv2.VideoWriter_fourcc(*self.codec)
+            self._writer = cv2.VideoWriter(self.output_video_path, fourcc, self.fps, self.frame_size)
+            if not self._writer.isOpened():
+                raise RuntimeError(f"Could not open {self.output_video_path} for writing with codec {self.codec}")
+        elif self.backend == 'ffmpeg':
+            ffmpeg_path = shutil.which(self.ffmpeg_path)
+            if ffmpeg_path is None:
+                raise RuntimeError(f"ffmpeg backend selected but '{self.ffmpeg_path}' was not found")
+            command = [
+                ffmpeg_path, '-y', '-loglevel', 'error',
+                '-f', 'rawvideo', '-pix_fmt', 'bgr24',
+                '-s', f'{self.frame_size[0]}x{self.frame_size[1]}', '-r', f'{self.fps}',
+                '-i', '-',
+                '-an', '-c:v', 'libx264', '-preset', self.ffmpeg_preset, '-crf', str(self.ffmpeg_crf),
+                '-pix_fmt', 'yuv420p', '-threads', str(self.ffmpeg_threads),
+                '-movflags', '+faststart',
+                self.output_video_path,
+            ]
+            # ffmpeg's messages go to a file, a pipe nobody reads while encoding would fill up and block it
+            self._stderr = tempfile.TemporaryFile()
+            self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=self._stderr)
+        else:
+            raise ValueError(f"Unknown video writer backend: {self.backend}")
+
+    def _run(self):
+        while True:
+            frame = self._queue.get()
+            if frame is None:
+                break
+            if self._error is not None:
+                continue
+            try:
+                start = time.perf_counter()
+                if self.backend == 'opencv':
+                    self._writer.write(frame)
+                else:
+                    self._process.stdin.write(memoryview(frame.data if frame.flags['C_CONTIGUOUS'] else frame.copy().data))
+                self.encode_seconds += time.perf_counter() - start
+                self.frames_written += 1
+            except Exception as e:
+                self._error = e
+
+    def write(self, frame):
+        if self._error is not None:
+            raise RuntimeError(f"Video writer failed: {self._error}") from self._error
+        if frame.shape[1] != self.frame_size[0] or frame.shape[0] != self.frame_size[1]:
+            frame = cv2.resize(frame, self.frame_size)
+        self._queue.put(frame)
+
+    def close(self):
+        if self.end_time is not None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        start = time.perf_counter()
+        if self.backend == 'opencv':
+            self._writer.release()
+        else:
+            self._process.communicate()
+            if self._process.returncode != 0 and self._error is None:
+                self._stderr.seek(0)
+                self._error = RuntimeError(self._stderr.read().decode(errors='replace').strip())
+            self._stderr.close()
+        self.encode_seconds += time.perf_counter() - start
+        self.end_time = time.perf_counter()
+        if self._error is not None:
+            raise RuntimeError(f"Video writer failed: {self._error}") from self._error
+
+    def release(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def get_stats(self):
+        # encode throughput: frames per second of encoder time, and of wall time since opening
+        wall_seconds = (self.end_time or time.perf_counter()) - self.start_time
+        return {
+            "frames": self.frames_written,
+            "encode_seconds": self.encode_seconds,
+            "encode_fps": self.frames_written / self.encode_seconds if self.encode_seconds else 0.0,
+            "wall_seconds": wall_seconds,
+            "wall_fps": self.frames_written / wall_seconds if wall_seconds else 0.0,
+        }
@@ -4,6 +4,9 @@ class ViewTransformer():
     def __init__(self):
         court_width = 68
         court_length = 23.32
+        # the extent of the transformed positions in meters, x along the length and y across
+        self.court_width = court_width
+        self.court_length = court_length
 
         self.pixel_verticies = np.array([
             [110, 1035],
@@ -22,26 +25,72 @@ class ViewTransformer():
         self.target_verticies = self.target_verticies.astype(np.float32)
 
         self.perspective_transformer = cv2.getPerspectiveTransform(self.pixel_verticies, self.target_verticies)
+
+        # points outside the pixel polygon have no meaningful pitch position
+        self.filter_outside_pitch = True
+        # number of points handed to cv2.perspectiveTransform per call
+        self.chunk_size = 1_000_000
+
+    def is_inside_pitch(self, points):
+        # vectorized cv2.pointPolygonTest(...) >= 0 for the (convex) pixel polygon:
+        # a point is inside when it lies on the same side of every edge
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        verticies = self.pixel_verticies.astype(np.float64)
+        edges = np.roll(verticies, -1, axis=0) - verticies
+        relative = points[:, None, :] - verticies[None, :, :]
+        cross = edges[None, :, 0] * relative[:, :, 1] - edges[None, :, 1] * relative[:, :, 0]
+        return np.all(cross >= 0, axis=1) | np.all(cross <= 0, axis=1)
+
+    def transform_points(self, points):
+        # transform an (N, 2) array of pixel points in chunks; rows outside the pitch become NaN
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+        transformed = np.empty_like(points)
+        for start in range(0, len(points), self.chunk_size):
+            chunk = points[start:start + self.chunk_size]
+            transformed[start:start + len(chunk)] = cv2.perspectiveTransform(chunk.reshape(-1, 1, 2), self.perspective_transformer).reshape(-1, 2)
+
+        if self.filter_outside_pitch:
+            transformed[~self.is_inside_pitch(points)] = np.nan
+
+        return transformed
+
     def transform_point(self, point):
-        p = (int(point[0]), int(point[1]))
-        # is_inside = cv2.pointPolygonTest(self.pixel_verticies, p, False) >= 0
-        # if not is_inside:
-        #     return None
-        
-        reshaped_point = point.reshape(-1, 1, 2).astype(np.float32)
-        transform_point = cv2.perspectiveTransform(reshaped_point, self.perspective_transformer)
+        transform_point = self.transform_points(point)
+        if np.isnan(transform_point).any():
+            return None
 
         return transform_point.reshape(-1, 2)
 
 
     def add_transformed_position_to_tracks(self, tracks):
+        # gather every adjusted position first so the whole video is transformed in one batch
+        positions = []
         for object, object_tracks in tracks.items():
             for frame_num, track in enumerate(object_tracks):
                 for track_id, track_info in track.items():
-                    position = track_info['position_adjusted']
-                    position = np.array(position)
-                    position_transformed = self.transform_point(position)
-                    if position_transformed is not None:
-                        position_transformed = position_transformed.squeeze().tolist()
+                    positions.append(track_info['position_adjusted'])
+
+        positions_transformed = self.transform_points(np.array(positions, dtype=np.float32))
+
+        index = 0
+        for object, object_tracks in tracks.items():
+            for frame_num, track in enumerate(object_tracks):
+                for track_id, track_info in track.items():
+                    position_transformed = positions_transformed[index]
+                    if np.isnan(position_transformed).any():
+                        position_transformed = None
+                    else:
+                        position_transformed = position_transformed.tolist()
                     tracks[object][frame_num][track_id]['position_transformed'] = position_transformed
+                    index += 1
+
+    def add_transformed_position_to_store(self, store):
+        objects = list(store.keys())
+        positions = np.concatenate([store[object]['position_adjusted'] for object in objects])
+        positions_transformed = self.transform_points(positions)
 
+        start = 0
+        for object in objects:
+            end = start + len(store[object])
+            store[object]['position_transformed'] = positions_transformed[start:end]
+            start = end